@@ -0,0 +1,36 @@
+'''Micro-benchmarks of chunk extraction: Code_chunk (one chunk per section)
+against Code_block_chunk.from_section (one chunk per fenced block) on sections
+with a growing number of code blocks.
+
+usage: python -m benchmarks.chunk_benchmark [--number N]
+'''
+
+import argparse
+import timeit
+
+import memit.markdown_parser.Chunk as ch
+
+
+def section(blocks):
+    return ''.join('Prompt for block %d\n\n```python\nx = f(%d)\nprint(x)\n'
+                   '```\n\n' % (idx, idx) for idx in range(blocks))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', '-n', type=int, default=10000,
+                        help='extractions per measurement')
+    args = parser.parse_args()
+
+    for blocks in [0, 1, 5, 20, 100]:
+        string = section(blocks)
+        single = min(timeit.repeat(lambda: ch.Code_chunk(string, 't'),
+                                   number=args.number, repeat=3))
+        split = min(timeit.repeat(
+            lambda: ch.Code_block_chunk.from_section(string, 't'),
+            number=args.number, repeat=3))
+        print('{:>4} blocks  Code_chunk {:8.2f} us  Code_block_chunk '
+              '{:8.2f} us  ({:.2f} us per block)'.format(
+                  blocks, single / args.number * 1e6,
+                  split / args.number * 1e6,
+                  split / args.number * 1e6 / max(blocks, 1)))
@@ -0,0 +1,122 @@
+'''Generator of synthetic markdown corpora for the tests and benchmarks. A
+corpus is a directory tree of markdown files; every file is a sequence of
+heading subtrees with a given depth and fan-out, until the file reaches its
+size.
+
+usage: python -m benchmarks.corpus PATH [--files N] [--depth D]
+           [--fanout F] [--code-density P] [--file-size BYTES] [--seed S]
+'''
+
+import argparse
+import os
+import random
+
+
+WORDS = ['select', 'filter', 'group', 'join', 'sort', 'map', 'reduce',
+         'parse', 'format', 'read', 'write', 'merge', 'split', 'index',
+         'query', 'table', 'frame', 'list', 'dict', 'string']
+SYNTAXES = ['python', 'r', 'sql', 'bash', None]
+
+
+class Corpus_config():
+    '''shape of a corpus:
+      - files: number of markdown files
+      - depth: deepest heading level in a file (1 to 6)
+      - fanout: number of subsections of every section above depth
+      - code_density: probability that a section has a code block
+      - file_size: approximate size of a file in bytes
+      - files_per_dir: files per directory, directories are nested two deep
+      - seed: seed of the random generator
+    '''
+
+    def __init__(self, files=50, depth=3, fanout=3, code_density=0.7,
+                 file_size=20000, files_per_dir=10, seed=0):
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.code_density = code_density
+        self.file_size = file_size
+        self.files_per_dir = files_per_dir
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _words(rand, count):
+    return ' '.join(rand.choice(WORDS) for _ in range(count))
+
+
+def _body(rand, config):
+    parts = ['How do you %s?\n\n' % _words(rand, rand.randint(3, 8))]
+    if rand.random() < config.code_density:
+        syntax = rand.choice(SYNTAXES)
+        lines = ''.join('%s(%s)\n' % (rand.choice(WORDS),
+                                      _words(rand, 2).replace(' ', ', '))
+                        for _ in range(rand.randint(1, 6)))
+        parts.append('```%s\n%s```\n\n' % (syntax or '', lines))
+    return ''.join(parts)
+
+
+def generate_document(rand, config):
+    '''a markdown string of about config.file_size bytes'''
+    parts = []
+    size = 0
+    while size < config.file_size:
+        # one top level subtree, depth-first
+        stack = [1]
+        while stack and size < config.file_size:
+            level = stack.pop()
+            text = '#' * level + ' ' + _words(rand, 2) + '\n' + \
+                _body(rand, config)
+            parts.append(text)
+            size += len(text)
+            if level < config.depth:
+                stack.extend([level + 1] * config.fanout)
+    return ''.join(parts)
+
+
+def generate_corpus(path, config):
+    '''writes the corpus to path, returns the list of file paths'''
+    rand = random.Random(config.seed)
+    paths = []
+    for idx in range(config.files):
+        group = idx // config.files_per_dir
+        directory = os.path.join(path, 'topic%02d' % (group // 10),
+                                 'sub%02d' % (group % 10))
+        os.makedirs(directory, exist_ok=True)
+        filepath = os.path.join(directory, 'notes%04d.md' % idx)
+        with open(filepath, 'w') as file:
+            file.write(generate_document(rand, config))
+        paths.append(filepath)
+    return paths
+
+
+def add_arguments(parser):
+    '''adds the Corpus_config options to an ArgumentParser'''
+    defaults = Corpus_config()
+    parser.add_argument('--files', type=int, default=defaults.files)
+    parser.add_argument('--depth', type=int, default=defaults.depth)
+    parser.add_argument('--fanout', type=int, default=defaults.fanout)
+    parser.add_argument('--code-density', type=float,
+                        default=defaults.code_density)
+    parser.add_argument('--file-size', type=int, default=defaults.file_size,
+                        help='approximate bytes per file')
+    parser.add_argument('--files-per-dir', type=int,
+                        default=defaults.files_per_dir)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def config_from_args(args):
+    return Corpus_config(args.files, args.depth, args.fanout,
+                         args.code_density, args.file_size,
+                         args.files_per_dir, args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='directory to write the corpus to')
+    add_arguments(parser)
+    args = parser.parse_args()
+    paths = generate_corpus(args.path, config_from_args(args))
+    print('{} files written to {}'.format(len(paths), args.path))
@@ -0,0 +1,92 @@
+'''Reports the memory held per node by Section and Compact_section trees,
+with and without their code chunks, measured with tracemalloc. The file
+string is counted too, since compact trees keep it alive as their buffer.
+Mapped trees read the document from a temporary file through mmap, the
+mapped pages are not Python allocations and are not counted.
+
+usage: python -m benchmarks.memory_benchmark [--size SECTIONS]
+'''
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.compact import Compact_section
+
+
+TITLES = ['usage', 'example', 'arguments', 'return value', 'see also',
+          'select', 'filter', 'group by', 'join', 'sort']
+
+
+def notes_document(sections):
+    '''a cheat-sheet like document: titles repeat, most sections have a
+    prompt and a code block
+    '''
+    parts = []
+    for idx in range(sections):
+        level = idx % 3 + 1
+        parts.append('#' * level + ' ' + TITLES[idx % len(TITLES)] + '\n')
+        parts.append('How do you do thing number %d?\n\n' % idx)
+        parts.append('```python\nresult = thing(%d, key="value")\n```\n\n'
+                     % idx)
+    return ''.join(parts)
+
+
+def build(kind, md_string, with_chunks):
+    if kind == 'mapped':
+        tree = Compact_section.from_file(md_string, mapped=True)
+    elif kind == 'compact':
+        tree = Compact_section.from_string(md_string, 'bench')
+    else:
+        tree = Section.from_string(md_string, 'bench')
+    chunks = None
+    if with_chunks:
+        if kind != 'section':
+            chunks = [node.make_chunk('code') for node in tree.get_all_nodes()]
+        else:
+            chunks = [ch.Code_chunk(node.get_content(), node.get_title())
+                      for node in tree.get_all_nodes()]
+    return tree, chunks
+
+
+def measure(kind, size, with_chunks):
+    if kind == 'mapped':
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.md')
+            with open(path, 'w') as file:
+                file.write(notes_document(size))
+            return _measure(kind, path, with_chunks)
+    return _measure(kind, size, with_chunks)
+
+
+def _measure(kind, source, with_chunks):
+    '''source is the number of sections, or the file path for mapped'''
+    gc.collect()
+    tracemalloc.start()
+    # make the string inside the measurement, like reading a file would
+    md_string = source if kind == 'mapped' else notes_document(source)
+    result = build(kind, md_string, with_chunks)
+    del md_string
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = len(result[0].get_all_nodes())
+    return current, nodes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', '-s', type=int, default=20000,
+                        help='number of sections in the document')
+    args = parser.parse_args()
+
+    for with_chunks in [False, True]:
+        for kind in ['section', 'compact', 'mapped']:
+            current, nodes = measure(kind, args.size, with_chunks)
+            print('{:<8} {:<14} {:>7} nodes {:>10.1f} KB {:>7.0f} bytes/node'
+                  .format(kind, 'tree + chunks' if with_chunks else 'tree',
+                          nodes, current / 1024, current / nodes))
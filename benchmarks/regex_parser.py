@@ -0,0 +1,76 @@
+'''The recursive regex splitting that Section used before the tokenizer.
+It builds the same trees as Section.from_string() but is much slower on big
+files, the tests compare both and benchmarks/tokenizer_benchmark.py times
+them.
+'''
+
+import re
+
+from memit.markdown_parser.Section import Section
+
+
+def from_string_recursive(md_string, title, level=1):
+    '''creates a Section from a markdown string by recursive regex
+    splitting
+    '''
+    content, rest = _split_content(md_string)
+    children = _get_children(rest, level + 1)
+    return Section(title, content, children, level)
+
+
+def _from_markdown_header(md_string, level):
+    '''creates a Section from a markdown string that starts with a header
+    '''
+    title, rest = _split_title(md_string)
+    content, rest = _split_content(rest)
+    children = _get_children(rest, level + 1)
+    return Section(title, content, children, level)
+
+
+def _get_children(md_string, level):
+    if not md_string:
+        return None
+    return [_from_markdown_header(subsection, level)
+            for subsection in _split_sections(md_string)]
+
+
+def _split_content(md_string):
+    '''splits a markdown section string into the content below its heading
+    and the other headings. Leading and trailing whitespace is removed from
+    the content, leading whitespace from the rest.
+    '''
+    has_headings = re.search('^#+|\\n#+', md_string)
+    if has_headings:
+        content = md_string[:has_headings.start()]
+        rest = md_string[has_headings.start():].lstrip()
+    else:
+        content = md_string
+        rest = None
+    return content.strip(), rest
+
+
+def _split_sections(md_string):
+    '''splits a markdown string into sections of headings of the highest
+    level found. The newlines between sections are stripped.
+    '''
+    hashtags = '#{' + str(_find_highest_h(md_string)) + '}[^#]*?\\n'
+    regexpr = '|'.join(['\\n' + hashtags, '^' + hashtags])
+
+    headings = re.findall(regexpr, md_string)
+    content = re.split(regexpr, md_string)[1:]
+    return [re.sub('^\\n', '', h) + c for h, c in zip(headings, content)]
+
+
+def _split_title(md_string):
+    if not re.match('#', md_string):
+        raise ValueError('Error: input string should start '
+                         'with a "#" heading!')
+    split = md_string.split('\n', 1)
+    return re.sub('#+ *', '', split[0]), split[1]
+
+
+def _find_highest_h(md_string):
+    '''level of the highest heading in the markdown string'''
+    headings = re.findall(pattern='\n#+.*\n|^#+.*\n|^#+.*$',
+                          string=md_string)
+    return min(len(re.search('#+', h).group()) for h in headings)
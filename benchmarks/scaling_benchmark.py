@@ -0,0 +1,93 @@
+'''Worst cases of the parser and the chunk extraction. Every document is a
+pathological line repeated n times and is parsed at doubling sizes. For a
+linear scan the time grows by about 2x per doubling, a quadratic one by 4x.
+The mean growth per doubling is printed, the run fails if it is above
+--max-growth.
+
+usage: python -m benchmarks.scaling_benchmark [--size N] [--doublings K]
+'''
+
+import argparse
+import sys
+import timeit
+
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser import tokenizer
+from memit.markdown_parser.Section import Section
+
+
+# name -> line that is repeated
+DOCUMENTS = {
+    # opening fences that are never closed, not at the start of a line
+    'unclosed fences': 'text```python\n',
+    # "`" is a syntax name character of the fence regexes
+    'backticks': '``````````',
+    # fence lines without code, every other block is open
+    'fence lines': '```\n# comment\n',
+    'headings': '# a\n## b # c\n',
+    'unanswered questions': '> Q: what?\n',
+    'unclosed deletions': '{{ x\n',
+}
+
+ALL_TYPES = 'code_blocks,definitions,qa,cloze'
+
+# name -> function of the document
+PARSERS = {
+    'tokenize fences': lambda string: tokenizer.tokenize(string, True),
+    'Code_chunk': lambda string: ch.Code_chunk(string, 'bench'),
+    'Section': lambda string: Section.from_string(string, 'bench'),
+    'Section fences': lambda string: Section.from_string(string, 'bench',
+                                                         fences=True),
+    'code': lambda string: ch.chunk_factory(string, 'bench', 'code'),
+    'code_blocks': lambda string: ch.chunk_factory(string, 'bench',
+                                                   'code_blocks'),
+    ALL_TYPES: lambda string: ch.chunk_factory(string, 'bench', ALL_TYPES),
+    # the deletions of a cloze are searched inside a code block
+    'cloze': lambda string: ch.chunk_factory('```\n' + string + '\n```',
+                                             'bench', 'cloze'),
+}
+
+
+def document(line, size):
+    '''the line repeated until the document has about size characters'''
+    return line * max(1, size // len(line))
+
+
+def measure(function, line, size, doublings, repeat=3):
+    '''list of (size, seconds) for every doubling of size'''
+    times = []
+    for step in range(doublings + 1):
+        string = document(line, size << step)
+        seconds = min(timeit.repeat(lambda: function(string), number=1,
+                                    repeat=repeat))
+        times.append((len(string), seconds))
+    return times
+
+
+def growth(times):
+    '''mean factor the time grows by per doubling of the size'''
+    (_, first), (_, last) = times[0], times[-1]
+    return (last / max(first, 1e-6)) ** (1 / (len(times) - 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', '-s', type=int, default=200000,
+                        help='characters of the smallest document')
+    parser.add_argument('--doublings', '-d', type=int, default=3)
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                        help='fail if the time grows by more per doubling')
+    args = parser.parse_args()
+
+    worst = 0
+    for doc_name, line in DOCUMENTS.items():
+        for parser_name, function in PARSERS.items():
+            times = measure(function, line, args.size, args.doublings)
+            factor = growth(times)
+            worst = max(worst, factor)
+            print('{:<22} {:<34} {:8.4f}s at {:>5.1f} MB  growth {:4.2f}x'
+                  .format(doc_name, parser_name, times[-1][1],
+                          times[-1][0] / 2 ** 20, factor))
+    print('worst growth per doubling: {:.2f}x'.format(worst))
+    if worst > args.max_growth:
+        sys.exit(1)
@@ -0,0 +1,193 @@
+'''End to end benchmark suite on a synthetic corpus (see benchmarks/corpus.py):
+parsing files and directories with Section and the legacy markdown_parsing,
+building a Chunk_tree, the exporters, and building and opening a binary
+deck. The results are written as JSON, and a previous result file can be
+given to compare against.
+
+--profile runs every benchmark once more under cProfile and prints the
+functions with the most cumulative time, --trace-memory does the same with
+tracemalloc and prints the lines that allocated the most memory.
+
+usage: python -m benchmarks.suite [--output results.json]
+           [--compare old.json] [--profile] [--trace-memory] [corpus options]
+'''
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from benchmarks import corpus
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser import deck, export, markdown_parsing
+from memit.topic_choice import Chunk_tree
+
+
+def benchmarks(path, files, workers):
+    '''returns a list of (name, function) to measure on the corpus in path,
+    files is the list of its markdown files
+    '''
+    largest = max(files, key=os.path.getsize)
+    tree = Section.from_dir(path)
+    # not a markdown file, so the other benchmarks do not see it
+    deck_path = os.path.join(path, 'corpus.deck')
+    deck.build_deck(tree, deck_path)
+
+    def chunks():
+        return export.iter_chunks(export.iter_sections(path))
+
+    def open_deck():
+        deck_file = deck.Deck_file(deck_path)
+        tree = Chunk_tree.from_node(deck_file.root(), 'code', lazy=True)
+        list(tree.get_children())
+        deck_file.close()
+
+    return [
+        ('from_file', lambda: Section.from_file(largest)),
+        ('from_file compact',
+         lambda: Section.from_file(largest, node_type='compact')),
+        ('markdown_parsing', lambda: markdown_parsing.parse_markdown(largest)),
+        ('from_dir', lambda: Section.from_dir(path)),
+        ('from_dir %d workers' % workers,
+         lambda: Section.from_dir(path, workers=workers)),
+        ('from_dir compact', lambda: Section.from_dir(path,
+                                                      node_type='compact')),
+        ('Chunk_tree.from_node',
+         lambda: Chunk_tree.from_node(tree, 'code')),
+        ('Chunk_tree.from_node code_blocks',
+         lambda: Chunk_tree.from_node(tree, 'code_blocks')),
+        ('export jsonl', lambda: export.write_jsonl(chunks(), io.StringIO())),
+        ('export anki', lambda: export.write_anki(chunks(), io.StringIO())),
+        ('write_graph', lambda: tree.write_graph(io.StringIO())),
+        ('build_deck', lambda: deck.build_deck(tree, deck_path)),
+        ('open deck', open_deck),
+    ]
+
+
+def measure(function, repeat):
+    '''returns the min and mean time of a call in seconds'''
+    times = timeit.repeat(function, number=1, repeat=repeat)
+    return {'min': min(times), 'mean': sum(times) / len(times)}
+
+
+def profile(function, top):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    function()
+    profiler.disable()
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(top)
+    return stream.getvalue()
+
+
+def trace_memory(function, top):
+    '''returns the peak in bytes and the top allocation sites of a call'''
+    tracemalloc.start()
+    try:
+        result = function()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # keep the result alive until the snapshot is taken
+    del result
+    sites = ['{}  {:.1f} KiB in {} blocks'.format(
+        stat.traceback, stat.size / 1024, stat.count)
+        for stat in snapshot.statistics('lineno')[:top]]
+    return peak, sites
+
+
+def compare(results, old):
+    '''lines with the ratio of every min time to the one in old results'''
+    lines = []
+    for name, timing in results['timings'].items():
+        previous = old['timings'].get(name)
+        if previous is None:
+            continue
+        lines.append('{:<36} {:9.2f} ms -> {:9.2f} ms  x{:.2f}'.format(
+            name, previous['min'] * 1e3, timing['min'] * 1e3,
+            timing['min'] / previous['min']))
+    return lines
+
+
+def run(config, repeat=5, workers=4, names=None, profile_top=0,
+        memory_top=0, out=sys.stdout):
+    '''generates the corpus in a temporary directory, runs the benchmarks
+    and returns the results as a dict
+    '''
+    results = {
+        'corpus': config.to_dict(),
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        },
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'timings': {},
+        'memory_peak': {}
+    }
+    with tempfile.TemporaryDirectory() as path:
+        files = corpus.generate_corpus(path, config)
+        results['corpus']['bytes'] = sum(os.path.getsize(filepath)
+                                         for filepath in files)
+        for name, function in benchmarks(path, files, workers):
+            if names and not any(part in name for part in names):
+                continue
+            timing = measure(function, repeat)
+            results['timings'][name] = timing
+            print('{:<36} {:9.2f} ms  (mean {:.2f} ms)'.format(
+                name, timing['min'] * 1e3, timing['mean'] * 1e3), file=out)
+            if profile_top:
+                print(profile(function, profile_top), file=out)
+            if memory_top:
+                peak, sites = trace_memory(function, memory_top)
+                results['memory_peak'][name] = peak
+                print('  peak {:.1f} KiB'.format(peak / 1024), file=out)
+                for site in sites:
+                    print('  ' + site, file=out)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', '-o', default=None,
+                        help='JSON file to write the results to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of a previous run')
+    parser.add_argument('--repeat', '-r', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='workers of the parallel from_dir benchmark')
+    parser.add_argument('--only', nargs='*', default=None,
+                        help='run the benchmarks with one of these in the '
+                             'name')
+    parser.add_argument('--profile', type=int, nargs='?', const=15,
+                        default=0, metavar='TOP',
+                        help='print the TOP functions by cumulative time')
+    parser.add_argument('--trace-memory', type=int, nargs='?', const=10,
+                        default=0, metavar='TOP',
+                        help='print the TOP allocation sites')
+    corpus.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(corpus.config_from_args(args), args.repeat, args.workers,
+                  args.only, args.profile, args.trace_memory)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+        print('\ncompared to {}:'.format(args.compare))
+        for line in compare(results, old):
+            print(line)
@@ -0,0 +1,54 @@
+'''Compares the single pass tokenizer (Section.from_string) with the recursive
+regex splitting (benchmarks/regex_parser.py) on synthetic documents.
+
+usage: python -m benchmarks.tokenizer_benchmark [--size SECTIONS] [--repeat N]
+'''
+
+import argparse
+import timeit
+
+from memit.markdown_parser.Section import Section
+from benchmarks import regex_parser
+
+
+BODY = ('Some explanation of the snippet below.\n\n'
+        '```python\nx = compute(y)\nprint(x)\n```\n\n')
+
+
+def deep_document(sections):
+    '''headings go down to level 6 and back up, over and over
+    '''
+    levels = list(range(1, 7)) + list(range(5, 1, -1))
+    return ''.join('#' * levels[idx % len(levels)] + ' heading %d\n' % idx +
+                   BODY for idx in range(sections))
+
+
+def wide_document(sections):
+    '''one top heading with all other headings as its children
+    '''
+    return '# top\n' + BODY + ''.join('## heading %d\n' % idx + BODY
+                                      for idx in range(sections))
+
+
+def run(md_string, repeat):
+    new = min(timeit.repeat(lambda: Section.from_string(md_string, 'bench'),
+                            number=1, repeat=repeat))
+    old = min(timeit.repeat(
+        lambda: regex_parser.from_string_recursive(md_string, 'bench'),
+        number=1, repeat=repeat))
+    return new, old
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', '-s', type=int, default=5000,
+                        help='number of sections per document')
+    parser.add_argument('--repeat', '-r', type=int, default=3)
+    args = parser.parse_args()
+
+    for name, generator in [('deep', deep_document), ('wide', wide_document)]:
+        md_string = generator(args.size)
+        new, old = run(md_string, args.repeat)
+        print('{:<5} {:>8.1f} KB  tokenizer {:8.4f}s  recursive {:8.4f}s  '
+              'speedup {:6.1f}x'.format(name, len(md_string) / 1024,
+                                        new, old, old / new))
@@ -1,11 +1,23 @@
 import npyscreen as nps
 import argparse
-import random
+import time
 import memit.topic_choice as tc
+import memit.markdown_parser.Chunk as ch
 from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.markdown_parser.search import Search_index
+from memit.markdown_parser import deck, dedup, metrics, watcher
+from memit import scheduler as sched
+from memit import highlighting
+from memit import loader
+from memit import sampling
+from memit import server as deck_server
 
 
-def form_factory(title, text, callback):
+def form_factory(title, text, callback, on_display=None):
+    '''form showing text in a Highlighted_pager, call set_lines() on
+    form.pager to change it
+    '''
     # form = MuttPager()
     # form.wStatus1.value = title
     # form.wStatus2.value = 'parko'
@@ -15,8 +27,10 @@ def form_factory(title, text, callback):
     #     '^N': callback
     # })
 
-    form = CustomForm(next_callback=callback, name=title)
-    form.add_widget(nps.Pager, values=text, autowrap=True)
+    form = CustomForm(next_callback=callback, on_display=on_display,
+                      name=title)
+    form.pager = form.add_widget(highlighting.Highlighted_pager, values=text,
+                                 autowrap=True)
     form.add_handlers({
         '^N': callback
     })
@@ -53,9 +67,15 @@ class CustomForm(nps.ActionFormV2WithMenus):
                          0 - OFFSET_2[1] - len(text),
                          None)
 
-    def __init__(self, next_callback, *args, **keywords):
+    def __init__(self, next_callback, *args, on_display=None, **keywords):
         super(CustomForm, self).__init__(*args, **keywords)
         self._on_next = next_callback
+        self._on_display = on_display
+
+    def display(self, *args, **keywords):
+        super(CustomForm, self).display(*args, **keywords)
+        if self._on_display is not None:
+            self._on_display()
 
     def _on_help(self):
         pass
@@ -75,29 +95,297 @@ class App(nps.NPSAppManaged):
                  filepath=None,
                  nr_chunks=20,
                  chunk_type='code',
+                 workers=1,
+                 cache=None,
+                 watch=False,
+                 watch_interval=1.0,
+                 lazy=False,
+                 node_type='section',
+                 fences=False,
+                 query=None,
+                 scheduler=None,
+                 highlight=True,
+                 weights=None,
+                 seed=None,
+                 background=False,
+                 server=None,
+                 deck_file=None,
                  **kwargs):
+        '''with a query, the session is made of the chunks of the sections
+        matching it and the topic choice is skipped. With a Scheduler, the
+        session has the due cards first and then new ones, and the answers
+        are graded.
+
+        nr_chunks cards (new cards with a Scheduler) are sampled from the
+        selection, weights is a dict heading path tuple -> weight (see
+        sampling.py) and seed makes the sample reproducible.
+
+        With background, the topic choice is shown right away and the files
+        of dirpath are parsed by a Background_loader.
+
+        With fences, "#" lines in fenced code blocks do not start sections.
+
+        Copies of a chunk share one object from a dedup.Chunk_pool and a
+        session never shows the same card twice.
+
+        With server, the path of the socket of a deck server (see
+        server.py), the notes are not parsed: the topic tree and the cards
+        come from the server.
+
+        A deck_file made by "deck.py build-deck" replaces dirpath: nothing is
+        parsed, the topic tree reads its nodes from the mapped deck and the
+        chunk type is the one of the deck.
+        '''
         super().__init__(**kwargs)
 
         self.dirpath = dirpath
         self.filepath = filepath
         self.nr_chunks = nr_chunks
         self.chunk_type = chunk_type
+        self.workers = workers
+        self.cache = cache
+        self.watch = watch
+        self.watch_interval = watch_interval
+        self.watcher = None
+        self.lazy = lazy
+        self.node_type = node_type
+        self.fences = fences
+        self.query = query
+        self.scheduler = scheduler
+        self.weights = weights
+        self.seed = seed
+        self.background = background
+        self.server = server
+        self.deck = None
+        self.deck_file = deck_file
+        self.mapped_deck = None
+        self.loader = None
+        self.chunk_pool = dedup.Chunk_pool()
+        self.session = None
+        self._prefetched = None
+        self.highlights = highlighting.Highlight_cache() if highlight \
+            else None
+        self._transition_start = None
+        # seconds from leaving a card form until the next one is drawn
+        self.transition_times = []
 
     def onStart(self):
-        if self.dirpath:
-            section = Section.from_dir(self.dirpath)
+        if self.server is not None:
+            self.start_client()
+            return
+        # a query needs all files parsed before it starts
+        background = bool(self.background and self.dirpath and
+                          self.query is None)
+        lazy = self.lazy or background
+        if self.deck_file:
+            self.mapped_deck = deck.Deck_file(self.deck_file)
+            self.chunk_type = self.mapped_deck.chunk_type
+            section = self.mapped_deck.root()
+            # nodes and chunks are read from the deck when they are used
+            lazy = True
+        elif self.dirpath:
+            section = Section.from_dir(self.dirpath,
+                                       workers=self.workers,
+                                       cache=self.cache,
+                                       lazy=lazy,
+                                       node_type=self.node_type,
+                                       fences=self.fences)
         elif self.filepath:
-            section = Section.from_file(self.filepath)
+            section = Section.from_file(self.filepath, cache=self.cache,
+                                        node_type=self.node_type,
+                                        fences=self.fences)
         else:
-            raise ValueError('App needs a directory or filepath!')
+            raise ValueError('App needs a directory, filepath or deck!')
+
+        # the index is made again with it when files change
+        self.lazy = lazy
+        self.section = section
+        # a query searches all files, the topic choice the loaded ones
+        self.index = Search_index.from_node(section, self.cache,
+                                            lazy=lazy and self.query is None)
+        if self.query is not None:
+            self.start_query()
+            return
+
+        tree = tc.Chunk_tree.from_node(section, self.chunk_type, self.cache,
+                                       lazy=lazy, pool=self.chunk_pool)
+        if background:
+            self.loader = loader.Background_loader(tree, self.chunk_type,
+                                                   self.cache,
+                                                   self.chunk_pool)
+        elif self.cache is not None:
+            self.cache.save()
+
+        self.tree = tree
+        if self.watch and self.dirpath:
+            self.watcher = watcher.make_watcher(self.dirpath,
+                                                self.watch_interval)
+            # forms wake up every second to check for changes (deciseconds)
+            self.keypress_timeout_default = 10
+        if background:
+            # while_waiting() adds the loaded files ten times a second
+            self.keypress_timeout_default = 1
+
+        self.add_topic_choice(progress=background)
+        if background:
+            self.loader.start()
+            self.show_progress()
 
-        tree = tc.Chunk_tree.from_node(section, self.chunk_type)
-        self.tree_choices = self.addForm(
-            'topic_choice', tc.Chunk_choice_form, tree)
+    def start_client(self):
+        '''onStart() with a deck server'''
+        self.deck = deck_server.Deck_client(self.server)
+        self.index = self.deck
+        if self.query is not None:
+            self.start_query()
+            return
+        self.tree = self.deck.tree()
+        self.add_topic_choice()
+
+    def add_topic_choice(self, progress=False):
+        with metrics.timer('forms'):
+            self.tree_choices = self.addForm(
+                'topic_choice', tc.Chunk_choice_form, self.tree,
+                search_index=self.index, progress=progress)
+
+    def start_query(self):
+        '''starts the session with the chunks of the sections matching the
+        query
+        '''
+        positions = self.index.search(self.query)
+        if self.deck is not None:
+            self.start_session(self.remote_cards(positions))
+            return
+        if self.scheduler is None:
+            positions = self.sample_positions(positions)
+        cards = []
+        keys = set()
+        for position in positions:
+            if self.scheduler is None and len(cards) >= self.nr_chunks:
+                break
+            node = self.index.nodes[position]
+            chunk = tc.Chunk_tree._make_chunk(node, self.chunk_type,
+                                              self.cache, self.chunk_pool)
+            path = self.index.heading_path(position)
+            for chunk in tc.valid_chunks([chunk]):
+                key = dedup.chunk_key(chunk)
+                if key not in keys:
+                    keys.add(key)
+                    cards.append((path, chunk))
+        if self.cache is not None:
+            self.cache.save()
+        self.start_session(cards)
+
+    def remote_cards(self, positions):
+        '''cards of the nodes at the positions from the deck server, the due
+        and new cards of a session for the Scheduler (see
+        sampling.schedule()), a sample otherwise. Only these are sent
+        '''
+        if self.scheduler is not None:
+            return sampling.schedule(
+                self.scheduler, self.nr_chunks,
+                lambda due: self.deck.due(positions, due),
+                lambda count: self.deck.sample(positions, count,
+                                               self.weights, self.seed))
+        return self.deck.sample(positions, self.nr_chunks, self.weights,
+                                self.seed)
+
+    def sample_positions(self, positions):
+        '''the index positions whose sections have a marker of the chunk type
+        (a fence for code) in a weighted random order from a Sampler.
+        start_query() makes their chunks until it has nr_chunks cards
+        '''
+        sampler = sampling.Sampler(len(positions), self.seed)
+        nodes = [self.index.nodes[position] for position in positions]
+        found = ch.marker_mask([node.get_content() for node in nodes],
+                               ch.markers(self.chunk_type))
+        for position, has_marker in zip(positions, found):
+            if not has_marker:
+                continue
+            weight = 1.0
+            if self.weights:
+                weight = sampling.path_weight(
+                    self.weights, self.index.heading_path(position))
+            sampler.add(position, weight)
+        return sampler.items()
+
+    def start_session(self, cards):
+        '''cards is a list of (heading path, chunk) tuples without copies of
+        a card, they are left out before sampling
+        '''
+        if self.scheduler is not None:
+            self.session = self.scheduler.session(cards, self.nr_chunks,
+                                                  self.seed)
+        else:
+            # cards is already a random sample, see sample_positions()
+            # and sampling.sample_tree()
+            self.chunks = cards[:self.nr_chunks]
+        with metrics.timer('forms'):
+            self.create_card_forms()
+        self.show_prompt()
+
+    def onCleanExit(self):
+        if self.loader is not None:
+            self.loader.stop()
+        if self.watcher is not None:
+            self.watcher.close()
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.deck is not None:
+            self.deck.close()
+        if self.mapped_deck is not None:
+            self.mapped_deck.close()
+        if self.cache is not None:
+            # lazy trees parse files while the app is running
+            self.cache.save()
+
+    def while_waiting(self):
+        '''called by npyscreen when no key was pressed for a while. Swaps
+        changed files into the topic tree
+        '''
+        if self.loader is not None:
+            self.poll_loader()
+        if self.watcher is None:
+            return
+        changed = self.watcher.poll()
+        if not changed:
+            return
+        edits = watcher.update_tree(self.section, changed, self.cache,
+                                    self.node_type, self.fences)
+        if edits:
+            self.tree.apply_edits(edits, self.chunk_type, self.cache,
+                                  self.chunk_pool)
+            self.index = Search_index.from_node(self.section, self.cache,
+                                                lazy=self.lazy)
+            self.tree_choices.refresh_tree(self.index)
+        if self.cache is not None and self.loader is None:
+            self.cache.save()
+
+    def poll_loader(self):
+        '''adds the files parsed by the background loader to the topic tree
+        '''
+        if self.loader.apply_results():
+            self.tree_choices.refresh_tree()
+        self.show_progress()
+        if not self.loader.finished():
+            return
+        self.loader = None
+        if self.cache is not None:
+            self.cache.save()
+        self.keypress_timeout_default = 10 if self.watcher else None
+        self.tree_choices.keypress_timeout = self.keypress_timeout_default
+
+    def show_progress(self):
+        if self.loader.finished():
+            text = '{} files loaded'.format(self.loader.total)
+        else:
+            text = 'loading {} of {} files...'.format(self.loader.done + 1,
+                                                      self.loader.total)
+        self.tree_choices.set_progress(text)
 
     def next_form(self):
         '''switches to next form in line. Will call onInMainLoop by itself
         '''
+        self._transition_start = time.perf_counter()
         self.switchFormNow()
 
     def onInMainLoop(self):
@@ -105,36 +393,129 @@ class App(nps.NPSAppManaged):
         last_form = history[len(history) - 1]
         if last_form == 'topic_choice':
             # this means topic choice is finished
-            self.chunks = self.tree_choices.get_values()
-            random.shuffle(self.chunks)
-            self.chunks = self.chunks[:self.nr_chunks]
-            self.show_prompt()
+            if self.deck is not None:
+                # positions are the depth-first order of the tree
+                cards = self.remote_cards(
+                    [position for position, node
+                     in enumerate(self.tree.walk_built()) if node.selected])
+            elif self.scheduler is not None:
+                cards = sampling.scheduled_cards(
+                    self.tree, self.scheduler, self.nr_chunks, self.weights,
+                    self.seed)
+            else:
+                cards = sampling.sample_tree(self.tree, self.nr_chunks,
+                                             self.weights, self.seed)
+            self.start_session(cards)
         elif last_form == 'show_prompt':
-            self.removeForm('show_prompt')
             self.show_answer()
         elif last_form == 'show_answer':
-            self.removeForm('show_answer')
             self.show_prompt()
 
+    def create_card_forms(self):
+        '''the prompt and answer forms are made once and get the values of
+        every card, see set_card()
+        '''
+        self.prompt_form = form_factory(title='', text=[],
+                                        callback=self.next_form,
+                                        on_display=self._transition_done)
+        self.registerForm('show_prompt', self.prompt_form)
+        if self.session is None:
+            self.answer_form = form_factory(title='', text=[],
+                                            callback=self.next_form,
+                                            on_display=self._transition_done)
+        else:
+            self.answer_form = form_factory(
+                title='', text=[],
+                callback=lambda *args: self.answer(sched.GOOD),
+                on_display=self._transition_done)
+            self.answer_form.add_handlers({
+                str(grade + 1): lambda key, grade=grade: self.answer(grade)
+                for grade in sched.GRADES
+            })
+        self.registerForm('show_answer', self.answer_form)
+
+    def set_card(self, form, title, lines, runs=None):
+        form.name = title
+        form.pager.set_lines(lines, runs)
+        # start on the first widget, like a new form would
+        form.editw = 0
+
     def show_prompt(self):
         self.setNextForm('show_prompt')
         try:
-            self.next_chunk = self.chunks.pop()
-            lines = self.next_chunk.get_prompt().split('\n')
-            form = form_factory(title=self.next_chunk.get_title(),
-                                text=lines,
-                                callback=self.next_form)
-            self.registerForm('show_prompt', form)
+            if self.session is not None:
+                self.state, self.next_chunk = self.session.pop()
+                path = self.state.path
+            else:
+                path, self.next_chunk = self.chunks.pop()
         except IndexError:
             self.setNextForm(None)
+            return
+        # a chunk shared by copies has the title of the first one
+        self.title = path[-1] if path else self.next_chunk.get_title()
+        prompt, self.answer_lines = self.split_card(self.next_chunk)
+        self.set_card(self.prompt_form, self.title, prompt)
 
     def show_answer(self):
         self.setNextForm('show_answer')
-        lines = self.next_chunk.get_content().split('\n')
-        form = form_factory(title=self.next_chunk.get_title(),
-                            text=lines,
-                            callback=self.next_form)
-        self.registerForm('show_answer', form)
+        title = self.title
+        if self.session is not None:
+            title += ' - 1 again, 2 hard, 3 good, 4 easy (next)'
+        self.set_card(self.answer_form, title, self.answer_lines,
+                      self.highlight(self.next_chunk))
+        self.prefetch()
+
+    def highlight(self, chunk):
+        '''attribute runs of the answer lines of chunk, or None'''
+        if self.highlights is None:
+            return None
+        mode, attribute = highlighting.attribute_function(
+            self.answer_form.pager)
+        return self.highlights.get(chunk, mode, attribute)
+
+    def split_card(self, chunk):
+        '''returns the prompt and answer lines of a chunk, prefetched if
+        possible
+        '''
+        if self._prefetched is not None and self._prefetched[0] is chunk:
+            return self._prefetched[1:]
+        return (chunk.get_prompt().split('\n'),
+                chunk.get_content().split('\n'))
+
+    def prefetch(self):
+        '''splits the lines of the card after the current one, while the
+        answer is shown
+        '''
+        if self.session is not None:
+            chunk = self.session.peek()
+        else:
+            chunk = self.chunks[-1][1] if self.chunks else None
+        if chunk is None:
+            self._prefetched = None
+        else:
+            self._prefetched = (chunk,) + self.split_card(chunk)
+            self.highlight(chunk)
+
+    def answer(self, grade):
+        '''records the grade of the shown card and moves on'''
+        self.session.answer(self.state, self.next_chunk, grade)
+        self.next_form()
+
+    def transition_stats(self):
+        '''number, mean and max in seconds of the times between leaving a
+        card form and showing the next one
+        '''
+        times = self.transition_times
+        if not times:
+            return 0, 0.0, 0.0
+        return len(times), sum(times) / len(times), max(times)
+
+    def _transition_done(self):
+        if self._transition_start is not None:
+            seconds = time.perf_counter() - self._transition_start
+            self.transition_times.append(seconds)
+            metrics.add_time('transition', seconds)
+            self._transition_start = None
 
 
 if __name__ == '__main__':
@@ -142,15 +523,122 @@ if __name__ == '__main__':
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--filepath', '-f', default=None)
     group.add_argument('--dirpath', '-d', default=None)
+    group.add_argument('--server', '-s', nargs='?', default=None,
+                       const=deck_server.DEFAULT_SOCKET, metavar='SOCKET',
+                       help='get the cards from a deck server started with '
+                       '"python -m memit.server" (default socket: '
+                       '%(const)s)')
+    group.add_argument('--deck', default=None,
+                       help='deck file made by "python -m '
+                       'memit.markdown_parser.deck build-deck", its chunk '
+                       'type is used')
     parser.add_argument('--nr_chunks', '-n', type=int)
+    parser.add_argument('--chunk-type', '-c', default='code',
+                        help='"code" makes one card per section, the other '
+                        'types can be combined, e.g. "code_blocks,qa": '
+                        '"code_blocks" one card per fenced code block, '
+                        '"cloze" code blocks with {{deletions}}, '
+                        '"definitions" definition list terms, "qa" '
+                        '"> Q:" and "> A:" blockquotes')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='number of processes for parsing a directory')
+    parser.add_argument('--lazy', action='store_true',
+                        help='only parse files when they are expanded or '
+                        'selected')
+    parser.add_argument('--node-type', default='section',
+                        choices=['section', 'compact', 'mapped'],
+                        help='"compact" keeps sections and chunks as offsets '
+                        'into the file contents to save memory, "mapped" '
+                        'also memory-maps the files')
+    parser.add_argument('--fences', action='store_true',
+                        help='do not treat "#" lines inside fenced code '
+                        'blocks as headings')
+    parser.add_argument('--background', action='store_true',
+                        help='show the topic choice right away and parse the '
+                        'files of --dirpath in a background thread')
+    parser.add_argument('--query', '-q', default=None,
+                        help='skip the topic choice and learn the sections '
+                        'containing all words of the query')
+    parser.add_argument('--schedule', action='store_true',
+                        help='learn the due cards first and keep a review '
+                        'log of the answers (in '
+                        '$XDG_DATA_HOME/memit/reviews.sqlite, by default '
+                        '~/.local/share/memit/reviews.sqlite). Without it '
+                        'random cards are learned and nothing is written')
+    parser.add_argument('--review-db', default=None,
+                        help='SQLite file of the review log, implies '
+                        '--schedule')
+    parser.add_argument('--weight', action='append', default=[],
+                        metavar='PATH=WEIGHT',
+                        help='pick new cards below PATH (a directory, file '
+                        'or heading path like "python/pandas/groupby") '
+                        'WEIGHT times as often. Can be given several times')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='pick the same new cards for the same '
+                        'selection')
+    parser.add_argument('--no-highlight', action='store_true',
+                        help='show code answers without syntax highlighting')
+    parser.add_argument('--watch', action='store_true',
+                        help='reload changed files in --dirpath while '
+                        'running')
+    parser.add_argument('--cache-dir', default=None,
+                        help='where to cache parsed files (default: '
+                        '~/.cache/memit)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='parse all files, do not use the cache')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='remove all cached files before starting')
+    parser.add_argument('--cache-hash', action='store_true',
+                        help='validate cached files by content hash instead '
+                        'of mtime and size')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the time of every phase (scanning, '
+                        'parsing, chunks, forms), the card transitions, '
+                        'counts and cache statistics on exit')
     args = parser.parse_args()
+    if args.stats:
+        metrics.enable()
+    try:
+        weights = sampling.parse_weights(args.weight)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        ch.markers(args.chunk_type)
+    except ValueError:
+        parser.error('unknown chunk type: ' + args.chunk_type)
 
-    if args.filepath:
-        content = Section.from_file(args.filepath)
-    elif args.dirpath:
-        content = Section.from_dir(args.dirpath)
-
+    options = {
+        'chunk_type': args.chunk_type,
+        'workers': args.workers,
+        'watch': args.watch,
+        'lazy': args.lazy,
+        'node_type': args.node_type,
+        'fences': args.fences,
+        'query': args.query,
+        'highlight': not args.no_highlight,
+        'weights': weights,
+        'seed': args.seed,
+        'background': args.background,
+        'server': args.server,
+        'deck_file': args.deck
+    }
     if args.nr_chunks:
-        app = App(args.dirpath, args.filepath, nr_chunks=args.nr_chunks).run()
-    else:
-        app = App(args.dirpath, args.filepath).run()
+        options['nr_chunks'] = args.nr_chunks
+    if args.schedule or args.review_db is not None:
+        options['scheduler'] = sched.Scheduler(args.review_db)
+    if not args.no_cache and args.server is None and args.deck is None:
+        options['cache'] = Parse_cache(args.cache_dir,
+                                       use_hash=args.cache_hash)
+        if args.clear_cache:
+            options['cache'].invalidate()
+
+    app = App(args.dirpath, args.filepath, **options)
+    app.run()
+
+    if args.stats:
+        print(metrics.format_stats())
+        if app.cache is not None:
+            print(app.cache.format_stats())
+        count, mean, longest = app.transition_stats()
+        print('{} card transitions: {:.1f} ms mean, {:.1f} ms max'
+              .format(count, mean * 1000, longest * 1000))
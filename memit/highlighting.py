@@ -0,0 +1,202 @@
+'''Syntax highlighting of code answers. The code of a chunk is split into
+tokens with pygments (if it is installed) once, and stored as curses
+attribute runs: for every line a tuple of (attribute, length) pairs. The runs
+are kept in a Highlight_cache, so scrolling through an answer or showing the
+card again does not tokenize it again.
+
+Highlighted_pager is a Pager that draws the lines with their runs, see
+highlighting_example.py for the npyscreen mechanism.
+'''
+
+import collections
+import curses
+import functools
+
+import npyscreen as nps
+
+from memit.markdown_parser import metrics
+
+try:
+    import pygments.lexers
+    import pygments.util
+    from pygments import token
+except ImportError:
+    pygments = None
+
+
+# theme color of each kind of token, checked in order
+_STYLES = [
+    ('Comment', 'LABEL'),
+    ('String', 'SAFE'),
+    ('Number', 'CAUTION'),
+    ('Keyword', 'WARNING'),
+    ('Operator.Word', 'WARNING'),
+    ('Name.Builtin', 'CONTROL'),
+    ('Name.Function', 'GOOD'),
+    ('Name.Class', 'GOOD'),
+    ('Name.Decorator', 'GOOD'),
+]
+_BOLD = {'WARNING', 'GOOD'}
+# without colors, only keywords and definitions stand out
+_MONO = {
+    'WARNING': curses.A_BOLD,
+    'GOOD': curses.A_BOLD,
+    'LABEL': curses.A_DIM
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _lexer(syntax):
+    try:
+        # keep the code as it is, so the runs line up with the lines
+        return pygments.lexers.get_lexer_by_name(syntax, stripnl=False,
+                                                 ensurenl=False)
+    except pygments.util.ClassNotFound:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _style(ttype):
+    for name, style in _STYLES:
+        if ttype in token.string_to_tokentype(name):
+            return style
+    return 'DEFAULT'
+
+
+def tokenize(code, syntax):
+    '''returns a list with a tuple of (style, length) runs for every line of
+    code, where style is the name of a theme color. Returns None if code can
+    not be highlighted (no pygments, unknown syntax).
+    '''
+    if pygments is None or not syntax or code is None:
+        return None
+    lexer = _lexer(syntax.lower())
+    if lexer is None:
+        return None
+
+    lines = []
+    runs = []
+    for ttype, value in lexer.get_tokens(code):
+        style = _style(ttype)
+        parts = value.split('\n')
+        for idx, part in enumerate(parts):
+            if idx > 0:
+                lines.append(tuple(runs))
+                runs = []
+            if not part:
+                continue
+            if runs and runs[-1][0] == style:
+                runs[-1] = (style, runs[-1][1] + len(part))
+            else:
+                runs.append((style, len(part)))
+    lines.append(tuple(runs))
+    return lines
+
+
+def attribute_function(widget):
+    '''returns the color mode of widget and a function turning a style into
+    a curses attribute in that mode
+    '''
+    if widget.do_colors():
+        theme = widget.parent.theme_manager
+
+        def attribute(style):
+            attr = theme.findPair(widget, style)
+            if style in _BOLD:
+                attr |= curses.A_BOLD
+            return attr
+        return 'color', attribute
+    return 'mono', lambda style: _MONO.get(style, curses.A_NORMAL)
+
+
+class Highlight_cache():
+    '''least recently used cache of the attribute runs of chunks, keyed by
+    the syntax and code of the chunk and the color mode
+    '''
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.stats = {
+            'hits': 0,
+            'misses': 0
+        }
+        self._runs = collections.OrderedDict()
+
+    def get(self, chunk, mode, attribute):
+        '''returns the attribute runs of every line of the chunk content, or
+        None if it is not highlighted. attribute turns a style name into a
+        curses attribute for the mode.
+        '''
+        get_syntax = getattr(chunk, 'get_syntax', None)
+        if get_syntax is None:
+            return None
+        key = (get_syntax(), chunk.get_content(), mode)
+        if key in self._runs:
+            self._runs.move_to_end(key)
+            self.stats['hits'] += 1
+            metrics.count('highlight.hits')
+            return self._runs[key]
+
+        self.stats['misses'] += 1
+        metrics.count('highlight.misses')
+        lines = tokenize(key[1], key[0])
+        if lines is not None:
+            lines = [tuple((attribute(style), length)
+                           for style, length in runs)
+                     for runs in lines]
+        self._runs[key] = lines
+        if len(self._runs) > self.maxsize:
+            self._runs.popitem(last=False)
+        return lines
+
+
+class Highlighted_line(nps.Textfield):
+    '''a line of a Highlighted_pager. runs is set by the pager'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = None
+        self._expanded = None
+
+    def update_highlighting(self, start=None, end=None, clear=False):
+        if self._expanded is self.runs:
+            return
+        self._expanded = self.runs
+        data = []
+        for attr, length in self.runs or ():
+            data.extend([attr] * length)
+        self._highlightingdata = data
+
+
+class Highlighted_pager(nps.Pager):
+    '''a Pager that highlights its lines with line_runs, a list with the
+    attribute runs of every value. Lines are not wrapped while it is set.
+    '''
+
+    _contained_widgets = Highlighted_line
+
+    def __init__(self, *args, **kwargs):
+        self.line_runs = None
+        super().__init__(*args, **kwargs)
+
+    def set_lines(self, lines, runs=None):
+        self.values = lines
+        self.line_runs = runs
+        self.autowrap = runs is None
+        self.start_display_at = 0
+        self.cursor_line = 0
+
+    def update(self, clear=True):
+        # the last line may show MORE_LABEL without _print_line() being called
+        self._my_widgets[-1].runs = None
+        self._my_widgets[-1].syntax_highlighting = False
+        super().update(clear=clear)
+
+    def _print_line(self, line, value_indexer):
+        super()._print_line(line, value_indexer)
+        runs = None
+        if self.line_runs is not None and \
+                0 <= value_indexer < len(self.line_runs):
+            runs = self.line_runs[value_indexer]
+        line.runs = runs
+        line.syntax_highlighting = runs is not None
@@ -0,0 +1,68 @@
+'''Loading a lazy topic tree in the background, so the topic choice can be
+shown before the notes are parsed. A Background_loader thread parses the
+files of the tree one by one and makes their chunks. Its results are put in
+a queue, and the UI thread adds them to the Chunk_tree with apply_results(),
+so the tree is only ever changed by the UI thread. The Parse_cache and the
+Chunk_pool are shared with the UI thread, they lock themselves.
+
+Files that are expanded before the loader gets to them are parsed by the UI
+thread, Lazy_section makes sure a file is parsed only once.
+'''
+
+import queue
+import threading
+
+from memit.topic_choice import Chunk_tree
+
+
+class Background_loader(threading.Thread):
+    '''parses the files of a lazy Chunk_tree (see
+    Chunk_tree.from_node(lazy=True)) in tree order
+    '''
+
+    def __init__(self, tree, chunk_type, cache=None, pool=None):
+        super().__init__(name='memit-loader', daemon=True)
+        # building the directory nodes does not parse anything
+        self.file_nodes = tree.file_nodes()
+        self.chunk_type = chunk_type
+        self.cache = cache
+        self.pool = pool
+        self.total = len(self.file_nodes)
+        self.done = 0
+        self.results = queue.Queue()
+        self._stopped = threading.Event()
+
+    def run(self):
+        for tree_node in self.file_nodes:
+            if self._stopped.is_set():
+                return
+            section = tree_node.source()[0].load()
+            nodes = list(section.iter_nodes())
+            chunks = Chunk_tree._make_chunks(nodes, self.chunk_type,
+                                             self.cache, self.pool)
+            self.results.put((tree_node, chunks))
+
+    def stop(self):
+        '''stops after the file being parsed and waits for the thread'''
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def finished(self):
+        '''True when every result was applied'''
+        return self.done == self.total
+
+    def apply_results(self, limit=None):
+        '''adds the parsed files to the tree, at most limit of them. Call
+        from the UI thread. Returns the number of files added
+        '''
+        count = 0
+        while limit is None or count < limit:
+            try:
+                tree_node, chunks = self.results.get_nowait()
+            except queue.Empty:
+                break
+            tree_node.set_loaded(chunks)
+            count += 1
+        self.done += count
+        return count
@@ -2,14 +2,29 @@
 content it extracts a "chunk" of text that is relevant for some purpose.
 
 Chunks exclude one another
+
+Besides "code", the chunk types are Extractors in a registry (see register()).
+Several of them can be combined, e.g. "code_blocks,qa,cloze", and still scan
+the content of a section only once.
 '''
 
+import bisect
+import itertools
 import re
 import abc
+import time
+
+from memit.markdown_parser import fences, metrics
+
+# shown as the prompt of a code chunk without one
+NO_PROMPT = '--no prompt for this chunk--'
 
 
 class Chunk(abc.ABC):
 
+    # lets subclasses use __slots__, see compact.Compact_code_chunk
+    __slots__ = ()
+
     @abc.abstractmethod
     def to_JSON(self):
         pass
@@ -29,6 +44,7 @@ class Chunk(abc.ABC):
 
 class Code_chunk(Chunk):
 
+    # what is matched, found by fences.find_code() in linear time
     _regexp = '```([A-z]+)?\\n.+\\n```'
     _prompt_break = '```'
 
@@ -46,40 +62,449 @@ class Code_chunk(Chunk):
         return self.title
 
     def get_prompt(self):
-        return self.prompt or '--no prompt for this chunk--'
+        return self.prompt or NO_PROMPT
 
     def _extract(self, string):
-        code = re.search(self._regexp, string, re.DOTALL)
+        block = fences.find_code(string)
         prompt = ''
-        if code:
-            code = code.group()
-            syntax = re.search('```([A-z]+)?\\n', code)
-            self.syntax = syntax.group(1) or None
-            code = re.sub('```([A-z]+)?\\n', '', code)
-            code = re.sub('```', '', code)
+        code = None
+        if block:
+            self.syntax = fences.syntax(string, block)
+            code = fences.strip_fences(string[block.start:block.end])
             code = code.strip()
 
-            prompt_break = re.search(self._prompt_break, string)
-            prompt = string[:prompt_break.start()].strip()
+            prompt_break = string.find(self._prompt_break)
+            prompt = string[:prompt_break].strip()
+        else:
+            self.syntax = None
 
         self.prompt = prompt or None
         self.code = code or None
 
     @classmethod  # why do I need to repeat this?
     def test(cls, string):
-        match = re.search(cls._regexp, string, re.DOTALL)
-        return True if match else False
+        return fences.find_code(string) is not None
 
     def to_JSON(self):
         return {
             'code': self.code,
-            'syntax': 'python'
+            'syntax': self.syntax
         }
 
 
-def chunk_factory(string, title, chunk_type):
+class Code_block_chunk(Code_chunk):
+    '''a single fenced code block of a section. The prompt is the text between
+    the previous block (or the start of the section) and this one.
+    '''
+
+    # what is matched, found by fences.iter_blocks() in linear time
+    _fence = re.compile('```([A-z]+)?\\n(.*?)\\n```', re.DOTALL)
+
+    def __init__(self, code, syntax, prompt, title):
+        self.code = code or None
+        self.syntax = syntax or None
+        self.prompt = prompt or None
+        self.title = title
+
+    @classmethod
+    def from_section(cls, string, title):
+        '''returns a list with a chunk for every fenced code block
+        '''
+        chunks = []
+        prompt_start = 0
+        for block in fences.iter_blocks(string):
+            prompt = string[prompt_start:block.start].strip()
+            code = string[block.code_start:block.code_end]
+            chunks.append(cls(code.strip(), fences.syntax(string, block),
+                              prompt, title))
+            prompt_start = block.end
+        return chunks
+
+
+class Chunk_group(Chunk):
+    '''holds all chunks of a section when a chunk type gives more than one.
+    get_content() returns the list of chunks.
+    '''
+
+    def __init__(self, chunks, title):
+        self.chunks = chunks
+        self.title = title
+
+    def get_content(self):
+        return self.chunks
+
+    def get_prompt(self):
+        return None
+
+    def get_title(self):
+        return self.title
+
+    def to_JSON(self):
+        return [chunk.to_JSON() for chunk in self.chunks]
+
+
+class Cloze_chunk(Code_block_chunk):
+    '''a fenced code block with deletions marked {{like this}} or
+    {{c1::like this}}. The prompt shows the code with the deletions blanked,
+    the answer is the whole code.
+    '''
+
+    # a deletion does not go over another "{{", so an unclosed one is only
+    # searched up to the next
+    _deletion = re.compile('\\{\\{(?:c\\d+::)?((?:(?!\\{\\{).)*?)\\}\\}',
+                           re.DOTALL)
+    blank = '[...]'
+
+    def __init__(self, code, syntax, prompt, title):
+        super().__init__(self._deletion.sub('\\1', code), syntax, prompt,
+                         title)
+        self.cloze = self._deletion.sub(self.blank, code)
+
+    @classmethod
+    def test(cls, code):
+        return cls._deletion.search(code) is not None
+
+    def get_prompt(self):
+        return '\n\n'.join(part for part in (self.prompt, self.cloze) if part)
+
+    def to_JSON(self):
+        return {
+            'code': self.code,
+            'syntax': self.syntax,
+            'cloze': self.cloze
+        }
+
+
+class Definition_chunk(Chunk):
+    '''a term of a definition list and its definition:
+
+    term
+    : definition
+    '''
+
+    def __init__(self, term, definition, title):
+        self.term = term
+        self.definition = definition or None
+        self.title = title
+
+    def get_content(self):
+        return self.definition
+
+    def get_prompt(self):
+        return self.term
+
+    def get_syntax(self):
+        return None
+
+    def get_title(self):
+        return self.title
+
+    def to_JSON(self):
+        return {
+            'term': self.term,
+            'definition': self.definition
+        }
+
+
+class Qa_chunk(Chunk):
+    '''a question and its answer in a blockquote:
+
+    > Q: question
+    > A: answer
+    '''
+
+    def __init__(self, question, answer, title):
+        self.question = question
+        self.answer = answer or None
+        self.title = title
+
+    def get_content(self):
+        return self.answer
+
+    def get_prompt(self):
+        return self.question
+
+    def get_syntax(self):
+        return None
 
+    def get_title(self):
+        return self.title
+
+    def to_JSON(self):
+        return {
+            'question': self.question,
+            'answer': self.answer
+        }
+
+
+def chunk_factory(string, title, chunk_type):
+    '''returns a Code_chunk for "code", and a list of chunks for the other
+    chunk types, see extract()
+    '''
     if chunk_type == 'code':
         return Code_chunk(string, title)
-    else:
-        raise ValueError('unknown chunk type!')
+    elif chunk_type == 'code_blocks':
+        return Code_block_chunk.from_section(string, title)
+    return extract(string, title, chunk_type)
+
+
+FENCE = '```'
+
+
+class Extractor(abc.ABC):
+    '''finds one kind of chunk in the content of a section. pattern is a
+    regular expression compiled with DOTALL and MULTILINE, its groups are
+    passed to build(). Extractors with the same pattern share its matches
+    and are tried in the order they were registered. One of the markers is
+    in every content something can be found in, see marker_mask().
+
+    Extractors with the pattern of Block_extractor get the fenced blocks
+    found by fences.iter_blocks() instead, the other patterns are only
+    searched between them.
+    '''
+
+    name = None
+    pattern = None
+    markers = ()
+
+    @abc.abstractmethod
+    def build(self, groups, prompt, title):
+        '''the chunk of a match, or None to leave the match to the next
+        extractor with the same pattern. prompt is the text between the
+        previous match and this one
+        '''
+        pass
+
+
+class Block_extractor(Extractor):
+    '''a Code_block_chunk for every fenced code block'''
+
+    name = 'code_blocks'
+    pattern = Code_block_chunk._fence.pattern
+    markers = (FENCE,)
+
+    def build(self, groups, prompt, title):
+        syntax, code = groups
+        return Code_block_chunk(code.strip(), syntax, prompt, title)
+
+
+class Cloze_extractor(Block_extractor):
+    '''a Cloze_chunk for the fenced code blocks with deletions'''
+
+    name = 'cloze'
+
+    def build(self, groups, prompt, title):
+        syntax, code = groups
+        if not Cloze_chunk.test(code):
+            return None
+        return Cloze_chunk(code.strip(), syntax, prompt, title)
+
+
+class Definition_extractor(Extractor):
+    '''a Definition_chunk for every term of a definition list. A term can
+    have several ": " lines, they are one definition
+    '''
+
+    name = 'definitions'
+    pattern = ('^(?!' + FENCE + ')([^\\n>#][^\\n]*)\\n'
+               '((?:: [^\\n]*(?:\\n|\\Z))+)')
+    markers = ('\n: ',)
+
+    def build(self, groups, prompt, title):
+        term, lines = groups
+        definition = '\n'.join(line[2:].strip()
+                               for line in lines.splitlines())
+        return Definition_chunk(term.strip(), definition.strip(), title)
+
+
+class Qa_extractor(Extractor):
+    '''a Qa_chunk for every "> Q:" line followed by an "> A:" line. Both can
+    go on over further blockquote lines
+    '''
+
+    name = 'qa'
+    # a question stops at the next "Q:" line, so an unanswered question is
+    # not searched to the end of its blockquote from every "Q:" line
+    pattern = ('^> ?Q: ?([^\\n]*(?:\\n>(?! ?[AQ]:)[^\\n]*)*)'
+               '\\n> ?A: ?([^\\n]*(?:\\n>(?! ?Q:)[^\\n]*)*)')
+    markers = ('Q:',)
+
+    _quote = re.compile('^> ?', re.MULTILINE)
+
+    def build(self, groups, prompt, title):
+        question, answer = (self._quote.sub('', group).strip()
+                            for group in groups)
+        return Qa_chunk(question, answer, title)
+
+
+# name -> Extractor, in the order they are tried for a shared pattern
+EXTRACTORS = {}
+# tuple of extractor names -> (regex, {group index: (first group, number of
+# groups, extractors)}, block extractors)
+_scanners = {}
+
+
+def register(extractor):
+    '''adds an Extractor instance, it can then be used in chunk types'''
+    if extractor.name == 'code' or ',' in extractor.name:
+        raise ValueError('invalid extractor name: ' + extractor.name)
+    EXTRACTORS[extractor.name] = extractor
+    _scanners.clear()
+
+
+for _extractor in (Cloze_extractor(), Block_extractor(),
+                   Definition_extractor(), Qa_extractor()):
+    register(_extractor)
+
+# the built-in chunk types
+CHUNK_TYPES = ('code',) + tuple(EXTRACTORS)
+
+
+def parse_chunk_type(chunk_type):
+    '''the extractor names of a chunk type like "code_blocks,qa". "code"
+    makes one chunk per section and can not be combined
+    '''
+    names = tuple(name.strip() for name in chunk_type.split(','))
+    for name in names:
+        if name not in EXTRACTORS:
+            raise ValueError('unknown chunk type!')
+    return names
+
+
+def _scanner(names):
+    scanner = _scanners.get(names)
+    if scanner is not None:
+        return scanner
+    order = list(EXTRACTORS)
+    # pattern -> extractors. Fenced code is always matched, so the other
+    # extractors do not look into code blocks
+    patterns = {Block_extractor.pattern: []}
+    for name in sorted(set(names), key=order.index):
+        extractor = EXTRACTORS[name]
+        patterns.setdefault(extractor.pattern, []).append(extractor)
+    blocks = patterns.pop(Block_extractor.pattern)
+
+    parts = []
+    alternatives = {}
+    group = 1
+    for pattern, extractors in patterns.items():
+        size = re.compile(pattern).groups
+        parts.append('({})'.format(pattern))
+        alternatives[group] = (group, size, extractors)
+        group += size + 1
+    regex = re.compile('|'.join(parts), re.DOTALL | re.MULTILINE) \
+        if parts else None
+    scanner = (regex, alternatives, blocks)
+    _scanners[names] = scanner
+    return scanner
+
+
+def _matches(string, scanner):
+    '''yields (start, end, groups, extractors) for every match in string,
+    in order. The fenced blocks are found first, the regex of the other
+    patterns searches the text between them
+    '''
+    regex, alternatives, blocks = scanner
+    pos = 0
+    for block in itertools.chain(fences.iter_blocks(string), [None]):
+        end = len(string) if block is None else block.start
+        if regex is not None:
+            for match in regex.finditer(string, pos, end):
+                first, size, extractors = alternatives[match.lastindex]
+                yield (match.start(), match.end(),
+                       match.groups()[first:first + size], extractors)
+        if block is None:
+            return
+        yield (block.start, block.end,
+               (fences.syntax(string, block),
+                string[block.code_start:block.code_end]), blocks)
+        pos = block.end
+
+
+def extract(string, title, chunk_type):
+    '''list of the chunks of all extractors of chunk_type in string, in the
+    order they appear. The string is scanned once for all of them. With
+    metrics enabled, the time of every extractor is added to "extract
+    <name>"
+    '''
+    scanner = _scanner(parse_chunk_type(chunk_type))
+    chunks = []
+    prompt_start = 0
+    for match_start, match_end, groups, extractors in _matches(string,
+                                                               scanner):
+        prompt = string[prompt_start:match_start].strip()
+        prompt_start = match_end
+        for extractor in extractors:
+            if metrics.enabled:
+                start = time.perf_counter()
+                chunk = extractor.build(groups, prompt, title)
+                metrics.add_time('extract ' + extractor.name,
+                                 time.perf_counter() - start)
+            else:
+                chunk = extractor.build(groups, prompt, title)
+            if chunk is not None:
+                chunks.append(chunk)
+                break
+    return chunks
+
+
+def markers(chunk_type):
+    '''strings one of which is in every content chunk_type finds a chunk in
+    '''
+    if chunk_type == 'code':
+        return (FENCE,)
+    found = []
+    for name in parse_chunk_type(chunk_type):
+        found.extend(marker for marker in EXTRACTORS[name].markers
+                     if marker not in found)
+    return tuple(found)
+
+
+def marker_mask(strings, markers):
+    '''returns a list telling for every string if it contains one of the
+    markers. The strings are joined into one buffer, which is searched with
+    a single find() per string and marker: after a match the search for that
+    marker continues at the next string.
+    '''
+    mask = [False] * len(strings)
+    starts = []
+    offset = 0
+    for string in strings:
+        starts.append(offset)
+        # one separator, a marker can not span two strings
+        offset += len(string) + 1
+    joined = '\0'.join(strings)
+
+    for marker in markers:
+        pos = joined.find(marker)
+        while pos != -1:
+            idx = bisect.bisect_right(starts, pos) - 1
+            mask[idx] = True
+            if idx + 1 == len(strings):
+                break
+            pos = joined.find(marker, starts[idx + 1])
+    return mask
+
+
+def fence_mask(strings):
+    '''marker_mask() for fences'''
+    return marker_mask(strings, (FENCE,))
+
+
+def empty_chunk(title, chunk_type):
+    '''what chunk_factory() returns for a string without chunks'''
+    if chunk_type == 'code':
+        return Code_chunk('', title)
+    parse_chunk_type(chunk_type)
+    return []
+
+
+def chunk_batch(strings, titles, chunk_type):
+    '''like chunk_factory() for every string and title, but the strings
+    without a marker of the chunk type are found with marker_mask() first
+    and get an empty_chunk() without being searched by the chunk regexes
+    '''
+    mask = marker_mask(strings, markers(chunk_type))
+    return [chunk_factory(string, title, chunk_type) if found
+            else empty_chunk(title, chunk_type)
+            for string, title, found in zip(strings, titles, mask)]
@@ -2,10 +2,16 @@
 the memory app
 '''
 
+import concurrent.futures
 import logging
 import re
 import os
 import json
+import shutil
+import tempfile
+import threading
+
+from memit.markdown_parser import metrics, tokenizer
 
 
 log = logging.getLogger('memit.markdown_parser')
@@ -15,12 +21,12 @@ class Section():
 
     VALID_EXT = ('.md', '.mdown', '.txt')
 
-    def __init__(self, title, content, children, level):
+    def __init__(self, title, content, children, level, path=None):
         self.title = title
         self.content = content
         self.children = children
         self.level = level
-        self.id = None
+        self.path = path
 
     def get_content(self):
         return self.content
@@ -31,20 +37,18 @@ class Section():
     def get_children(self):
         return self.children
 
-    def get_id(self):
-        '''will raise an error if the id is not set. This is to prevent errors
-        when you would expect an id but not have one.
-        '''
-        if self.id is not None:
-            return self.id
-        else:
-            raise ValueError('If you require the id, set it first!')
-
     def get_level(self):
         return self.level
 
-    def __set_id(self, id):
-        self.id = id
+    def is_loaded(self):
+        '''False for a Lazy_section that was not parsed yet'''
+        return True
+
+    def get_path(self):
+        '''absolute path of the file or directory of this Section. None for
+        sections inside a file
+        '''
+        return self.path
 
     def to_JSON(self):
         return json.dumps(self.to_dict_recursive())
@@ -73,190 +77,258 @@ class Section():
             'content': self.content,
             'level': self.level
         }
-        if self.id is not None:
-            result['id'] = self.id
-
         return result
 
     def get_graph_repr(self):
         '''returns a graph representation of the section and its children, a
         dictionary with
-          - nodes: list of all sections, including this one
-          - links: list of
-        TO DO: setting the id using the __set_id() method seems hacky and I
-        feel that the id should be set on initialisation. But since I am only
-        using it for links, it is enough for now.
+          - nodes: list of the to_dict() of all sections, including this one,
+            with their id
+          - links: list of parent -> child links between the ids
+        The ids are the positions of the sections in get_all_nodes().
         '''
-        nodes = self.get_all_nodes()
-        for idx in range(len(nodes)):
-            nodes[idx].__set_id(idx)
-
-        links = []
-        for node in nodes:
-            node_links = node.get_links()
-            if node_links:
-                links.extend(node_links)
-
         result = {
-            'nodes': [node.to_dict() for node in nodes],
-            'links': links
+            'nodes': [],
+            'links': []
         }
+        for kind, item in self.iter_graph():
+            result[kind + 's'].append(item)
         return result
 
-    def get_all_nodes(self):
-        nodes = []
+    def iter_graph(self):
+        '''yields the items of get_graph_repr() in a single depth-first walk:
+        ("node", node dict) for every section, followed by ("link", link dict)
+        for the link from its parent. Ids are given out as the sections are
+        reached, the sections themselves are not changed.
+        '''
+        next_id = 0
+        stack = [(self, None)]
+        while stack:
+            node, parent = stack.pop()
+            node_id = next_id
+            next_id += 1
+            node_dict = node.to_dict()
+            node_dict['id'] = node_id
+            yield 'node', node_dict
+
+            level = node.get_level()
+            if parent is not None:
+                yield 'link', {
+                    'source': parent[0],
+                    'target': node_id,
+                    'source_level': parent[1],
+                    'target_level': level
+                }
+            children = node.get_children()
+            if children:
+                stack.extend((child, (node_id, level))
+                             for child in reversed(children))
 
-        def append_nodes(node):
-            nodes.append(node)
+    def write_graph(self, file):
+        '''writes get_graph_repr() as JSON to file without building it. The
+        links are collected in a temporary file that spills to disk, so
+        memory does not grow with the size of the tree.
+        '''
+        with tempfile.SpooledTemporaryFile(max_size=1 << 20, mode='w+') \
+                as links:
+            file.write('{"nodes": [')
+            separators = {'node': '', 'link': ''}
+            for kind, item in self.iter_graph():
+                out = file if kind == 'node' else links
+                out.write(separators[kind])
+                out.write(json.dumps(item))
+                separators[kind] = ', '
+            file.write('], "links": [')
+            links.seek(0)
+            shutil.copyfileobj(links, file)
+            file.write(']}')
+
+    def get_all_nodes(self):
+        return list(self.iter_nodes())
+
+    def iter_nodes(self):
+        '''yields this section and all sections below it, depth-first'''
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
             children = node.get_children()
             if children:
-                for child in children:
-                    append_nodes(child)
-        append_nodes(self)
-        return nodes
-
-    def get_links(self):
-        children = self.get_children()
-        links = None
-        if children:
-            id = self.get_id()
-            level = self.get_level()
-            links = [{
-                'source': id,
-                'target': child.get_id(),
-                'source_level': level,
-                'target_level': child.get_level()
-            } for child in children]
-
-        return links
+                stack.extend(reversed(children))
 
     @classmethod
-    def from_file(cls, filepath, level=1):
-        '''creates a Section from a markdown file. Will recursively go through
-        sections inside the file and create Sections of them.
+    def from_file(cls, filepath, level=1, cache=None, node_type='section',
+                  fences=False):
+        '''creates a Section from a markdown file. Will go through sections
+        inside the file and create Sections of them. If a Parse_cache is
+        given, an unchanged file is loaded from it instead.
+
+        node_type "compact" makes a tree of Compact_sections, "mapped" one of
+        Compact_sections over a memory-mapped file (see compact.py). With
+        fences, "#" lines in fenced code blocks are not headings (see
+        tokenizer.py).
         '''
-        title = os.path.splitext(
-            os.path.basename(filepath))[0]
-        with open(filepath, 'r') as file:
-            md_string = file.read()
-        content, rest = cls._split_content(md_string)
-        child_level = level + 1
-        children = cls._get_children(rest, child_level)
-        return cls(title, content, children, level)
+        if cache is not None:
+            entry = cache.get(filepath, level, node_type, fences)
+            if entry is not None and entry['section'] is not None:
+                return entry['section']
+
+        if node_type == 'section':
+            title = os.path.splitext(
+                os.path.basename(filepath))[0]
+            with metrics.timer('read'):
+                with open(filepath, 'r') as file:
+                    md_string = file.read()
+            with metrics.timer('parse'):
+                section = cls.from_string(md_string, title, level, fences)
+            section.path = os.path.abspath(filepath)
+        else:
+            with metrics.timer('parse'):
+                section = cls._compact_file(filepath, level, node_type,
+                                            fences=fences)
+        metrics.count_file(section, filepath)
+
+        if cache is not None:
+            cache.put(filepath, level, section, node_type, fences)
+        return section
 
     @classmethod
-    def from_markdown_header(cls, md_string, level):
-        '''creates a Section from a markdown string. The string should start
-        with a header, otherwise use from_file()
+    def from_string(cls, md_string, title, level=1, fences=False):
+        '''creates a Section from a markdown string. The string is tokenized
+        in a single pass and the tree is built from heading offsets. With
+        fences, "#" lines in fenced code blocks are not headings.
         '''
-        title, rest = cls._split_title(md_string)
-        content, rest = cls._split_content(rest)
-        child_level = level + 1
-        children = cls._get_children(rest, child_level)
-        return cls(title, content, children, level)
+        return tokenizer.build_tree(md_string, title, level, cls,
+                                    fences=fences)
 
     @classmethod
-    def from_dir(cls, path, level=1):
-        '''creates a Section from a directory.
+    def from_dir(cls, path, level=1, workers=1, cache=None, lazy=False,
+                 node_type='section', fences=False):
+        '''creates a Section from a directory. Children are sorted by name.
+        If workers is more than 1, files are parsed in a pool of that many
+        processes. The resulting tree is the same either way. If a
+        Parse_cache is given, only files that changed are parsed.
+
+        With lazy, files are not parsed at all but added as Lazy_sections
+        that parse themselves when their content or children are needed.
+        node_type and fences are passed on to from_file().
         '''
-        title = os.path.basename(re.sub('/$', '', path))
-        content = ''
+        files = []
+        with metrics.timer('scan'):
+            layout = cls._scan_dir(path, level, files)
+
+        if lazy:
+            sections = [Lazy_section(filepath, file_level, cache, node_type,
+                                     fences)
+                        if cls.file_is_markdown(filepath) else None
+                        for filepath, file_level in files]
+            return cls._assemble(layout, sections)
+
+        sections = [None] * len(files)
+        todo = []
+        for idx, (filepath, file_level) in enumerate(files):
+            entry = cache.get(filepath, file_level, node_type, fences) \
+                if cache else None
+            if entry is not None:
+                sections[idx] = entry['section']
+            else:
+                todo.append(idx)
+        paths = [files[idx][0] for idx in todo]
+        levels = [files[idx][1] for idx in todo]
+        node_types = [node_type] * len(todo)
+        fenced = [fences] * len(todo)
+
+        with metrics.timer('load'):
+            if workers > 1 and len(todo) > 1:
+                chunksize = max(1, len(todo) // (workers * 4))
+                with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                    parsed = list(pool.map(cls._load_file, paths, levels,
+                                           node_types, fenced,
+                                           chunksize=chunksize))
+                # the workers count into their own copy of the metrics
+                if metrics.enabled:
+                    for filepath, section in zip(paths, parsed):
+                        metrics.count_file(section, filepath)
+            else:
+                parsed = list(map(cls._load_file, paths, levels,
+                                  node_types, fenced))
+
+        for idx, section in zip(todo, parsed):
+            sections[idx] = section
+            if cache is not None:
+                cache.put(*files[idx], section, node_type, fences)
+
+        return cls._assemble(layout, sections)
 
-        children = []
+    @classmethod
+    def _scan_dir(cls, path, level, files):
+        '''walks the directory and appends (filepath, level) of every file
+        with a valid extension to files. Returns a nested
+        (title, path, level, entries) tuple, where an entry is either an index
+        into files or the tuple of a subdirectory.
+        '''
+        title = os.path.basename(re.sub('/$', '', path))
+        entries = []
         child_level = level + 1
-        for child in os.listdir(path):
+        for child in sorted(os.listdir(path)):
             # ignore hidden files
             if child.startswith('.'):
                 continue
             child_path = os.path.join(path, child)
             if os.path.isfile(child_path) and \
                     child_path.endswith(cls.VALID_EXT):
-                if cls.file_is_markdown(child_path):
-                    children.append(cls.from_file(child_path, child_level))
+                entries.append(len(files))
+                files.append((child_path, child_level))
             elif os.path.isdir(child_path):
-                children.append(cls.from_dir(child_path, child_level))
-        return cls(title, content, children, level)
+                entries.append(cls._scan_dir(child_path, child_level, files))
+        return title, os.path.abspath(path), level, entries
 
     @classmethod
-    def _get_children(cls, md_string, level):
-        if md_string:
-            children = []
-            subsections = cls._split_sections(md_string)
-            for idx in range(len(subsections)):
-                child = cls.from_markdown_header(subsections[idx], level)
-                children.append(child)
-        else:
-            children = None
-
-        return children
-
-    @staticmethod
-    def _split_content(md_string):
-        '''splits a markdown section string into content below a heading, and
-        other headings. Input md_string has to start with a hashtag and the
-        first line will be treated as the title.
-
-        Returns a dictionary with title, content and rest. Leading and trailing
-        whitespace characters will be removed from title and content, and
-        leading from rest.
+    def _assemble(cls, layout, sections):
+        '''builds the directory Sections from the output of _scan_dir() and
+        the parsed files. Files that are not markdown are None and skipped.
         '''
-        regexp = '^#+|\\n#+'
-        has_headings = re.search(regexp, md_string)
-        if has_headings:
-            content = md_string[:has_headings.start()]
-            rest = md_string[has_headings.start():]
-            rest = rest.lstrip()
-        else:
-            content = md_string
-            rest = None
-
-        content = content.strip()
-
-        return content, rest
+        title, path, level, entries = layout
+        children = []
+        for entry in entries:
+            if isinstance(entry, tuple):
+                children.append(cls._assemble(entry, sections))
+            elif sections[entry] is not None:
+                children.append(sections[entry])
+        return cls(title, '', children, level, path)
 
     @classmethod
-    def _split_sections(cls, md_string):
-        '''splits a markdown string into sections of headings of the highest
-        level found. Returns a list of strings representing each section.
-        The newlines between sections are stripped.
+    def _load_file(cls, filepath, level, node_type='section', fences=False):
+        '''parses a file if it is markdown, otherwise returns None. Runs in
+        the worker processes of from_dir()
         '''
-        lvl = cls._find_highest_h(md_string)
-        hashtags = '#' + '{' + str(lvl) + '}' + '[^#]*?\\n'
-        regexpr = '|'.join(['\\n' + hashtags, '^' + hashtags])
-
-        headings = re.findall(regexpr, md_string)
-        content = re.split(regexpr, md_string)[1:]
-
-        result = [re.sub('^\\n', '', h) + c for h, c in zip(headings, content)]
-
-        return result
-
-    @staticmethod
-    def _split_title(md_string):
-        if not re.match('#', md_string):
-            raise ValueError('Error: input string should start '
-                             'with a "#" heading!')
-
-        split = md_string.split('\n', 1)
-        title, rest = split[0], split[1]
-        title = re.sub('#+ *', '', title)
-
-        return title, rest
+        if node_type == 'mapped':
+            # checks for headings on the same mapping it parses
+            with metrics.timer('parse'):
+                section = cls._compact_file(filepath, level, node_type,
+                                            markdown_only=True,
+                                            fences=fences)
+            metrics.count_file(section, filepath)
+            return section
+        if cls.file_is_markdown(filepath):
+            return cls.from_file(filepath, level, node_type=node_type,
+                                 fences=fences)
+        return None
 
     @staticmethod
-    def _find_highest_h(md_string):
-        '''returns int representing the lowest heading found in the markdown
-        string
-        '''
-        headings = re.findall(pattern='\n#+.*\n|^#+.*\n|^#+.*$',
-                              string=md_string)
-        counts = [len(re.search('#+', h).group()) for h in headings]
-        return(min(counts))
+    def _compact_file(filepath, level, node_type, markdown_only=False,
+                      fences=False):
+        # imported here because the compact module imports this one
+        from memit.markdown_parser.compact import Compact_section
+        return Compact_section.from_file(filepath, level,
+                                         mapped=node_type == 'mapped',
+                                         markdown_only=markdown_only,
+                                         fences=fences)
 
     @staticmethod
     def file_is_markdown(path):
         is_markdown = False
-        with open(path, 'r') as file:
+        with metrics.timer('detect'), open(path, 'r') as file:
             for line in file:
                 if line.startswith('#'):
                     is_markdown = True
@@ -264,30 +336,123 @@ class Section():
         return is_markdown
 
 
+class Lazy_section(Section):
+    '''Section of a markdown file that is only parsed once its content or
+    children are needed. Title, level and path are known without parsing.
+    '''
+
+    # a file can be loaded by a background loader and the UI thread at once
+    _load_lock = threading.Lock()
+
+    def __init__(self, filepath, level, cache=None, node_type='section',
+                 fences=False):
+        self.title = os.path.splitext(os.path.basename(filepath))[0]
+        self.level = level
+        self.path = os.path.abspath(filepath)
+        self._cache = cache
+        self._node_type = node_type
+        self._fences = fences
+        self._section = None
+        # called with the section once it is loaded, see on_load()
+        self._callbacks = None
+
+    @property
+    def content(self):
+        return self.load().content
+
+    @property
+    def children(self):
+        return self.load().children
+
+    def is_loaded(self):
+        return self._section is not None
+
+    def on_load(self, callback):
+        '''calls callback(self) once the file is loaded, right away if it is.
+        It is called by the thread that loads the file
+        '''
+        with self._load_lock:
+            if self._section is None:
+                if self._callbacks is None:
+                    self._callbacks = []
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def load(self):
+        '''parses the file unless it was parsed before and returns its
+        Section
+        '''
+        callbacks = None
+        if self._section is None:
+            with self._load_lock:
+                if self._section is None:
+                    self._section = Section.from_file(
+                        self.path, self.level, self._cache, self._node_type,
+                        self._fences)
+                    callbacks, self._callbacks = self._callbacks, None
+        for callback in callbacks or ():
+            callback(self)
+        return self._section
+
+
 if __name__ == '__main__':
     import argparse
+    import sys
+    from memit.markdown_parser.cache import Parse_cache
+    # use the importable class, otherwise cached and worker pickles would
+    # refer to __main__.Section
+    from memit.markdown_parser.Section import Section
 
     parser = argparse.ArgumentParser()
 
     path = parser.add_mutually_exclusive_group(required=True)
     path.add_argument('--filepath', '-f')
     path.add_argument('--dir', '-d')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='number of processes for parsing a directory')
+    parser.add_argument('--cache-dir', default=None,
+                        help='cache parsed files in this directory')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='remove all cached files before parsing')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the time of every phase, counts and '
+                        'cache hit rates to stderr')
 
     output = parser.add_mutually_exclusive_group(required=True)
     output.add_argument('--json', action='store_true')
     output.add_argument('--graph', action='store_true')
+    parser.add_argument('--stream', action='store_true',
+                        help='write the --graph output while walking the '
+                        'tree instead of building it first')
 
     args = parser.parse_args()
 
+    if args.stats:
+        metrics.enable()
+    cache = Parse_cache(args.cache_dir) if args.cache_dir else None
+    if cache and args.clear_cache:
+        cache.invalidate()
+
     if args.filepath:
-        result = Section.from_file(args.filepath)
+        result = Section.from_file(args.filepath, cache=cache)
     elif args.dir:
-        result = Section.from_dir(args.dir)
+        result = Section.from_dir(args.dir, workers=args.workers, cache=cache)
 
-    if args.json:
-        result = result.to_JSON()
-    if args.graph:
-        graph = result.get_graph_repr()
-        result = json.dumps(graph, default=lambda x: x.to_dict())
+    if cache:
+        cache.save()
+        print(cache.format_stats(), file=sys.stderr)
 
-    print(result)
+    with metrics.timer('output'):
+        if args.graph and args.stream:
+            result.write_graph(sys.stdout)
+            print()
+        else:
+            if args.json:
+                result = result.to_JSON()
+            if args.graph:
+                result = json.dumps(result.get_graph_repr())
+            print(result)
+
+    if args.stats:
+        print(metrics.format_stats(), file=sys.stderr)
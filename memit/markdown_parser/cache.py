@@ -0,0 +1,243 @@
+'''On-disk cache of parsed markdown files. Every source file gets one pickle
+file in the cache directory holding its Section tree, the chunks extracted
+from it and the words of its nodes for the search index. An entry is valid
+as long as the mtime and size of the source file did not change. With
+use_hash, the sha1 of the file content is compared instead, so touching a
+file does not invalidate its entry.
+
+A Parse_cache can be shared by threads, e.g. the UI thread and a
+loader.Background_loader, its methods hold a lock.
+'''
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+from memit.markdown_parser import metrics
+
+
+log = logging.getLogger('memit.markdown_parser')
+
+# bump this when the pickled classes change in an incompatible way
+CACHE_VERSION = 5
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'memit')
+
+
+class Parse_cache():
+
+    def __init__(self, directory=None, use_hash=False):
+        self.directory = directory or default_cache_dir()
+        self.use_hash = use_hash
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'errors': 0,
+            'writes': 0
+        }
+        self._entries = {}
+        self._stat = {}
+        self._nodes = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def get(self, filepath, level, node_type='section', fences=False):
+        '''returns the cached entry of a file, a dict with the parsed
+        "section" (None if the file is not markdown) and extracted "chunks".
+        Returns None if there is no valid entry. node_type and fences are the
+        ones passed to Section.from_file().
+        '''
+        filepath = os.path.abspath(filepath)
+        stat = self._file_stat(filepath)
+        missed = None
+        try:
+            with open(self._cache_path(filepath), 'rb') as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            missed = 'misses'
+        except Exception:
+            log.warning('could not read cache entry for %s', filepath)
+            missed = 'errors'
+        else:
+            if entry.get('version') != CACHE_VERSION or \
+                    entry.get('path') != filepath or \
+                    entry.get('level') != level or \
+                    entry.get('node_type') != node_type or \
+                    entry.get('fences', False) != fences or \
+                    not self._is_fresh(entry, stat):
+                missed = 'stale'
+
+        with self._lock:
+            self._stat[filepath] = stat
+            if missed is not None:
+                self.stats[missed] += 1
+                metrics.count('cache.misses')
+                return None
+            self.stats['hits'] += 1
+            metrics.count('cache.hits')
+            self._register(entry)
+        return entry
+
+    def put(self, filepath, level, section, node_type='section',
+            fences=False):
+        '''adds a parsed file. The file stat recorded by the get() call before
+        parsing is used, so a file that changes while it is parsed gets
+        re-parsed next time.
+        '''
+        filepath = os.path.abspath(filepath)
+        with self._lock:
+            stat = self._stat.pop(filepath, None)
+        if stat is None:
+            stat = self._file_stat(filepath)
+        entry = {
+            'version': CACHE_VERSION,
+            'path': filepath,
+            'level': level,
+            'node_type': node_type,
+            'fences': fences,
+            'mtime': stat['mtime'],
+            'size': stat['size'],
+            'hash': stat['hash'],
+            'section': section,
+            'chunks': {},
+            'words': None
+        }
+        with self._lock:
+            self._register(entry)
+            self._dirty.add(filepath)
+        return entry
+
+    def get_chunk(self, node, chunk_type):
+        '''returns the cached chunk of a node, or None
+        '''
+        with self._lock:
+            found = self._nodes.get(node)
+            if found is None:
+                return None
+            entry, idx = found
+            chunks = entry['chunks'].get(chunk_type)
+            return chunks[idx] if chunks else None
+
+    def put_chunk(self, node, chunk_type, chunk):
+        '''stores the chunk of a node. Nodes that do not come from a cached
+        file (e.g. directories) are ignored.
+        '''
+        with self._lock:
+            found = self._nodes.get(node)
+            if found is None:
+                return
+            entry, idx = found
+            if chunk_type not in entry['chunks']:
+                size = len(entry['section'].get_all_nodes())
+                entry['chunks'][chunk_type] = [None] * size
+            entry['chunks'][chunk_type][idx] = chunk
+            self._dirty.add(entry['path'])
+
+    def get_words(self, node):
+        '''returns the cached search words of a node, or None
+        '''
+        with self._lock:
+            found = self._nodes.get(node)
+            if found is None:
+                return None
+            entry, idx = found
+            words = entry['words']
+            return words[idx] if words else None
+
+    def put_words(self, node, words):
+        '''stores the search words of a node, like put_chunk()
+        '''
+        with self._lock:
+            found = self._nodes.get(node)
+            if found is None:
+                return
+            entry, idx = found
+            if entry['words'] is None:
+                entry['words'] = \
+                    [None] * len(entry['section'].get_all_nodes())
+            entry['words'][idx] = words
+            self._dirty.add(entry['path'])
+
+    def save(self):
+        '''writes all new and changed entries to disk
+        '''
+        # entries do not change while they are pickled
+        with self._lock:
+            for filepath in sorted(self._dirty):
+                entry = self._entries[filepath]
+                cache_path = self._cache_path(filepath)
+                tmp_path = cache_path + '.tmp'
+                with open(tmp_path, 'wb') as file:
+                    pickle.dump(entry, file,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, cache_path)
+                self.stats['writes'] += 1
+            self._dirty.clear()
+
+    def invalidate(self, filepath=None):
+        '''removes the entry of a file, or all entries if filepath is None
+        '''
+        if filepath is not None:
+            paths = [self._cache_path(os.path.abspath(filepath))]
+        else:
+            paths = [os.path.join(self.directory, name)
+                     for name in os.listdir(self.directory)
+                     if name.endswith('.pickle')]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses'] + \
+            self.stats['stale'] + self.stats['errors']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def format_stats(self):
+        return ('cache {}: {hits} hits, {misses} misses, {stale} stale, '
+                '{errors} errors, {writes} writes ({rate:.0%} hit rate)'
+                .format(self.directory, rate=self.hit_rate(), **self.stats))
+
+    def _register(self, entry):
+        old = self._entries.get(entry['path'])
+        if old is not None and old is not entry and \
+                old['section'] is not None:
+            # a re-parsed file, its old tree is not used any more
+            for node in old['section'].get_all_nodes():
+                self._nodes.pop(node, None)
+        self._entries[entry['path']] = entry
+        if entry['section'] is not None:
+            for idx, node in enumerate(entry['section'].get_all_nodes()):
+                self._nodes[node] = (entry, idx)
+
+    def _is_fresh(self, entry, stat):
+        if self.use_hash:
+            return entry['hash'] is not None and entry['hash'] == stat['hash']
+        return entry['mtime'] == stat['mtime'] and \
+            entry['size'] == stat['size']
+
+    def _file_stat(self, filepath):
+        stat = os.stat(filepath)
+        result = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': None
+        }
+        if self.use_hash:
+            with open(filepath, 'rb') as file:
+                result['hash'] = hashlib.sha1(file.read()).hexdigest()
+        return result
+
+    def _cache_path(self, filepath):
+        name = hashlib.sha1(filepath.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.pickle')
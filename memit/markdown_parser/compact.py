@@ -0,0 +1,353 @@
+'''Memory-compact versions of Section and Code_chunk. All nodes of a file
+share one Compact_buffer: the file string plus an array with the offsets of
+every node and chunk. A node only keeps its index into that array and the
+content is sliced out when it is asked for. Titles and syntax names are
+interned, so repeated titles are stored once and a chunk shares its title
+with its section.
+
+A Mapped_buffer memory-maps the file instead of reading it. Headings are
+found on the bytes and only the parts that are used get decoded, so a file is
+never held as a whole Python string. The mapping is closed once the file is
+parsed and the file is mapped again when it is read. Only the mappings of the
+last few files read stay open, so a big tree does not keep a file descriptor
+per file open.
+
+Compact_section has the same interface as Section (get_content, get_title,
+get_children, ...), so Chunk_tree and the exporters work with both. Files are
+loaded with Section.from_file() or Section.from_dir() with node_type "compact"
+or "mapped".
+'''
+
+import array
+import collections
+import contextlib
+import locale
+import mmap
+import os
+import sys
+import threading
+
+from memit.markdown_parser import fences, tokenizer
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.Chunk import Chunk, Code_chunk, chunk_factory
+
+
+class Compact_buffer():
+    '''the string of a file and the offsets of its nodes and chunks
+    '''
+
+    __slots__ = ('string', 'offsets')
+
+    def __init__(self, string):
+        self.string = string
+        self.offsets = array.array('q')
+
+    def add(self, *offsets):
+        '''stores offsets and returns the index of the first one
+        '''
+        index = len(self.offsets)
+        self.offsets.extend(offsets)
+        return index
+
+    def slice(self, index):
+        '''string between the offsets at index and index + 1
+        '''
+        return self.string[self.offsets[index]:self.offsets[index + 1]]
+
+    def decode(self, data):
+        '''turns a part of the buffer into a string'''
+        return data
+
+    def mapped(self):
+        '''context manager giving the string of the buffer'''
+        return contextlib.nullcontext(self.string)
+
+    def close(self):
+        pass
+
+    def is_markdown(self):
+        '''same as Section.file_is_markdown()'''
+        return self.string.startswith('#') or self.string.find('\n#') != -1
+
+
+# Mapped_buffer -> _Open_map of the files read last. At most _MAX_OPEN of
+# them stay open when no one reads them
+_MAX_OPEN = 32
+_open_maps = collections.OrderedDict()
+_open_lock = threading.Lock()
+
+
+def _close_unused():
+    if len(_open_maps) <= _MAX_OPEN:
+        return
+    for buffer, entry in list(_open_maps.items()):
+        if len(_open_maps) <= _MAX_OPEN:
+            break
+        if entry.readers == 0:
+            entry.mapping.close()
+            del _open_maps[buffer]
+
+
+class _Open_map():
+    '''the mapping of a Mapped_buffer as a context manager. mapped() counts
+    the reader in, leaving the with block counts it out
+    '''
+
+    __slots__ = ('mapping', 'readers')
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.readers = 0
+
+    def __enter__(self):
+        return self.mapping
+
+    def __exit__(self, *exc_info):
+        with _open_lock:
+            self.readers -= 1
+            _close_unused()
+
+
+class Mapped_buffer(Compact_buffer):
+    '''a memory-mapped file. Slices are decoded as UTF-8 when they are used,
+    undecodable bytes are replaced. string is the mapping until close(), use
+    mapped() to read the file after that.
+    '''
+
+    __slots__ = ('path',)
+
+    def __init__(self, path, mapping=None):
+        super().__init__(mapping)
+        self.path = path
+
+    @classmethod
+    def open(cls, filepath):
+        '''returns None if the file can not be mapped: when it is empty, or
+        when reading it as text would give a different string than decoding
+        its bytes (newline translation, other locale encoding)
+        '''
+        encoding = locale.getpreferredencoding(False).lower()
+        if encoding.replace('-', '') != 'utf8':
+            return None
+        with open(filepath, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return None
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapping.find(b'\r') != -1:
+            mapping.close()
+            return None
+        return cls(filepath, mapping)
+
+    def close(self):
+        '''closes the mapping used for parsing'''
+        if self.string is not None:
+            self.string.close()
+            self.string = None
+
+    def mapped(self):
+        '''context manager giving the mapping of the file, which is reused
+        by the next reads. A file that is gone or empty gives b'', until
+        the watcher parses it again
+        '''
+        if self.string is not None:
+            return contextlib.nullcontext(self.string)
+        with _open_lock:
+            entry = _open_maps.get(self)
+            if entry is None:
+                try:
+                    with open(self.path, 'rb') as file:
+                        mapping = mmap.mmap(file.fileno(), 0,
+                                            access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    return contextlib.nullcontext(b'')
+                entry = _open_maps[self] = _Open_map(mapping)
+            else:
+                _open_maps.move_to_end(self)
+            entry.readers += 1
+            _close_unused()
+        return entry
+
+    def slice(self, index):
+        with self.mapped() as string:
+            data = string[self.offsets[index]:self.offsets[index + 1]]
+        return self.decode(data)
+
+    def decode(self, data):
+        return data.decode('utf-8', errors='replace')
+
+    def is_markdown(self):
+        return self.string[:1] == b'#' or self.string.find(b'\n#') != -1
+
+    def __reduce__(self):
+        # the cache only stores the offsets, the file is mapped again when
+        # it is read. The cache checks that the file did not change
+        return _unpickle_mapped, (self.path, self.offsets)
+
+
+def _unpickle_mapped(path, offsets):
+    buffer = Mapped_buffer(path)
+    buffer.offsets = offsets
+    return buffer
+
+
+class Compact_section():
+
+    __slots__ = ('buffer', 'index', 'title', 'children', 'level', 'path')
+
+    def __init__(self, buffer, title, start, end, children, level,
+                 path=None):
+        self.buffer = buffer
+        self.index = buffer.add(start, end)
+        self.title = sys.intern(title)
+        self.children = children
+        self.level = level
+        self.path = path
+
+    @classmethod
+    def from_string(cls, md_string, title, level=1, fences=False):
+        '''creates the same tree as Section.from_string(), with all nodes
+        pointing into md_string
+        '''
+        return cls.from_buffer(Compact_buffer(md_string), title, level,
+                               fences)
+
+    @classmethod
+    def from_buffer(cls, buffer, title, level=1, fences=False):
+        def factory(title, start, end, children, level):
+            return cls(buffer, title, start, end, children, level)
+
+        return tokenizer.build_spans(buffer.string, title, level, factory,
+                                     decode=buffer.decode, fences=fences)
+
+    @classmethod
+    def from_file(cls, filepath, level=1, mapped=False, markdown_only=False,
+                  fences=False):
+        '''creates a compact tree of a file. With mapped, the file is
+        memory-mapped if possible. With markdown_only, None is returned for a
+        file without headings, like Section.file_is_markdown(), but without
+        reading the file twice.
+        '''
+        buffer = Mapped_buffer.open(filepath) if mapped else None
+        if buffer is None:
+            with open(filepath, 'r') as file:
+                buffer = Compact_buffer(file.read())
+        try:
+            if markdown_only and not buffer.is_markdown():
+                return None
+            title = os.path.splitext(os.path.basename(filepath))[0]
+            section = cls.from_buffer(buffer, title, level, fences)
+        finally:
+            buffer.close()
+        section.path = os.path.abspath(filepath)
+        return section
+
+    @property
+    def content(self):
+        return self.buffer.slice(self.index).strip()
+
+    def get_span(self):
+        '''offsets of the content in the file string, before stripping'''
+        offsets = self.buffer.offsets
+        return offsets[self.index], offsets[self.index + 1]
+
+    def has_marker(self, markers=('```',)):
+        '''True if the content has one of the markers (see Chunk.markers()),
+        found without decoding it
+        '''
+        start, end = self.get_span()
+        with self.buffer.mapped() as string:
+            for marker in markers:
+                if not isinstance(string, str):
+                    marker = marker.encode('utf-8')
+                if string.find(marker, start, end) != -1:
+                    return True
+        return False
+
+    def make_chunk(self, chunk_type):
+        '''chunk of this section. For "code" the chunk points into the buffer
+        as well, other types are made by chunk_factory()
+        '''
+        if chunk_type == 'code':
+            return Compact_code_chunk.from_section(self)
+        return chunk_factory(self.content, self.title, chunk_type)
+
+    # the rest only reads attributes, so it is shared with Section
+    get_content = Section.get_content
+    get_title = Section.get_title
+    get_children = Section.get_children
+    get_level = Section.get_level
+    get_path = Section.get_path
+    is_loaded = Section.is_loaded
+    to_JSON = Section.to_JSON
+    to_dict_recursive = Section.to_dict_recursive
+    to_dict = Section.to_dict
+    get_graph_repr = Section.get_graph_repr
+    iter_graph = Section.iter_graph
+    write_graph = Section.write_graph
+    get_all_nodes = Section.get_all_nodes
+    iter_nodes = Section.iter_nodes
+
+
+class Compact_code_chunk(Chunk):
+    '''same result as Code_chunk, but the prompt and the code are offsets in
+    the buffer of the section. Only when the matched code spans several
+    fenced blocks is the code kept as a string.
+    '''
+
+    __slots__ = ('buffer', 'index', 'title', 'syntax', '_code')
+
+    def __init__(self, buffer, title, syntax=None, prompt=None, code=None):
+        '''prompt and code are (start, end) offsets, code can also be a
+        string. Without a prompt the chunk is empty.
+        '''
+        self.buffer = buffer
+        self.title = title
+        self.syntax = sys.intern(syntax) if syntax else None
+        self.index = None
+        self._code = None
+        if prompt is not None:
+            if isinstance(code, str):
+                self._code = code
+                self.index = buffer.add(*prompt)
+            else:
+                self.index = buffer.add(*prompt, *code)
+
+    @classmethod
+    def from_section(cls, section):
+        buffer = section.buffer
+        start, end = section.get_span()
+        with buffer.mapped() as string:
+            block = fences.find_code(string, start, end)
+            if not block:
+                return cls(buffer, section.title)
+
+            ticks = '```' if isinstance(string, str) else b'```'
+            syntax = fences.syntax(string, block)
+            syntax = buffer.decode(syntax) if syntax else None
+            code = (block.code_start, block.code_end + 1)
+            if string.find(ticks, *code) != -1:
+                # several blocks, do exactly what Code_chunk does
+                code = buffer.decode(string[block.start:block.end])
+                code = fences.strip_fences(code)
+            prompt = (start, string.find(ticks, start))
+        return cls(buffer, section.title, syntax, prompt, code)
+
+    @property
+    def code(self):
+        if self.index is None:
+            return None
+        if self._code is not None:
+            return self._code.strip() or None
+        return self.buffer.slice(self.index + 2).strip() or None
+
+    @property
+    def prompt(self):
+        if self.index is None:
+            return None
+        return self.buffer.slice(self.index).strip() or None
+
+    get_content = Code_chunk.get_content
+    get_syntax = Code_chunk.get_syntax
+    get_title = Code_chunk.get_title
+    get_prompt = Code_chunk.get_prompt
+    to_JSON = Code_chunk.to_JSON
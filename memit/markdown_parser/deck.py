@@ -0,0 +1,331 @@
+'''Precompiled decks. build_deck() writes the flattened Section tree of a file
+or directory and its chunks into one binary file. A Deck_file memory-maps
+it: opening a deck only reads the header, nodes and chunks are read from the
+mapped tables when they are used, so nothing is parsed at startup.
+
+Layout of a deck, integers in the byte order of the machine that built it:
+
+    header      magic, byte order, version, counts and table offsets
+    nodes       NODE_FIELDS int32 per section, in depth-first order
+    chunks      CHUNK_FIELDS int32 per chunk with content
+    offsets     int64 start of every string and the end of the last one
+    strings     UTF-8 string table, equal strings are stored once
+
+Strings are referenced by their index in the string table, -1 is None. The
+chunks of a node are a range of the chunk table, so the number of chunks of
+a node is its number of cards.
+
+Decks are built with
+
+    python -m memit.markdown_parser.deck build-deck notes/ -o notes.deck
+'''
+
+import argparse
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser.Section import Section
+
+
+MAGIC = b'MEMITDCK'
+VERSION = 1
+# magic, byte order, version, number of nodes, chunks and strings, chunk
+# type string, offsets of the nodes, chunks, offsets and strings tables
+_HEADER = struct.Struct('=8sB3xI8Q')
+
+PARENT, LEVEL, TITLE, CONTENT, PATH, NEXT, FIRST_CHUNK, CARDS, \
+    CARDS_BELOW = range(9)
+NODE_FIELDS = 9
+CHUNK_TITLE, PROMPT, CHUNK_CONTENT, SYNTAX, JSON = range(5)
+CHUNK_FIELDS = 5
+
+
+class _String_table():
+
+    def __init__(self):
+        self.ids = {}
+        self.parts = []
+        self.offsets = array.array('q', [0])
+
+    def add(self, string):
+        if string is None:
+            return -1
+        index = self.ids.get(string)
+        if index is None:
+            data = string.encode('utf-8')
+            index = self.ids[string] = len(self.parts)
+            self.parts.append(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+        return index
+
+
+def _pad(size):
+    return b'\0' * (-size % 8)
+
+
+def build_deck(section, filepath, chunk_type='code'):
+    '''writes the deck of a Section tree to filepath. The file is replaced
+    at once, so apps that have the old deck open keep working. Returns the
+    number of nodes and of chunks
+    '''
+    nodes = []
+    parents = []
+    stack = [(section, -1)]
+    while stack:
+        node, parent = stack.pop()
+        position = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+        children = node.get_children()
+        if children:
+            stack.extend((child, position) for child in reversed(children))
+
+    chunks = ch.chunk_batch([node.get_content() for node in nodes],
+                            [node.get_title() for node in nodes],
+                            chunk_type)
+    chunks = [[c for c in (chunk if isinstance(chunk, list) else [chunk])
+               if c.get_content()]
+              for chunk in chunks]
+
+    strings = _String_table()
+    node_table = array.array('i', [0] * (len(nodes) * NODE_FIELDS))
+    chunk_table = array.array('i')
+    last_child = {}
+    for position, (node, parent) in enumerate(zip(nodes, parents)):
+        row = position * NODE_FIELDS
+        node_table[row + PARENT] = parent
+        node_table[row + LEVEL] = node.get_level()
+        node_table[row + TITLE] = strings.add(node.get_title())
+        node_table[row + CONTENT] = strings.add(node.get_content())
+        node_table[row + PATH] = strings.add(node.get_path())
+        node_table[row + NEXT] = -1
+        node_table[row + FIRST_CHUNK] = len(chunk_table) // CHUNK_FIELDS
+        node_table[row + CARDS] = len(chunks[position])
+        if parent in last_child:
+            node_table[last_child[parent] * NODE_FIELDS + NEXT] = position
+        last_child[parent] = position
+        for chunk in chunks[position]:
+            get_syntax = getattr(chunk, 'get_syntax', None)
+            chunk_table.extend((
+                strings.add(chunk.get_title()),
+                strings.add(chunk.get_prompt()),
+                strings.add(chunk.get_content()),
+                strings.add(get_syntax() if get_syntax else None),
+                strings.add(json.dumps(chunk.to_JSON()))))
+    # children come after their parent, go backwards to count them first
+    for position in range(len(nodes) - 1, -1, -1):
+        row = position * NODE_FIELDS
+        node_table[row + CARDS_BELOW] += node_table[row + CARDS]
+        parent = parents[position]
+        if parent != -1:
+            node_table[parent * NODE_FIELDS + CARDS_BELOW] += \
+                node_table[row + CARDS_BELOW]
+
+    type_index = strings.add(chunk_type)
+    tables = [node_table.tobytes(), chunk_table.tobytes(),
+              strings.offsets.tobytes(), b''.join(strings.parts)]
+    starts = []
+    offset = _HEADER.size
+    for table in tables:
+        starts.append(offset)
+        offset += len(table) + len(_pad(len(table)))
+    header = _HEADER.pack(MAGIC, sys.byteorder == 'big', VERSION,
+                          len(nodes), len(chunk_table) // CHUNK_FIELDS,
+                          len(strings.parts), type_index, *starts)
+
+    temp_path = filepath + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(header)
+        for table in tables:
+            file.write(table)
+            file.write(_pad(len(table)))
+    os.replace(temp_path, filepath)
+    return len(nodes), len(chunk_table) // CHUNK_FIELDS
+
+
+class Deck_file():
+    '''a memory-mapped deck. Raises ValueError for a file that is not a deck
+    of this version and byte order
+    '''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, big_endian, version, self.node_count, self.chunk_count, \
+                string_count, type_index, *starts = \
+                _HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = None
+        if magic != MAGIC or version != VERSION or \
+                big_endian != (sys.byteorder == 'big'):
+            self._map.close()
+            raise ValueError('not a deck of this version: ' + filepath)
+
+        view = memoryview(self._map)
+        ends = [starts[0] + self.node_count * NODE_FIELDS * 4,
+                starts[1] + self.chunk_count * CHUNK_FIELDS * 4,
+                starts[2] + (string_count + 1) * 8]
+        self.nodes = view[starts[0]:ends[0]].cast('i')
+        self.chunks = view[starts[1]:ends[1]].cast('i')
+        self.offsets = view[starts[2]:ends[2]].cast('q')
+        self._strings_start = starts[3]
+        self._views = [view, self.nodes, self.chunks, self.offsets]
+        self.chunk_type = self.string(type_index)
+
+    def close(self):
+        # the views have to go before the map can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._map.close()
+
+    def __len__(self):
+        return self.node_count
+
+    def string(self, index):
+        if index < 0:
+            return None
+        start = self._strings_start + self.offsets[index]
+        end = self._strings_start + self.offsets[index + 1]
+        return self._map[start:end].decode('utf-8')
+
+    def node_field(self, position, field):
+        return self.nodes[position * NODE_FIELDS + field]
+
+    def chunk_field(self, index, field):
+        return self.chunks[index * CHUNK_FIELDS + field]
+
+    def root(self):
+        return Deck_section(self, 0)
+
+
+class Deck_section():
+    '''a node of a Deck_file, with the interface of Section. Everything is
+    read from the deck when it is asked for
+    '''
+
+    __slots__ = ('deck', 'position')
+
+    def __init__(self, deck, position):
+        self.deck = deck
+        self.position = position
+
+    def get_title(self):
+        return self.deck.string(self.deck.node_field(self.position, TITLE))
+
+    def get_content(self):
+        return self.deck.string(self.deck.node_field(self.position, CONTENT))
+
+    def get_level(self):
+        return self.deck.node_field(self.position, LEVEL)
+
+    def get_path(self):
+        return self.deck.string(self.deck.node_field(self.position, PATH))
+
+    def get_children(self):
+        deck = self.deck
+        child = self.position + 1
+        if child >= len(deck) or deck.node_field(child, PARENT) != \
+                self.position:
+            return []
+        children = []
+        while child != -1:
+            children.append(Deck_section(deck, child))
+            child = deck.node_field(child, NEXT)
+        return children
+
+    def is_loaded(self):
+        return True
+
+    def card_counts(self):
+        '''number of cards of this node and of it and all nodes below it'''
+        return (self.deck.node_field(self.position, CARDS),
+                self.deck.node_field(self.position, CARDS_BELOW))
+
+    def has_marker(self, markers=None):
+        '''the chunks are known, True if there are any'''
+        return self.deck.node_field(self.position, CARDS) > 0
+
+    def make_chunk(self, chunk_type):
+        '''list of the Deck_chunks of this node. The chunk type has to be
+        the one the deck was built with
+        '''
+        if chunk_type != self.deck.chunk_type:
+            raise ValueError('the deck has chunk type ' +
+                             self.deck.chunk_type)
+        first = self.deck.node_field(self.position, FIRST_CHUNK)
+        cards = self.deck.node_field(self.position, CARDS)
+        return [Deck_chunk(self.deck, index)
+                for index in range(first, first + cards)]
+
+
+class Deck_chunk(ch.Chunk):
+    '''a chunk of a Deck_file, read from the deck when it is used'''
+
+    __slots__ = ('deck', 'index')
+
+    def __init__(self, deck, index):
+        self.deck = deck
+        self.index = index
+
+    def _string(self, field):
+        return self.deck.string(self.deck.chunk_field(self.index, field))
+
+    def get_title(self):
+        return self._string(CHUNK_TITLE)
+
+    def get_prompt(self):
+        return self._string(PROMPT)
+
+    def get_content(self):
+        return self._string(CHUNK_CONTENT)
+
+    def get_syntax(self):
+        return self._string(SYNTAX)
+
+    def to_JSON(self):
+        return json.loads(self._string(JSON))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build-deck',
+                                help='compile a markdown file or directory')
+    build.add_argument('path', help='markdown file or directory')
+    build.add_argument('--output', '-o', required=True)
+    build.add_argument('--chunk-type', '-c', default='code')
+    build.add_argument('--workers', '-w', type=int, default=1,
+                       help='number of processes for parsing a directory')
+    build.add_argument('--fences', action='store_true',
+                       help='do not treat "#" lines inside fenced code '
+                       'blocks as headings')
+    info = commands.add_parser('info', help='show what a deck contains')
+    info.add_argument('deck')
+    args = parser.parse_args()
+
+    if args.command == 'build-deck':
+        try:
+            ch.markers(args.chunk_type)
+        except ValueError:
+            parser.error('unknown chunk type: ' + args.chunk_type)
+        if os.path.isdir(args.path):
+            section = Section.from_dir(args.path, workers=args.workers,
+                                       fences=args.fences)
+        else:
+            section = Section.from_file(args.path, fences=args.fences)
+        node_count, chunk_count = build_deck(section, args.output,
+                                             args.chunk_type)
+        print('{} nodes, {} chunks'.format(node_count, chunk_count))
+    else:
+        deck = Deck_file(args.deck)
+        print('chunk type {}, {} nodes, {} chunks, {} bytes'.format(
+            deck.chunk_type, len(deck), deck.chunk_count,
+            os.path.getsize(args.deck)))
+        deck.close()
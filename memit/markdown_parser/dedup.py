@@ -0,0 +1,117 @@
+'''Content-addressed chunks. chunk_key() is a hash of the normalized prompt
+and code of a chunk, so copies of a snippet in several files or under
+different headings are the same card. A Chunk_pool keeps one canonical chunk
+per key that all copies share, and does not extract a section content it has
+seen before again. A Chunk_pool can be shared by threads.
+'''
+
+import hashlib
+import threading
+
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser import metrics
+
+
+def normalize(text):
+    '''text with unix newlines, without trailing whitespace on its lines and
+    without leading and trailing empty lines
+    '''
+    if not text:
+        return ''
+    lines = text.replace('\r\n', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def chunk_key(chunk):
+    '''sha1 hex digest of the normalized prompt and code of a chunk. The
+    title and the syntax are not part of it
+    '''
+    key = hashlib.sha1(normalize(chunk.get_prompt()).encode('utf-8'))
+    key.update(b'\0')
+    key.update(normalize(chunk.get_content()).encode('utf-8'))
+    return key.hexdigest()
+
+
+def content_key(string, chunk_type):
+    '''sha1 digest of a section content and a chunk type'''
+    key = hashlib.sha1(chunk_type.encode('utf-8'))
+    key.update(b'\0')
+    key.update(string.encode('utf-8'))
+    return key.digest()
+
+
+def unique_cards(cards):
+    '''yields the (heading path, chunk) cards whose chunk key was not seen
+    before, so the first occurrence of a chunk wins
+    '''
+    seen = set()
+    for heading_path, chunk in cards:
+        key = chunk_key(chunk)
+        if key not in seen:
+            seen.add(key)
+            yield heading_path, chunk
+
+
+class Chunk_pool():
+    '''one canonical chunk per chunk_key(). Chunks without content are not
+    cards and are never shared
+    '''
+
+    def __init__(self):
+        self._chunks = {}
+        # content_key() of a section content -> chunk or list of chunks
+        self._contents = {}
+        # reused counts the sections that were not extracted again
+        self.stats = {
+            'unique': 0,
+            'duplicates': 0,
+            'reused': 0
+        }
+        # canonical() calls itself for lists and groups
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def canonical(self, chunk):
+        '''the first chunk added with the same key as chunk, or chunk itself.
+        A list of chunks (see chunk_factory()) gets its chunks replaced
+        '''
+        if isinstance(chunk, list):
+            return [self.canonical(c) for c in chunk]
+        if isinstance(chunk, ch.Chunk_group):
+            return ch.Chunk_group(self.canonical(chunk.chunks), chunk.title)
+        if not chunk.get_content():
+            return chunk
+        key = chunk_key(chunk)
+        with self._lock:
+            found = self._chunks.setdefault(key, chunk)
+            if found is chunk:
+                self.stats['unique'] += 1
+            else:
+                self.stats['duplicates'] += 1
+                metrics.count('duplicate chunks')
+        return found
+
+    def chunk_batch(self, strings, titles, chunk_type):
+        '''like Chunk.chunk_batch(), but contents that were seen before are
+        not extracted again, and the chunks are canonical
+        '''
+        keys = [content_key(string, chunk_type) for string in strings]
+        with self._lock:
+            chunks = [self._contents.get(key) for key in keys]
+            todo = [idx for idx, chunk in enumerate(chunks) if chunk is None]
+            self.stats['reused'] += len(strings) - len(todo)
+        # extracted without the lock, another thread may add the same
+        # content meanwhile and the later one is kept
+        made = ch.chunk_batch([strings[idx] for idx in todo],
+                              [titles[idx] for idx in todo], chunk_type)
+        with self._lock:
+            for idx, chunk in zip(todo, made):
+                chunk = self.canonical(chunk)
+                has_cards = chunk if isinstance(chunk, list) \
+                    else chunk.get_content()
+                if has_cards:
+                    self._contents[keys[idx]] = chunk
+                chunks[idx] = chunk
+        return chunks
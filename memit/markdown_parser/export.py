@@ -0,0 +1,214 @@
+'''Streaming export of the chunks of a file or directory, one record per
+line, as JSON lines or as a CSV file Anki can import. Files are parsed one at
+a time in a generator pipeline (files -> sections -> chunks -> records), so
+memory is bounded by the largest file and records are written while the
+directory is still being parsed.
+
+usage:
+    python -m memit.markdown_parser.export notes -o deck.csv --format anki
+'''
+
+import argparse
+import csv
+import html
+import json
+import os
+import re
+import sys
+
+from memit.markdown_parser.Section import Section
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser import dedup
+
+
+FORMATS = ['jsonl', 'anki']
+
+
+def iter_files(path, level=1):
+    '''yields (filepath, level, titles) for every file Section.from_dir()
+    would read, in the same order, where titles are the names of the
+    directories between path and the file. A file path yields only itself.
+    '''
+    if os.path.isfile(path):
+        yield path, level, []
+        return
+
+    # like Section._scan_dir(), but with a stack and without a list of files.
+    # The root directory has no title, like in Chunk_tree heading paths
+    stack = [(os.path.abspath(path), level, [], True)]
+    while stack:
+        entry_path, entry_level, titles, is_dir = stack.pop()
+        if not is_dir:
+            yield entry_path, entry_level, titles
+            continue
+        children = []
+        for child in sorted(os.listdir(entry_path)):
+            if child.startswith('.'):
+                continue
+            child_path = os.path.join(entry_path, child)
+            if os.path.isfile(child_path) and \
+                    child_path.endswith(Section.VALID_EXT):
+                children.append((child_path, entry_level + 1, titles, False))
+            elif os.path.isdir(child_path):
+                children.append((child_path, entry_level + 1,
+                                 titles + [child], True))
+        stack.extend(reversed(children))
+
+
+def iter_sections(path, level=1, node_type='section', fences=False):
+    '''yields (heading path, section) for every node of every markdown file
+    below path, in the order of Section.from_dir(). The heading path has the
+    titles from below path down to the section. Only one file is parsed at
+    a time.
+    '''
+    single_file = os.path.isfile(path)
+    for filepath, file_level, titles in iter_files(path, level):
+        section = Section._load_file(filepath, file_level, node_type,
+                                     fences)
+        if section is None:
+            continue
+        root_path = [] if single_file else titles + [section.get_title()]
+        stack = [(section, root_path)]
+        while stack:
+            node, heading_path = stack.pop()
+            yield heading_path, node
+            children = node.get_children()
+            if children:
+                stack.extend((child, heading_path + [child.get_title()])
+                             for child in reversed(children))
+
+
+def iter_chunks(sections, chunk_type='code'):
+    '''yields (heading path, chunk) for the chunks with content of the
+    sections from iter_sections()
+    '''
+    for heading_path, node in sections:
+        make_chunk = getattr(node, 'make_chunk', None)
+        if make_chunk is not None:
+            chunk = make_chunk(chunk_type)
+        else:
+            chunk = ch.chunk_factory(node.get_content(), node.get_title(),
+                                     chunk_type)
+        chunks = chunk if isinstance(chunk, list) else [chunk]
+        for chunk in chunks:
+            if chunk.get_content():
+                yield heading_path, chunk
+
+
+def raw_prompt(chunk):
+    '''the prompt of a chunk, None if it has none. get_prompt() of a code
+    chunk returns a placeholder for the app instead
+    '''
+    if type(chunk).get_prompt is ch.Code_chunk.get_prompt:
+        return chunk.prompt
+    return chunk.get_prompt() or None
+
+
+def to_record(heading_path, chunk):
+    get_syntax = getattr(chunk, 'get_syntax', None)
+    return {
+        'path': heading_path,
+        'title': chunk.get_title(),
+        'prompt': raw_prompt(chunk),
+        'content': chunk.get_content(),
+        'syntax': get_syntax() if get_syntax else None
+    }
+
+
+def anki_tags(heading_path):
+    '''one hierarchical Anki tag ("a::b::c") for the heading path'''
+    return '::'.join(re.sub('\\s+', '_', title.strip())
+                     for title in heading_path)
+
+
+def write_jsonl(chunks, file, flush_every=100):
+    '''writes one JSON object per chunk. Returns the number of records'''
+    count = 0
+    for heading_path, chunk in chunks:
+        file.write(json.dumps(to_record(heading_path, chunk)))
+        file.write('\n')
+        count += 1
+        if count % flush_every == 0:
+            file.flush()
+    file.flush()
+    return count
+
+
+def anki_fields(chunk):
+    '''front (title and prompt, if there is one) and back (content) of a
+    note, as HTML
+    '''
+    front = '<b>{}</b>'.format(html.escape(chunk.get_title()))
+    prompt = raw_prompt(chunk)
+    if prompt:
+        front += '<br>' + html.escape(prompt).replace('\n', '<br>')
+    back = '<pre><code>{}</code></pre>'.format(
+        html.escape(chunk.get_content()))
+    return front, back
+
+
+def write_anki(chunks, file, flush_every=100):
+    '''writes front, back and tags rows, to be imported with "Allow HTML in
+    fields". Returns the number of records
+    '''
+    writer = csv.writer(file)
+    count = 0
+    for heading_path, chunk in chunks:
+        writer.writerow(anki_fields(chunk) + (anki_tags(heading_path),))
+        count += 1
+        if count % flush_every == 0:
+            file.flush()
+    file.flush()
+    return count
+
+
+def export(path, file, output_format='jsonl', chunk_type='code',
+           node_type='section', unique=False, fences=False):
+    '''streams the chunks of a file or directory to file. With unique, copies
+    of a chunk (see dedup.chunk_key()) are written once. Returns the number
+    of records written
+    '''
+    chunks = iter_chunks(iter_sections(path, node_type=node_type,
+                                       fences=fences), chunk_type)
+    if unique:
+        chunks = dedup.unique_cards(chunks)
+    if output_format == 'anki':
+        return write_anki(chunks, file)
+    return write_jsonl(chunks, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='markdown file or directory')
+    parser.add_argument('--output', '-o', default=None,
+                        help='file to write to (default: stdout)')
+    parser.add_argument('--format', choices=FORMATS, default='jsonl')
+    parser.add_argument('--chunk-type', '-c', default='code',
+                        help='one of {} or a comma separated list of the '
+                        'ones other than "code"'.format(
+                            ', '.join(ch.CHUNK_TYPES)))
+    parser.add_argument('--node-type', default='section',
+                        choices=['section', 'compact', 'mapped'])
+    parser.add_argument('--unique', action='store_true',
+                        help='write copies of a card only once')
+    parser.add_argument('--fences', action='store_true',
+                        help='do not treat "#" lines inside fenced code '
+                        'blocks as headings')
+    args = parser.parse_args()
+    try:
+        ch.markers(args.chunk_type)
+    except ValueError:
+        parser.error('unknown chunk type: ' + args.chunk_type)
+
+    if args.output:
+        # newline='' lets the csv module write its own line endings
+        output = open(args.output, 'w', newline='', encoding='utf-8')
+    else:
+        output = sys.stdout
+    try:
+        count = export(args.path, output, args.format, args.chunk_type,
+                       args.node_type, args.unique, args.fences)
+    finally:
+        if args.output:
+            output.close()
+    print('{} records'.format(count), file=sys.stderr)
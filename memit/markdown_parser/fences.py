@@ -0,0 +1,112 @@
+'''Linear time search for fenced code blocks. The chunk regexes of fences,
+like '```([A-z]+)?\\n.+\\n```' with DOTALL, backtrack from every opening
+fence that is not closed to the end of the string, which is quadratic in big
+files with unbalanced fences. The functions here give the same matches with
+find() calls, every character is looked at a bounded number of times.
+
+Offsets are those of the string, which can be str, bytes or an mmap. A
+match is a Block:
+  - start: offset of the opening "```"
+  - code_start: offset after the newline of the opening fence
+  - code_end: offset of the newline before the closing "```"
+  - end: offset after the closing "```"
+'''
+
+import collections
+import re
+
+
+Block = collections.namedtuple('Block',
+                               ['start', 'code_start', 'code_end', 'end'])
+
+# the syntax name after an opening fence, [A-z] like the chunk regexes. It
+# can not backtrack, so matching it is linear in its length
+_SYNTAX = re.compile('[A-z]*')
+_SYNTAX_BYTES = re.compile(b'[A-z]*')
+
+
+def _tokens(string):
+    if isinstance(string, str):
+        return '```', '\n', _SYNTAX
+    return b'```', b'\n', _SYNTAX_BYTES
+
+
+def find_opener(string, start=0, end=None):
+    '''offsets of the first "```" followed by a syntax name and a newline,
+    and of the end of that newline: the match of '```([A-z]+)?\\n'. Returns
+    (-1, -1) if there is none.
+    '''
+    ticks, newline, syntax = _tokens(string)
+    if end is None:
+        end = len(string)
+    pos = string.find(ticks, start, end)
+    while pos != -1:
+        name_end = syntax.match(string, pos + 3, end).end()
+        if string[name_end:name_end + 1] == newline and name_end < end:
+            return pos, name_end + 1
+        # "`" is in [A-z], so every "```" up to name_end is followed by the
+        # same run of letters and fails the same way
+        pos = string.find(ticks, name_end, end)
+    return -1, -1
+
+
+def find_code(string, start=0, end=None):
+    '''the Block matched by Code_chunk._regexp: from the first opening fence
+    to the last "\\n```", so it can span several blocks. None if there is
+    none.
+    '''
+    ticks, newline, _ = _tokens(string)
+    if end is None:
+        end = len(string)
+    opener, code_start = find_opener(string, start, end)
+    if opener == -1:
+        return None
+    # a later opener can not have a closing fence after it either
+    code_end = string.rfind(newline + ticks, start, end)
+    # the code has at least one character
+    if code_end < code_start + 1:
+        return None
+    return Block(opener, code_start, code_end, code_end + 4)
+
+
+def iter_blocks(string, start=0, end=None):
+    '''yields the Blocks matched by Code_block_chunk._fence, every opening
+    fence up to the next "\\n```"
+    '''
+    ticks, newline, _ = _tokens(string)
+    if end is None:
+        end = len(string)
+    pos = start
+    while True:
+        opener, code_start = find_opener(string, pos, end)
+        if opener == -1:
+            return
+        code_end = string.find(newline + ticks, code_start, end)
+        if code_end == -1:
+            # no later opener is closed either
+            return
+        yield Block(opener, code_start, code_end, code_end + 4)
+        pos = code_end + 4
+
+
+def syntax(string, block):
+    '''the syntax name of the opening fence of a Block, None if it has none
+    '''
+    return string[block.start + 3:block.code_start - 1] or None
+
+
+def strip_fences(code):
+    '''removes every opening fence and then every remaining "```" from a
+    string, like re.sub('```([A-z]+)?\\n', '', code) followed by
+    re.sub('```', '', code)
+    '''
+    parts = []
+    pos = 0
+    while True:
+        opener, code_start = find_opener(code, pos)
+        if opener == -1:
+            break
+        parts.append(code[pos:opener])
+        pos = code_start
+    parts.append(code[pos:])
+    return ''.join(parts).replace('```', '')
@@ -0,0 +1,137 @@
+'''Timers and counters for the phases of loading notes: scanning directories,
+detecting and reading files, parsing, making chunks, indexing and showing
+forms. Metrics are off by default, and then a timer is a shared no-op context
+manager and a counter a single check of the enabled flag.
+
+    from memit.markdown_parser import metrics
+    metrics.enable()
+    section = Section.from_dir('notes')
+    tree = Chunk_tree.from_node(section, 'code')
+    print(metrics.format_stats())
+
+Counters named "<name>.hits" and "<name>.misses" are reported as the hit rate
+of <name>. Files parsed in the worker processes of Section.from_dir() are
+counted by the parent, the time of their phases is only in "load".
+'''
+
+import contextlib
+import logging
+import os
+import time
+
+
+log = logging.getLogger('memit.markdown_parser')
+
+enabled = False
+# phase -> [calls, seconds]
+_timers = {}
+_counters = {}
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+
+class _Timer():
+
+    __slots__ = ('phase', 'start')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        add_time(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def timer(phase):
+    '''context manager adding the time of its block to phase'''
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(phase)
+
+
+def add_time(phase, seconds):
+    if not enabled:
+        return
+    entry = _timers.get(phase)
+    if entry is None:
+        _timers[phase] = [1, seconds]
+    else:
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def count(name, number=1):
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + number
+
+
+def count_file(section, filepath):
+    '''counts a parsed file, its bytes and its sections'''
+    if not enabled or section is None:
+        return
+    count('files')
+    count('sections', sum(1 for _ in section.iter_nodes()))
+    try:
+        count('bytes', os.path.getsize(filepath))
+    except OSError:
+        pass
+
+
+def hit_rates():
+    '''dict name -> hit rate of the counters with .hits and .misses'''
+    rates = {}
+    for name, hits in _counters.items():
+        if not name.endswith('.hits'):
+            continue
+        prefix = name[:-len('.hits')]
+        lookups = hits + _counters.get(prefix + '.misses', 0)
+        rates[prefix] = hits / lookups if lookups else 0.0
+    return rates
+
+
+def snapshot():
+    '''the metrics as a dict with "timers" (phase -> calls and seconds),
+    "counters" and "hit_rates"
+    '''
+    return {
+        'timers': {phase: {'calls': calls, 'seconds': seconds}
+                   for phase, (calls, seconds) in _timers.items()},
+        'counters': dict(_counters),
+        'hit_rates': hit_rates()
+    }
+
+
+def format_stats():
+    lines = []
+    for phase, (calls, seconds) in sorted(_timers.items(),
+                                          key=lambda item: -item[1][1]):
+        lines.append('{:<12} {:9.1f} ms in {} calls'.format(
+            phase, seconds * 1000, calls))
+    for name, value in sorted(_counters.items()):
+        lines.append('{:<20} {}'.format(name, value))
+    for name, rate in sorted(hit_rates().items()):
+        lines.append('{:<20} {:.0%} hit rate'.format(name, rate))
+    return '\n'.join(lines)
+
+
+def log_stats(level=logging.INFO):
+    for line in format_stats().split('\n'):
+        log.log(level, line)
@@ -0,0 +1,206 @@
+'''Inverted index over the titles, prompts and code of a Section tree, to find
+topics without browsing the tree. Every node gets a position (its index in
+depth-first order, the order of Section.get_all_nodes()) and every word maps
+to the sorted positions of the nodes containing it.
+
+The words of a node are stored in the Parse_cache next to its parsed file,
+so a warm start only has to fill the index.
+
+A lazy index does not parse files: the Lazy_sections that are not loaded yet
+are indexed by their title only, without their children. Once such a file
+is loaded (see Lazy_section.on_load()), the next search adds the nodes below
+it after all other nodes, so the positions of the others do not change.
+'''
+
+import array
+import bisect
+import collections
+import re
+
+from memit.markdown_parser import metrics
+
+
+_WORD = re.compile('\\w+')
+
+
+def split_words(text):
+    '''lower case words of text, in order'''
+    return _WORD.findall(text.lower())
+
+
+def node_words(node):
+    '''sorted words of the title and the content (prompt and code) of a node
+    '''
+    return tuple(sorted(set(split_words(node.get_title() + '\n' +
+                                        node.get_content()))))
+
+
+class Search_index():
+
+    def __init__(self):
+        self.nodes = []
+        # position of the parent of every node, -1 for the root
+        self.parents = array.array('i')
+        self.postings = {}
+        # positions of the nodes indexed by their title only whose children
+        # were added later, in the order they were added
+        self.appended = []
+        # id -> (position, cache) of the nodes indexed by their title only
+        self._unparsed = {}
+        # nodes of _unparsed that were loaded since, filled by the thread
+        # that loads them
+        self._loaded = collections.deque()
+        self._vocabulary = None
+        # (node, cache) of a lazy index that was not built yet
+        self._source = None
+
+    @classmethod
+    def from_node(cls, node, cache=None, lazy=False):
+        '''indexes node and all nodes below it. With lazy, the tree is only
+        walked on the first search, and files of a lazy Section tree that
+        are not loaded yet are not parsed, see is_parsed().
+        '''
+        index = cls()
+        if lazy:
+            index._source = (node, cache)
+        else:
+            with metrics.timer('index'):
+                index.add_tree(node, cache)
+        return index
+
+    def add_tree(self, node, cache=None, loaded_only=False):
+        '''adds node and all nodes below it. With loaded_only, nodes that are
+        not loaded are added by their title only and their children are added
+        by the first search after they were loaded
+        '''
+        self._add_nodes([(node, -1)], cache, loaded_only)
+
+    def _add_nodes(self, stack, cache, loaded_only=False):
+        '''adds the (node, parent position) items of stack and the nodes below
+        them, the last item first
+        '''
+        while stack:
+            node, parent = stack.pop()
+            if loaded_only and not node.is_loaded():
+                position = self._add_words(
+                    node, parent, sorted(set(split_words(node.get_title()))))
+                self._unparsed[id(node)] = (position, cache)
+                node.on_load(self._loaded.append)
+                continue
+            position = self.add(node, parent, cache)
+            children = node.get_children()
+            if children:
+                stack.extend((child, position)
+                             for child in reversed(children))
+
+    def add(self, node, parent=-1, cache=None):
+        '''adds a single node and returns its position'''
+        words = cache.get_words(node) if cache is not None else None
+        if words is None:
+            words = node_words(node)
+            if cache is not None:
+                cache.put_words(node, words)
+        return self._add_words(node, parent, words)
+
+    def _add_words(self, node, parent, words):
+        position = len(self.nodes)
+        self.nodes.append(node)
+        self.parents.append(parent)
+        for word in words:
+            positions = self.postings.get(word)
+            if positions is None:
+                positions = self.postings[word] = array.array('i')
+            positions.append(position)
+        self._vocabulary = None
+        return position
+
+    def is_parsed(self, node):
+        '''False for a node that is indexed by its title only, as its file
+        was not loaded when the index was made. The nodes below it are left
+        out, or come after all others if it is in appended
+        '''
+        return id(node) not in self._unparsed
+
+    def search(self, query):
+        '''positions of the nodes containing all words of the query, in
+        order. Positions are in tree order, except for the nodes of a lazy
+        index that were added later, see appended. Unless the query ends with
+        a space, the last word also matches longer words, so results can be
+        shown while typing.
+        '''
+        self._build()
+        words = split_words(query)
+        if not words:
+            return []
+        prefix = None if query[-1:].isspace() else words.pop()
+
+        result = None
+        # rare words first, the intersection gets small quickly
+        for word in sorted(words, key=self._count):
+            positions = set(self.postings.get(word, ()))
+            result = positions if result is None else result & positions
+            if not result:
+                return []
+        if prefix is not None:
+            positions = self._prefix_positions(prefix)
+            result = positions if result is None else result & positions
+        return sorted(result)
+
+    def find(self, query):
+        '''the nodes matching query, see search()'''
+        return [self.nodes[position] for position in self.search(query)]
+
+    def ancestors(self, position):
+        '''positions of the parents of a node, from its parent to the root'''
+        result = []
+        position = self.parents[position]
+        while position != -1:
+            result.append(position)
+            position = self.parents[position]
+        return result
+
+    def heading_path(self, position):
+        '''titles from below the root down to the node'''
+        path = [self.nodes[p].get_title()
+                for p in reversed(self.ancestors(position)[:-1])]
+        if self.parents[position] != -1:
+            path.append(self.nodes[position].get_title())
+        return path
+
+    def __len__(self):
+        self._build()
+        return len(self.nodes)
+
+    def _count(self, word):
+        return len(self.postings.get(word, ()))
+
+    def _prefix_positions(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        result = set()
+        idx = bisect.bisect_left(vocabulary, prefix)
+        while idx < len(vocabulary) and vocabulary[idx].startswith(prefix):
+            result.update(self.postings[vocabulary[idx]])
+            idx += 1
+        return result
+
+    def _build(self):
+        '''walks the tree of a lazy index on the first call, and adds the
+        nodes below the files that were loaded since the last one
+        '''
+        if self._source is not None:
+            node, cache = self._source
+            self._source = None
+            with metrics.timer('index'):
+                self.add_tree(node, cache, loaded_only=True)
+        if not self._loaded:
+            return
+        with metrics.timer('index'):
+            while self._loaded:
+                node = self._loaded.popleft()
+                position, cache = self._unparsed[id(node)]
+                self.appended.append(position)
+                self._add_nodes([(child, position) for child
+                                 in reversed(node.get_children() or [])],
+                                cache)
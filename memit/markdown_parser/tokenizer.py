@@ -0,0 +1,198 @@
+'''Single pass tokenizer for markdown strings. The string is scanned once and
+every line starting with a "#" is recorded as a Heading with its offsets. The
+Section tree is then built from those offsets, so the content of a section is
+the only substring that is ever copied. It is the parser of both Section
+and markdown_parsing.parse_markdown().
+
+build_tree() gives exactly the same tree as the recursive regex splitting
+that Section used before (kept in benchmarks/regex_parser.py), including
+its quirks:
+  - a heading is only split on if it has no other "#" in its line
+  - of two consecutive heading lines only the first one is split on
+  - text before the first heading of the highest level is dropped
+
+With fences, lines inside fenced code blocks are not headings, so a "#"
+comment in a code block does not start a section. A block starts at a line
+beginning with "```" (after spaces or tabs) and ends at the next such line
+with nothing but backticks and spaces. A last block that is never closed is
+not a block, its headings are kept. Either way the string is scanned once.
+'''
+
+import collections
+import re
+
+
+# every line starting with a "#". Group 1 is the run of hashtags
+_HEADING_LINE = re.compile('^(#+)[^\\n]*', re.MULTILINE)
+_HEADING_LINE_BYTES = re.compile(b'^(#+)[^\\n]*', re.MULTILINE)
+# the same and every line starting with a fence. Group 2 is the fence
+_FENCED_LINE = re.compile('^(?:(#+)|[ \t]*(```))[^\\n]*', re.MULTILINE)
+_FENCED_LINE_BYTES = re.compile(b'^(?:(#+)|[ \t]*(```))[^\\n]*',
+                                re.MULTILINE)
+
+Heading = collections.namedtuple('Heading', ['start', 'end', 'level', 'clean'])
+Heading.__doc__ = '''a line starting with "#".
+  - start: offset of the first "#"
+  - end: offset of the newline ending the line (or length of the string)
+  - level: number of leading hashtags
+  - clean: True if there is no other "#" in the line
+'''
+
+
+def tokenize(md_string, fences=False):
+    '''returns a list of Headings, one for each line starting with "#". The
+    string can also be bytes (or a bytes-like object such as an mmap), the
+    offsets are then byte offsets. With fences, the lines inside fenced code
+    blocks are left out.
+    '''
+    if fences:
+        return _tokenize_fenced(md_string)
+    if isinstance(md_string, str):
+        regexp, hashtag = _HEADING_LINE, '#'
+    else:
+        regexp, hashtag = _HEADING_LINE_BYTES, b'#'
+    headings = []
+    for match in regexp.finditer(md_string):
+        start, end = match.span()
+        level_end = match.end(1)
+        clean = md_string.find(hashtag, level_end, end) == -1
+        headings.append(Heading(start, end, level_end - start, clean))
+    return headings
+
+
+def _tokenize_fenced(md_string):
+    if isinstance(md_string, str):
+        regexp, hashtag, tick = _FENCED_LINE, '#', '`'
+    else:
+        regexp, hashtag, tick = _FENCED_LINE_BYTES, b'#', b'`'
+    headings = []
+    # the headings since the last opening fence, they are only dropped
+    # once the block is closed
+    fenced = None
+    for match in regexp.finditer(md_string):
+        start, end = match.span()
+        if match.start(2) != -1:
+            if fenced is None:
+                fenced = []
+            elif not md_string[match.end(2):end].strip().strip(tick):
+                fenced = None
+            continue
+        level_end = match.end(1)
+        clean = md_string.find(hashtag, level_end, end) == -1
+        heading = Heading(start, end, level_end - start, clean)
+        if fenced is None:
+            headings.append(heading)
+        else:
+            fenced.append(heading)
+    if fenced:
+        headings.extend(fenced)
+    return headings
+
+
+def build_tree(md_string, title, level, factory, headings=None,
+               fences=False):
+    '''builds a tree from a markdown string. The factory is called as
+    factory(title, content, children, level) for every node, like the Section
+    constructor. The children lists are filled after the factory is called.
+    fences is passed on to tokenize().
+    '''
+    def make(title, start, end, children, level):
+        return factory(title, md_string[start:end].strip(), children, level)
+
+    return build_spans(md_string, title, level, make, headings,
+                       fences=fences)
+
+
+def build_spans(md_string, title, level, factory, headings=None,
+                decode=None, fences=False):
+    '''like build_tree(), but the factory gets the offsets of the content
+    instead of the content: factory(title, start, end, children, level).
+    md_string[start:end].strip() is the content of the node. If md_string
+    is bytes, decode turns the bytes of a title into a string.
+
+    The tree is built using a stack instead of recursion, so deep documents
+    will not hit the recursion limit.
+    '''
+    if headings is None:
+        headings = tokenize(md_string, fences)
+    if not headings:
+        return factory(title, 0, len(md_string), None, level)
+
+    children = []
+    root = factory(title, 0, headings[0].start, children, level)
+    stack = [(0, len(md_string), children, level + 1)]
+    while stack:
+        first, end, siblings, child_level = stack.pop()
+        for idx, section_end in split_points(headings, first, end):
+            heading = headings[idx]
+            heading_title = md_string[heading.start + heading.level:
+                                      heading.end]
+            if decode is not None:
+                heading_title = decode(heading_title)
+            heading_title = heading_title.lstrip(' ')
+            body_start = heading.end + 1
+
+            nxt = idx + 1
+            if nxt < len(headings) and headings[nxt].start < section_end:
+                body_end = headings[nxt].start
+                grandchildren = []
+                stack.append((nxt, section_end, grandchildren,
+                              child_level + 1))
+            else:
+                body_end = section_end
+                grandchildren = None
+
+            siblings.append(factory(heading_title, body_start, body_end,
+                                    grandchildren, child_level))
+    return root
+
+
+def split_points(headings, first, end):
+    '''splits the part of the string that starts at headings[first] and ends
+    at offset end into sections of the highest heading level. Returns a list
+    of (heading index, section end offset) tuples.
+
+    A newline "belongs" to the heading before it when that heading is split
+    on, which is why a heading right below another one is skipped.
+    '''
+    count = len(headings)
+
+    # find the highest level heading, like the regex _find_highest_h
+    highest = headings[first].level
+    consumed = True
+    prev_end = headings[first].end
+    stop = first + 1
+    while stop < count and headings[stop].start < end:
+        heading = headings[stop]
+        if heading.end < end and \
+                not (consumed and prev_end + 1 == heading.start):
+            highest = min(highest, heading.level)
+            consumed = True
+        else:
+            consumed = False
+        prev_end = heading.end
+        stop += 1
+
+    # split on the highest level, like the regex _split_sections
+    points = []
+    consumed = False
+    prev_end = None
+    for idx in range(first, stop):
+        heading = headings[idx]
+        if heading.level == highest and heading.clean and \
+                heading.end < end and \
+                not (consumed and prev_end + 1 == heading.start):
+            points.append(idx)
+            consumed = True
+        else:
+            consumed = False
+        prev_end = heading.end
+
+    result = []
+    for pos, idx in enumerate(points):
+        if pos + 1 < len(points):
+            section_end = headings[points[pos + 1]].start - 1
+        else:
+            section_end = end
+        result.append((idx, section_end))
+    return result
@@ -0,0 +1,264 @@
+'''Watches a directory of markdown files and swaps re-parsed files into an
+existing Section tree, so a running app does not need a full reload.
+
+make_watcher() returns an Inotify_watcher on Linux and a Polling_watcher
+elsewhere. Both have a poll() method that returns the paths that changed
+since the last call, without blocking. update_tree() takes those paths and
+patches the tree built by Section.from_dir().
+'''
+
+import bisect
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import time
+
+from memit.markdown_parser.Section import Section
+
+
+log = logging.getLogger('memit.markdown_parser')
+
+
+def make_watcher(path, interval=1.0):
+    '''returns an inotify based watcher if possible, otherwise a polling one
+    '''
+    try:
+        return Inotify_watcher(path)
+    except OSError as error:
+        log.info('inotify not available (%s), polling %s', error, path)
+        return Polling_watcher(path, interval)
+
+
+def _walk(path):
+    '''yields all non-hidden directories and files below path
+    '''
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in dirnames:
+            yield os.path.join(dirpath, name)
+        for name in filenames:
+            if not name.startswith('.'):
+                yield os.path.join(dirpath, name)
+
+
+class Polling_watcher():
+    '''compares mtime and size of all files with the previous poll. Scans the
+    directory at most once every interval seconds.
+    '''
+
+    def __init__(self, path, interval=1.0, clock=time.monotonic):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self._clock = clock
+        self._last_poll = self._clock()
+        self._snapshot = self._scan()
+
+    def poll(self):
+        now = self._clock()
+        if now - self._last_poll < self.interval:
+            return []
+        self._last_poll = now
+
+        snapshot = self._scan()
+        changed = [path for path, stat in snapshot.items()
+                   if self._snapshot.get(path) != stat]
+        changed.extend(path for path in self._snapshot
+                       if path not in snapshot)
+        self._snapshot = snapshot
+        return sorted(changed)
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        snapshot = {}
+        for path in _walk(self.path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isdir(path):
+                snapshot[path] = None
+            else:
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+class Inotify_watcher():
+    '''uses the Linux inotify API through ctypes. Every directory gets its
+    own watch, new directories are added as they appear.
+    '''
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_ISDIR = 0x40000000
+    IN_IGNORED = 0x8000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+        IN_DELETE
+
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, path):
+        name = ctypes.util.find_library('c')
+        if name is None:
+            raise OSError('libc not found')
+        self._libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('libc has no inotify')
+
+        self.path = os.path.abspath(path)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK |
+                                            self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs = {}
+        self._add_watch(self.path)
+        for child in _walk(self.path):
+            if os.path.isdir(child):
+                self._add_watch(child)
+
+    def poll(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            changed.update(self._parse(data))
+        return sorted(changed)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _parse(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, size = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + size].rstrip(b'\0')
+            offset += size
+
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            name = os.fsdecode(name)
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR and \
+                    mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                # files created before the watch was added have no events
+                self._add_watch(path)
+                for child in _walk(path):
+                    if os.path.isdir(child):
+                        self._add_watch(child)
+                    yield child
+            yield path
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                          self.MASK)
+        if wd < 0:
+            log.warning('could not watch %s', path)
+            return
+        self._dirs[wd] = path
+
+
+def update_tree(root, paths, cache=None, node_type='section',
+                fences=False):
+    '''re-parses the changed paths and swaps them into the tree of root, a
+    Section created by Section.from_dir(). Unchanged parts of the tree are left
+    alone.
+
+    Returns a list of (action, index_path, section) edits, where action is
+    "replace", "insert" or "remove" and index_path the child indices from
+    root to the changed node. Applying the edits in order to a tree with the
+    same shape (like a Chunk_tree) keeps it in sync.
+    '''
+    edits = []
+    done = []
+    for path in sorted(set(os.path.abspath(path) for path in paths)):
+        # paths inside a directory that was just loaded or removed
+        if any(path.startswith(prefix + os.sep) for prefix in done):
+            continue
+        try:
+            edit = _update_path(root, path, cache, node_type, fences)
+        except OSError as error:
+            # e.g. the file was removed again while parsing it
+            log.warning('could not update %s: %s', path, error)
+            continue
+        if edit is not None:
+            action, _, section = edit
+            edits.append(edit)
+            if action != 'replace':
+                done.append(section.get_path() if section else path)
+    return edits
+
+
+def _update_path(root, path, cache, node_type, fences):
+    rel = os.path.relpath(path, root.get_path())
+    parts = rel.split(os.sep)
+    if rel == '.' or parts[0] == os.pardir or \
+            any(part.startswith('.') for part in parts):
+        return None
+
+    node = root
+    index_path = []
+    for depth, part in enumerate(parts):
+        children = node.get_children()
+        names = [os.path.basename(child.get_path()) for child in children]
+        is_last = depth == len(parts) - 1
+        child_path = os.path.join(node.get_path(), part)
+
+        if part in names:
+            idx = names.index(part)
+            if not is_last:
+                node = children[idx]
+                index_path.append(idx)
+                continue
+            if os.path.isdir(child_path):
+                # changes inside a known directory come as their own paths
+                return None
+            new = _load(child_path, node.get_level() + 1, cache,
+                        node_type, fences)
+            if new is None:
+                del children[idx]
+                return ('remove', index_path + [idx], None)
+            children[idx] = new
+            return ('replace', index_path + [idx], new)
+
+        # the path is not in the tree, load the topmost missing part
+        new = _load(child_path, node.get_level() + 1, cache, node_type,
+                    fences)
+        if new is None:
+            return None
+        idx = bisect.bisect(names, part)
+        children.insert(idx, new)
+        return ('insert', index_path + [idx], new)
+
+
+def _load(path, level, cache, node_type, fences):
+    '''parses a file or directory the way Section.from_dir() would. Returns
+    None if from_dir() would leave it out
+    '''
+    if os.path.isdir(path):
+        return Section.from_dir(path, level, cache=cache,
+                                node_type=node_type, fences=fences)
+    if os.path.isfile(path) and path.endswith(Section.VALID_EXT) and \
+            Section.file_is_markdown(path):
+        return Section.from_file(path, level, cache, node_type, fences)
+    return None
@@ -0,0 +1,285 @@
+'''Random sessions from big selections without making every chunk. The
+selected nodes of a Chunk_tree are walked once and fed into a Sampler, a
+weighted reservoir that only keeps the k best candidates. Chunks are made
+for the picked nodes only, so a 20 card session from a selection of 100k
+cards extracts about 20 chunks.
+
+Weights are given per heading path prefix, e.g. {('python',): 2.0,
+('python', 'pandas'): 0.5}: a node gets the weight of the longest prefix of
+its heading path that has one, so a file or a topic inside it can both be
+weighted.
+
+With a Scheduler, scheduled_cards() takes the due cards from the review log
+and fills the session with a sample of new ones, so only the chunks of those
+are made too. schedule() does the same for the cards of a deck server.
+'''
+
+import heapq
+import itertools
+import math
+import random
+
+from memit import scheduler as sched
+from memit.markdown_parser import dedup
+from memit.topic_choice import valid_chunks
+
+# schedule() samples this many cards for every new card it needs,
+# some of them were reviewed before and are not due
+NEW_BATCH = 4
+# schedule() looks up this many due cards of the log at a time
+DUE_BATCH = 100
+
+
+class Sampler():
+    '''weighted random sample of k items from a stream of unknown length.
+    Every item gets the key log(u) / weight for a uniform random u, and the k
+    items with the largest keys are kept in a heap (Efraimidis and
+    Spirakis). With equal weights it is a uniform sample.
+    '''
+
+    def __init__(self, k, seed=None):
+        self.k = k
+        self.seen = 0
+        self._random = random.Random(seed)
+        self._heap = []
+
+    def add(self, item, weight=1.0):
+        if weight <= 0 or self.k <= 0:
+            return
+        self.seen += 1
+        # 1 - random() is in (0, 1], so the log is defined
+        key = math.log(1.0 - self._random.random()) / weight
+        entry = (key, self.seen, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def restart(self, k):
+        '''empties the sample for a new one of k items, from the same random
+        generator
+        '''
+        self.k = k
+        self.seen = 0
+        self._heap = []
+
+    def items(self):
+        '''the sampled items, largest key first, which is a random order'''
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+    def choice(self, items):
+        '''one random item of a non-empty sequence, from the same random
+        generator
+        '''
+        return items[self._random.randrange(len(items))]
+
+
+def parse_weights(specs):
+    '''dict heading path tuple -> weight from "path/to/topic=weight"
+    strings. Raises ValueError for a malformed spec
+    '''
+    weights = {}
+    for spec in specs or ():
+        path, sep, weight = spec.rpartition('=')
+        if not sep or not path:
+            raise ValueError('weight should be PATH=WEIGHT: ' + spec)
+        weights[tuple(title for title in path.split('/') if title)] = \
+            float(weight)
+    return weights
+
+
+def path_weight(weights, path):
+    '''weight of the longest prefix of path in weights, 1.0 if there is none
+    '''
+    for end in range(len(path), 0, -1):
+        weight = weights.get(tuple(path[:end]))
+        if weight is not None:
+            return weight
+    return 1.0
+
+
+def sample_tree(tree, k, weights=None, seed=None):
+    '''returns up to k (heading path, chunk) cards of the selected nodes of a
+    Chunk_tree, the chunks of Chunk_choice_form.get_values() but sampled,
+    see _sample()
+    '''
+    candidates = []
+    # heading paths are only needed to look up weights
+    stack = [(tree, (), 1.0)]
+    while stack:
+        node, path, weight = stack.pop()
+        if node.selected:
+            candidates.append((node, weight))
+        for child in reversed(node.built_children()):
+            child_path = path
+            child_weight = weight
+            if weights:
+                child_path = path + (child.get_content_for_display(),)
+                child_weight = weights.get(child_path, weight)
+            stack.append((child, child_path, child_weight))
+    return _sample(candidates, k, seed)
+
+
+def sample_nodes(nodes, k, weights=None, seed=None):
+    '''like sample_tree(), but for a list of Chunk_tree nodes instead of the
+    selected ones, so the tree is not changed
+    '''
+    candidates = []
+    for node in nodes:
+        weight = 1.0
+        if weights:
+            weight = path_weight(weights, node.get_heading_path())
+        candidates.append((node, weight))
+    return _sample(candidates, k, seed)
+
+
+def scheduled_cards(tree, scheduler, k, weights=None, seed=None):
+    '''returns up to k (heading path, chunk) cards of the selected nodes of a
+    Chunk_tree for a Scheduler session, see schedule(). Only the nodes of
+    the due cards and of the sample of new ones get their chunks made, so a
+    session may have fewer than k cards if most of the selection was
+    reviewed and is not due
+    '''
+    nodes = {}
+    for node in tree.walk_built():
+        if node.selected:
+            nodes[tuple(node.get_heading_path())] = node
+    made = {}
+    return schedule(scheduler, k,
+                    lambda due: due_cards(nodes, due, made),
+                    lambda count: sample_tree(tree, count, weights, seed))
+
+
+def due_cards(nodes, due, made=None):
+    '''the (heading path, chunk) cards of a list of (id, heading path) due
+    cards of the log whose node is in nodes, a dict heading path tuple ->
+    Chunk_tree node. Cards that are not found (they were edited) are left
+    out. made keeps the chunks of the nodes by card id between calls
+    '''
+    if made is None:
+        made = {}
+    cards = []
+    for id, path in due:
+        node = nodes.get(tuple(path)) if path is not None else None
+        if node is None:
+            continue
+        if node not in made:
+            made[node] = {sched.card_id(path, chunk): chunk
+                          for chunk in valid_chunks([node.get_content()])}
+        chunk = made[node].get(id)
+        if chunk is not None:
+            cards.append((path, chunk))
+    return cards
+
+
+def schedule(scheduler, k, find_due, sample):
+    '''returns up to k (heading path, chunk) cards for a Scheduler session.
+    The due cards of the review log come first: find_due(due) returns the
+    cards of the selection of a list of (id, heading path) due cards, it is
+    called with DUE_BATCH of them at a time until there are k cards. The
+    rest are new cards from sample(count), a random sample of NEW_BATCH
+    times the missing number. Copies of a card are left out like in
+    sample_tree()
+    '''
+    cards = []
+    ids = set()
+    keys = set()
+    due = scheduler.due()
+    while len(cards) < k:
+        batch = [entry for entry in itertools.islice(due, DUE_BATCH)
+                 if entry[1] is not None]
+        if not batch:
+            break
+        for path, chunk in find_due(batch):
+            id = sched.card_id(path, chunk)
+            key = dedup.chunk_key(chunk)
+            if id not in ids and key not in keys:
+                cards.append((path, chunk))
+                ids.add(id)
+                keys.add(key)
+                if len(cards) >= k:
+                    break
+    due.close()
+    needed = k - len(cards)
+    if needed <= 0:
+        return cards
+    new = sample(needed * NEW_BATCH)
+    new_ids = [sched.card_id(path, chunk) for path, chunk in new]
+    now = scheduler.now()
+    states = scheduler.get_states(new_ids, now)
+    for id, card in zip(new_ids, new):
+        # new cards are due now, due cards without a path in the log are
+        # found here too
+        key = dedup.chunk_key(card[1])
+        if id not in ids and key not in keys and states[id].due <= now:
+            cards.append(card)
+            ids.add(id)
+            keys.add(key)
+            if len(cards) >= k:
+                break
+    return cards
+
+
+def _sample(candidates, k, seed):
+    '''k distinct cards of the (node, weight) candidates. Every card of a
+    node is a candidate, copies shared by a Chunk_pool only once. A lazy
+    "code" node whose chunk was not made yet has at most one card, it is one
+    candidate. Lazy nodes of other chunk types get their chunks made to
+    count them.
+
+    Picked nodes without cards (a fence without code) and copies of a
+    picked card are only found once their chunks are made. They are left
+    out and the missing cards are drawn again from the rest, until there
+    are k cards or no candidates.
+    '''
+    sampler = Sampler(k, seed)
+    cards = []
+    # (id of node, card index) of every picked candidate
+    picked = set()
+    keys = set()
+    while True:
+        shared = set()
+        for node, weight in candidates:
+            _add_node(sampler, node, weight, picked, shared)
+        if not sampler.seen:
+            return cards
+        for node, idx in sampler.items():
+            chunks = valid_chunks([node.get_content()])
+            if idx is None:
+                idx = sampler.choice(range(len(chunks))) if chunks else 0
+            picked.add((id(node), idx))
+            if idx >= len(chunks):
+                continue
+            key = dedup.chunk_key(chunks[idx])
+            if key not in keys:
+                keys.add(key)
+                cards.append((node.get_heading_path(), chunks[idx]))
+        if len(cards) >= k:
+            return cards
+        sampler.restart(k - len(cards))
+
+
+def _add_node(sampler, node, weight, picked, shared):
+    '''adds the cards of node that were not picked before. shared has the
+    ids of the chunks added so far
+    '''
+    source = node.source()
+    if node.cards is None and node.content is None and \
+            source is not None and source[1] != 'code':
+        if not node.may_have_cards():
+            return
+        node.get_content()
+    if node.content is not None:
+        chunks = valid_chunks([node.content])
+        for idx, chunk in enumerate(chunks):
+            if id(chunk) in shared:
+                continue
+            shared.add(id(chunk))
+            if (id(node), idx) not in picked:
+                sampler.add((node, idx), weight)
+    elif node.cards is not None:
+        for idx in range(node.cards):
+            if (id(node), idx) not in picked:
+                sampler.add((node, idx), weight)
+    elif (id(node), 0) not in picked and node.may_have_cards():
+        sampler.add((node, None), weight)
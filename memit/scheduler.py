@@ -0,0 +1,269 @@
+'''Spaced repetition with the SM-2 algorithm. Every answer to a card is
+written to a SQLite review log together with the new state of the card (due
+date, interval and ease factor), so the next session knows which cards are
+due.
+
+Cards are identified by card_id(), a hash of the heading path of their
+section (directories, file name and headings below the notes directory) and
+of their content. Moving the notes directory keeps the ids, editing a card
+makes it a new card. The log also keeps the heading path of every card, so
+the due cards can be found without making the chunks of all others, see
+due() and sampling.scheduled_cards().
+'''
+
+import hashlib
+import heapq
+import os
+import random
+import sqlite3
+import time
+
+
+AGAIN, HARD, GOOD, EASY = range(4)
+GRADES = {
+    AGAIN: 'again',
+    HARD: 'hard',
+    GOOD: 'good',
+    EASY: 'easy'
+}
+# SM-2 quality of response for each grade
+_QUALITY = {AGAIN: 1, HARD: 3, GOOD: 4, EASY: 5}
+
+DAY = 24 * 60 * 60
+# a forgotten card is shown again after this many seconds
+AGAIN_DELAY = 10 * 60
+MIN_EASE = 1.3
+START_EASE = 2.5
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cards (
+    id TEXT PRIMARY KEY,
+    due REAL NOT NULL,
+    interval REAL NOT NULL,
+    ease REAL NOT NULL,
+    reps INTEGER NOT NULL,
+    lapses INTEGER NOT NULL,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS cards_due ON cards (due);
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    card TEXT NOT NULL,
+    time REAL NOT NULL,
+    grade INTEGER NOT NULL,
+    interval REAL NOT NULL,
+    ease REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reviews_card ON reviews (card, time);
+'''
+
+
+def default_db_path():
+    base = os.environ.get('XDG_DATA_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'memit', 'reviews.sqlite')
+
+
+# joins the titles of a heading path
+_SEPARATOR = '\x1f'
+
+
+def card_id(heading_path, chunk):
+    '''stable id of a chunk. heading_path is the list of titles from the
+    notes directory down to the section of the chunk
+    '''
+    content = hashlib.sha1()
+    content.update((chunk.get_prompt() or '').encode('utf-8'))
+    content.update(b'\0')
+    content.update((chunk.get_content() or '').encode('utf-8'))
+    key = _SEPARATOR.join(heading_path) + '\0' + content.hexdigest()
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class Card_state():
+    '''scheduling state of a card. New cards are due immediately. path is
+    the heading path of the card, None if it is not known
+    '''
+
+    __slots__ = ('id', 'due', 'interval', 'ease', 'reps', 'lapses', 'path')
+
+    def __init__(self, id, due, interval=0.0, ease=START_EASE, reps=0,
+                 lapses=0, path=None):
+        self.id = id
+        self.due = due
+        self.interval = interval
+        self.ease = ease
+        self.reps = reps
+        self.lapses = lapses
+        self.path = path
+
+    def is_new(self):
+        return self.reps == 0 and self.lapses == 0
+
+    def review(self, grade, now):
+        '''updates the state with the SM-2 rules. interval is in days
+        '''
+        quality = _QUALITY[grade]
+        if grade == AGAIN:
+            self.reps = 0
+            self.lapses += 1
+            self.interval = 0.0
+            self.due = now + AGAIN_DELAY
+        else:
+            self.reps += 1
+            if self.reps == 1:
+                self.interval = 1.0
+            elif self.reps == 2:
+                self.interval = 6.0
+            else:
+                self.interval = round(self.interval * self.ease, 2)
+            self.due = now + self.interval * DAY
+        self.ease = max(MIN_EASE, self.ease + 0.1 -
+                        (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+
+class Scheduler():
+    '''reads and writes the review log. The database is created if it does
+    not exist, path ":memory:" keeps it in memory.
+    '''
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or default_db_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                        exist_ok=True)
+        self._clock = clock
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(_SCHEMA)
+        columns = [row[1] for row in
+                   self._db.execute('PRAGMA table_info(cards)')]
+        if 'path' not in columns:
+            # a log written before the paths were kept
+            with self._db:
+                self._db.execute('ALTER TABLE cards ADD COLUMN path TEXT')
+
+    def close(self):
+        self._db.close()
+
+    def get_states(self, ids, now=None):
+        '''returns a dict id -> Card_state for ids, cards without reviews get
+        a new state that is due at now
+        '''
+        if now is None:
+            now = self.now()
+        states = {id: Card_state(id, now) for id in ids}
+        ids = list(states)
+        # stay below the SQLite limit of host parameters
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            rows = self._db.execute(
+                'SELECT id, due, interval, ease, reps, lapses, path FROM '
+                'cards WHERE id IN ({})'.format(','.join('?' * len(part))),
+                part)
+            for *row, path in rows:
+                states[row[0]] = Card_state(*row, path=_split_path(path))
+        return states
+
+    def now(self):
+        '''the time of the clock the scheduler was made with'''
+        return self._clock()
+
+    def due(self, limit=None):
+        '''yields (id, heading path) of the cards in the log that are due,
+        most overdue first. The path is None for cards reviewed before the
+        paths were kept. Rows are read from the index on the due date while
+        iterating, so a caller that stops early does not read the others
+        '''
+        query = 'SELECT id, path FROM cards WHERE due <= ? ORDER BY due'
+        params = [self.now()]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        for id, path in self._db.execute(query, params):
+            yield id, _split_path(path)
+
+    def due_ids(self, limit=None):
+        '''ids of the cards in the log that are due, most overdue first'''
+        return [id for id, _ in self.due(limit)]
+
+    def review(self, state, grade):
+        '''records an answer and updates state
+        '''
+        now = self.now()
+        state.review(grade, now)
+        path = _SEPARATOR.join(state.path) if state.path is not None \
+            else None
+        with self._db:
+            # a state without a path keeps the one in the log
+            self._db.execute(
+                'INSERT INTO cards (id, due, interval, ease, reps, lapses, '
+                'path) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO '
+                'UPDATE SET due = excluded.due, interval = excluded.interval, '
+                'ease = excluded.ease, reps = excluded.reps, '
+                'lapses = excluded.lapses, '
+                'path = COALESCE(excluded.path, path)',
+                (state.id, state.due, state.interval, state.ease,
+                 state.reps, state.lapses, path))
+            self._db.execute(
+                'INSERT INTO reviews (card, time, grade, interval, ease) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (state.id, now, grade, state.interval, state.ease))
+
+    def session(self, cards, limit=None, seed=None):
+        '''returns a Session with the due cards of cards, a list of
+        (heading path, chunk) tuples
+        '''
+        return Session(self, cards, limit, seed)
+
+
+def _split_path(path):
+    return path.split(_SEPARATOR) if path is not None else None
+
+
+class Session():
+    '''priority queue of the cards to learn, ordered by due date. Overdue
+    cards come before new ones, new cards come in a random order (the same
+    for the same seed), forgotten cards are queued again behind all others.
+    '''
+
+    def __init__(self, scheduler, cards, limit=None, seed=None):
+        self.scheduler = scheduler
+        now = scheduler.now()
+        ids = [card_id(path, chunk) for path, chunk in cards]
+        states = scheduler.get_states(ids, now)
+        order = list(range(len(cards)))
+        random.Random(seed).shuffle(order)
+        heap = []
+        for id, (path, chunk), position in zip(ids, cards, order):
+            state = states[id]
+            if state.due <= now:
+                state.path = path
+                heap.append((state.due, state.is_new(), position, state,
+                             chunk))
+        if limit is not None and len(heap) > limit:
+            heap = heapq.nsmallest(limit, heap)
+        heapq.heapify(heap)
+        self._heap = heap
+        self._order = len(cards)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def pop(self):
+        '''returns (state, chunk) of the next card, raises IndexError if the
+        session is over
+        '''
+        _, _, _, state, chunk = heapq.heappop(self._heap)
+        return state, chunk
+
+    def peek(self):
+        '''returns the chunk of the next card, or None'''
+        return self._heap[0][4] if self._heap else None
+
+    def answer(self, state, chunk, grade):
+        '''records the answer to a popped card'''
+        self.scheduler.review(state, grade)
+        if grade == AGAIN:
+            self._order += 1
+            heapq.heappush(self._heap, (state.due, False, self._order, state,
+                                        chunk))
@@ -0,0 +1,321 @@
+'''A deck server for many users of the same notes. It parses a notes directory
+once and keeps it in memory, App clients fetch the topic tree and the cards
+of their sessions from it over a Unix socket:
+
+    python -m memit.server -d /shared/notes
+    python -m memit.app --server
+
+Requests and responses are JSON objects, one per line. Every connection is
+handled by its own thread. A Deck is not changed after it was made, so
+requests are answered without a lock and do not wait for one another. The
+server keeps no review state: every client schedules its cards with its own
+review database, see scheduler.py.
+'''
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import tempfile
+
+from memit.markdown_parser.Chunk import Chunk, NO_PROMPT
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.search import Search_index
+from memit.markdown_parser import dedup, export, metrics
+from memit.topic_choice import Chunk_tree, valid_chunks
+from memit import sampling
+
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'memit.sock')
+
+
+def encode(message):
+    return json.dumps(message).encode('utf-8') + b'\n'
+
+
+class Deck():
+    '''the Chunk_tree and the Search_index of a Section tree. Nodes are
+    known by their position, the depth-first order of both. Everything is
+    made up front, requests only read
+    '''
+
+    def __init__(self, section, chunk_type='code'):
+        self.chunk_type = chunk_type
+        self.index = Search_index.from_node(section)
+        self.tree = Chunk_tree.from_node(section, chunk_type,
+                                         pool=dedup.Chunk_pool())
+        self.nodes = list(self.tree.walk_built())
+        # the same for every client
+        self._tree = encode({
+            'chunk_type': chunk_type,
+            'nodes': [[node.get_content_for_display(), parent, node.cards,
+                       node.cards_below]
+                      for node, parent in zip(self.nodes,
+                                              self.index.parents)]
+        })
+
+    def answer(self, line):
+        '''the encoded response to an encoded request'''
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'tree':
+                return self._tree
+            handler = getattr(self, 'op_' + str(request.get('op')), None)
+            if handler is None:
+                raise ValueError('unknown op: {}'.format(request.get('op')))
+            return encode(handler(request))
+        except (ValueError, TypeError, KeyError, IndexError) as error:
+            return encode({'error': str(error)})
+
+    def op_search(self, request):
+        return {'positions': self.index.search(request['query'])}
+
+    def op_cards(self, request):
+        '''all cards of the nodes at the positions'''
+        cards = [(node.get_heading_path(), chunk)
+                 for node in self._nodes(request['positions'])
+                 for chunk in valid_chunks([node.get_content()])]
+        return {'cards': [export.to_record(*card) for card in cards]}
+
+    def op_sample(self, request):
+        '''k cards of the nodes at the positions, see sampling.sample_nodes()
+        '''
+        weights = {tuple(path): weight
+                   for path, weight in request.get('weights') or ()}
+        cards = sampling.sample_nodes(self._nodes(request['positions']),
+                                      request['k'], weights,
+                                      request.get('seed'))
+        return {'cards': [export.to_record(*card) for card in cards]}
+
+    def op_due(self, request):
+        '''the cards of a list of (id, heading path) due cards of a review
+        log that belong to the nodes at the positions, see
+        sampling.due_cards()
+        '''
+        nodes = {tuple(node.get_heading_path()): node
+                 for node in self._nodes(request['positions'])}
+        cards = sampling.due_cards(nodes, request['due'])
+        return {'cards': [export.to_record(*card) for card in cards]}
+
+    def _nodes(self, positions):
+        for position in positions:
+            if not 0 <= position < len(self.nodes):
+                raise IndexError('no node at position {}'.format(position))
+        return [self.nodes[position] for position in positions]
+
+
+class Deck_handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        deck = self.server.deck
+        for line in self.rfile:
+            self.wfile.write(deck.answer(line))
+
+
+class Deck_server(socketserver.ThreadingUnixStreamServer):
+    '''answers the requests of every connection in a thread of its own'''
+
+    daemon_threads = True
+
+    def __init__(self, path, deck):
+        self.deck = deck
+        remove_stale_socket(path)
+        super().__init__(path, Deck_handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def remove_stale_socket(path):
+    '''removes the socket file of a server that is gone. Raises OSError if
+    a server still listens on it
+    '''
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise OSError('a server is already listening on ' + path)
+    finally:
+        probe.close()
+
+
+class Remote_chunk(Chunk):
+    '''a chunk sent by the server as an export.to_record() dict'''
+
+    def __init__(self, record):
+        self.title = record['title']
+        self.prompt = record['prompt']
+        self.content = record['content']
+        self.syntax = record['syntax']
+
+    def get_content(self):
+        return self.content
+
+    def get_prompt(self):
+        # like the Code_chunk it was made from
+        return self.prompt or NO_PROMPT
+
+    def get_syntax(self):
+        return self.syntax
+
+    def get_title(self):
+        return self.title
+
+    def to_JSON(self):
+        return {
+            'prompt': self.prompt,
+            'content': self.content,
+            'syntax': self.syntax
+        }
+
+
+class Deck_client():
+    '''the connection of an App to a Deck_server. It has search(),
+    ancestors(), is_parsed() and appended like a Search_index, so it can be
+    the index of the topic choice
+    '''
+
+    # the server parses every file up front, no nodes are added later
+    appended = ()
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._file = self._socket.makefile('rwb')
+        self.chunk_type = None
+        self.parents = []
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def request(self, op, **arguments):
+        '''sends a request and returns the response. Raises ValueError for an
+        error response
+        '''
+        arguments['op'] = op
+        self._file.write(encode(arguments))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('the deck server closed the connection')
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    def tree(self):
+        '''a Chunk_tree with the titles and card counts of the deck, but
+        without chunks. Its depth-first order is the order of the positions
+        '''
+        response = self.request('tree')
+        self.chunk_type = response['chunk_type']
+        nodes = []
+        for title, parent, cards, cards_below in response['nodes']:
+            if parent == -1:
+                node = Chunk_tree(ignore_root=False, expanded=True)
+            else:
+                node = nodes[parent].new_child(expanded=False)
+            node.title = title
+            node.cards = cards
+            node.cards_below = cards_below
+            nodes.append(node)
+        self.parents = [node[1] for node in response['nodes']]
+        return nodes[0]
+
+    def search(self, query):
+        return self.request('search', query=query)['positions']
+
+    def ancestors(self, position):
+        '''positions of the parents of a node, needs tree() first'''
+        result = []
+        position = self.parents[position]
+        while position != -1:
+            result.append(position)
+            position = self.parents[position]
+        return result
+
+    def is_parsed(self, node):
+        '''no node is left out, see appended'''
+        return True
+
+    def cards(self, positions):
+        '''(heading path, chunk) cards of the nodes at the positions'''
+        return self._cards(self.request('cards', positions=list(positions)))
+
+    def sample(self, positions, k, weights=None, seed=None):
+        '''k cards sampled from the nodes at the positions'''
+        weights = [[list(path), weight]
+                   for path, weight in (weights or {}).items()]
+        return self._cards(self.request('sample', positions=list(positions),
+                                        k=k, weights=weights, seed=seed))
+
+    def due(self, positions, due):
+        '''(heading path, chunk) cards of the nodes at the positions for a
+        list of (id, heading path) due cards of a Scheduler
+        '''
+        return self._cards(self.request(
+            'due', positions=list(positions),
+            due=[[id, list(path)] for id, path in due]))
+
+    @staticmethod
+    def _cards(response):
+        return [(record['path'], Remote_chunk(record))
+                for record in response['cards']]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dirpath', '-d', required=True)
+    parser.add_argument('--socket', '-s', default=DEFAULT_SOCKET,
+                        help='path of the Unix socket (default: %(default)s)')
+    parser.add_argument('--mode', default=None,
+                        help='permissions of the socket in octal, e.g. 666 '
+                        'to let every user of the machine connect')
+    parser.add_argument('--chunk-type', '-c', default='code')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='number of processes for parsing the directory')
+    parser.add_argument('--node-type', default='section',
+                        choices=['section', 'compact', 'mapped'])
+    parser.add_argument('--fences', action='store_true',
+                        help='do not treat "#" lines inside fenced code '
+                        'blocks as headings')
+    parser.add_argument('--stats', action='store_true',
+                        help='log the time of parsing and chunking')
+    args = parser.parse_args()
+    try:
+        mode = int(args.mode, 8) if args.mode is not None else None
+    except ValueError:
+        parser.error('mode should be octal: ' + args.mode)
+    if args.stats:
+        metrics.enable()
+
+    section = Section.from_dir(args.dirpath, workers=args.workers,
+                               node_type=args.node_type,
+                               fences=args.fences)
+    try:
+        deck = Deck(section, args.chunk_type)
+    except ValueError:
+        parser.error('unknown chunk type: ' + args.chunk_type)
+    if args.stats:
+        print(metrics.format_stats())
+    server = Deck_server(args.socket, deck)
+    if mode is not None:
+        os.chmod(args.socket, mode)
+    print('serving {} nodes on {}'.format(len(deck.nodes), args.socket))
+    # removes the socket on kill as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,52 +1,545 @@
+import itertools
+import weakref
 import npyscreen as nps
 import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser import metrics
 
 
 # maybe I shouldn't build a new tree but re-use the section tree inside the
 # MLTreeMultiSelect widget
 class Chunk_tree(nps.TreeData):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (node, chunk_type, cache, pool) of a lazy tree node. The chunk is
+        # made on first use and the children are added when they are first
+        # needed
+        self._source = None
+        self._children_built = True
+        # title of the section, chunks shared by a Chunk_pool may have the
+        # title of another copy
+        self.title = None
+        # number of cards of this node and of the subtree starting at it,
+        # None while unknown. Set by update_card_counts()
+        self.cards = None
+        self.cards_below = None
+
     @classmethod
-    def from_node(cls, node, chunk_type):
-        '''node object needs to have a get_content and get_children method
-        '''
-        chunk = ch.chunk_factory(node.get_content(),
-                                 node.get_title(),
-                                 chunk_type)
-        root = cls(chunk, ignore_root=False, expanded=True)
-        cls.initialize_tree(root, node.get_children(), chunk_type)
+    def from_node(cls, node, chunk_type, cache=None, lazy=False, pool=None):
+        '''node object needs to have a get_content and get_children method.
+        If a Parse_cache is given, chunks are taken from / stored in it.
+        With a dedup.Chunk_pool, copies of a chunk share one object.
+
+        With lazy, nothing is extracted up front: a node makes its chunk when
+        it is shown or selected and its children when it is expanded.
+        '''
+        if lazy:
+            root = cls(ignore_root=False, expanded=True)
+            root._set_source(node, chunk_type, cache, pool)
+            return root
+        with metrics.timer('chunk'):
+            chunk = cls._make_chunk(node, chunk_type, cache, pool)
+            root = cls(chunk, ignore_root=False, expanded=True)
+            root.title = node.get_title()
+            cls.initialize_tree(root, node.get_children(), chunk_type, cache,
+                                pool=pool)
+            root.update_card_counts()
         return root
 
     @classmethod
-    def initialize_tree(cls, parent, children, chunk_type):
+    def initialize_tree(cls, parent, children, chunk_type, cache=None,
+                        chunks=None, pool=None):
+        '''adds children and all nodes below them to parent. Their chunks are
+        made in one batch, see _make_chunks(), unless chunks already has
+        them in depth-first order
+        '''
         if not children:
             return
-        for child in children:
-            chunk = ch.chunk_factory(child.get_content(),
-                                     child.get_title(),
+        nodes = []
+        # position in nodes of the parent of every node, -1 for parent
+        parents = []
+        stack = [(child, -1) for child in reversed(children)]
+        while stack:
+            node, parent_position = stack.pop()
+            position = len(nodes)
+            nodes.append(node)
+            parents.append(parent_position)
+            grandchildren = node.get_children()
+            if grandchildren:
+                stack.extend((child, position)
+                             for child in reversed(grandchildren))
+
+        tree_nodes = []
+        if chunks is None:
+            chunks = cls._make_chunks(nodes, chunk_type, cache, pool)
+        for node, chunk, parent_position in zip(nodes, chunks, parents):
+            tree_parent = parent if parent_position < 0 \
+                else tree_nodes[parent_position]
+            tree_node = tree_parent.new_child(chunk, expanded=False)
+            tree_node.title = node.get_title()
+            tree_nodes.append(tree_node)
+
+    @classmethod
+    def _make_chunks(cls, nodes, chunk_type, cache, pool=None):
+        '''the chunks of many nodes, like _make_chunk() for each. Only nodes
+        with a marker of the chunk type (a fence for code) in their content
+        are extracted: the contents of Sections are prefiltered with
+        Chunk.chunk_batch() (or the chunk_batch() of the pool), compact
+        sections check their buffer with has_marker()
+        '''
+        chunks = [None] * len(nodes)
+        if cache is not None:
+            for idx, node in enumerate(nodes):
+                chunk = cache.get_chunk(node, chunk_type)
+                if chunk is not None and pool is not None:
+                    chunk = pool.canonical(chunk)
+                chunks[idx] = chunk
+        todo = [idx for idx, chunk in enumerate(chunks) if chunk is None]
+        plain = [idx for idx in todo
+                 if getattr(nodes[idx], 'has_marker', None) is None]
+        chunk_batch = ch.chunk_batch if pool is None else pool.chunk_batch
+        batch = chunk_batch([nodes[idx].get_content() for idx in plain],
+                            [nodes[idx].get_title() for idx in plain],
+                            chunk_type)
+        for idx, chunk in zip(plain, batch):
+            chunks[idx] = chunk
+        markers = ch.markers(chunk_type)
+        for idx in todo:
+            node = nodes[idx]
+            if chunks[idx] is None:
+                if node.has_marker(markers):
+                    chunks[idx] = node.make_chunk(chunk_type)
+                    if pool is not None:
+                        chunks[idx] = pool.canonical(chunks[idx])
+                else:
+                    chunks[idx] = ch.empty_chunk(node.get_title(),
+                                                 chunk_type)
+            chunk = chunks[idx]
+            if isinstance(chunk, list):
+                chunk = chunks[idx] = ch.Chunk_group(chunk, node.get_title())
+            if metrics.enabled:
+                metrics.count('chunks', len(valid_chunks([chunk])))
+            if cache is not None:
+                cache.put_chunk(node, chunk_type, chunk)
+        if cache is not None:
+            metrics.count('chunk cache.hits', len(nodes) - len(todo))
+            metrics.count('chunk cache.misses', len(todo))
+        return chunks
+
+    @staticmethod
+    def _make_chunk(node, chunk_type, cache, pool=None):
+        if cache is not None:
+            chunk = cache.get_chunk(node, chunk_type)
+            if chunk is not None:
+                metrics.count('chunk cache.hits')
+                return chunk if pool is None else pool.canonical(chunk)
+            metrics.count('chunk cache.misses')
+        # compact sections make chunks that point into their buffer
+        make_chunk = getattr(node, 'make_chunk', None)
+        if make_chunk is not None:
+            chunk = make_chunk(chunk_type)
+        else:
+            chunk = ch.chunk_factory(node.get_content(),
+                                     node.get_title(),
                                      chunk_type)
-            tree_child = parent.new_child(chunk, expanded=False)
-            cls.initialize_tree(tree_child,
-                                child.get_children(),
-                                chunk_type)
+        if isinstance(chunk, list):
+            chunk = ch.Chunk_group(chunk, node.get_title())
+        if pool is not None:
+            chunk = pool.canonical(chunk)
+        if metrics.enabled:
+            metrics.count('chunks', len(valid_chunks([chunk])))
+        if cache is not None:
+            cache.put_chunk(node, chunk_type, chunk)
+        return chunk
+
+    def apply_edits(self, edits, chunk_type, cache=None, pool=None):
+        '''applies the edits returned by watcher.update_tree() to this tree,
+        so it stays in sync with the Section tree. Replaced nodes keep their
+        expanded and selected state.
+        '''
+        for action, index_path, node in edits:
+            parent = self
+            for idx in index_path[:-1]:
+                if not parent._children_built:
+                    break
+                parent = parent._children[idx]
+            if not parent._children_built:
+                # will be built from the updated Section tree when expanded
+                continue
+            children = parent._children
+            idx = index_path[-1]
+
+            if action == 'remove':
+                children.pop(idx).set_parent(None)
+                continue
+
+            new = type(self)(parent=parent, expanded=False)
+            if self._source is not None:
+                new._set_source(node, chunk_type, cache, pool)
+            else:
+                new.set_content(self._make_chunk(node, chunk_type, cache,
+                                                 pool))
+                new.title = node.get_title()
+                self.initialize_tree(new, node.get_children(), chunk_type,
+                                     cache, pool=pool)
+            if action == 'replace':
+                old = children[idx]
+                new.expanded = old.expanded
+                new.selected = old.selected
+                children[idx] = new
+                old.set_parent(None)
+            else:
+                children.insert(idx, new)
+        self.update_card_counts()
+
+    def update_card_counts(self):
+        '''sets cards and cards_below of this node and all built nodes below
+        it. They are None for lazy nodes whose chunk or children were not
+        made yet, and for the nodes above them
+        '''
+        # children come after their parent, go backwards to count them first
+        for node in reversed(list(self.walk_built())):
+            node._update_count()
+
+    def _update_count(self):
+        if self.content is None:
+            self.cards = None
+        else:
+            self.cards = len(valid_chunks([self.content]))
+        below = self.cards if self._children_built else None
+        for child in self._children if self._children_built else ():
+            if below is None or child.cards_below is None:
+                below = None
+                break
+            below += child.cards_below
+        self.cards_below = below
+
+    def file_nodes(self):
+        '''the tree nodes of the unparsed files (Lazy_sections) of a lazy
+        tree. The directory nodes above them are built, the files are not
+        parsed
+        '''
+        files = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._children_built:
+                stack.extend(reversed(node._children))
+                continue
+            source = node._source[0]
+            if getattr(source, 'is_loaded', None) and \
+                    not source.is_loaded():
+                files.append(node)
+            else:
+                node._build_children()
+                stack.extend(reversed(node._children))
+        return files
+
+    def set_loaded(self, chunks):
+        '''fills a node of file_nodes() with the chunks of its Section and of
+        all nodes below it, in depth-first order, made by a background
+        loader. A node that was expanded in the meantime keeps its lazy
+        children
+        '''
+        node, chunk_type, cache, pool = self._source
+        if self.content is None:
+            self.content = chunks[0]
+        if not self._children_built:
+            self._children_built = True
+            self.initialize_tree(self, node.get_children(), chunk_type,
+                                 cache, chunks[1:], pool)
+        self.update_card_counts()
+        # the directories above only have an empty chunk, make it to count
+        parent = self.get_parent()
+        while parent is not None:
+            parent.get_content()
+            parent._update_count()
+            parent = parent.get_parent()
+
+    def may_have_cards(self):
+        '''False if the node has no cards. Uses the card count or the chunk if
+        they are known, otherwise only checks the content for a marker of the
+        chunk type
+        '''
+        if self.cards is not None:
+            return self.cards > 0
+        if self.content is not None or self._source is None:
+            return bool(valid_chunks([self.get_content()]))
+        node, chunk_type = self._source[:2]
+        markers = ch.markers(chunk_type)
+        has_marker = getattr(node, 'has_marker', None)
+        if has_marker is not None:
+            return has_marker(markers)
+        return ch.marker_mask([node.get_content()], markers)[0]
+
+    def walk_built(self, build=False):
+        '''yields this node and all nodes below it in depth-first order.
+        Unlike walk_tree(), it skips the children of lazy nodes that were not
+        built yet instead of building them, unless build is True. The nodes
+        themselves are yielded, not weak proxies.
+        '''
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if build:
+                node._build_children()
+            stack.extend(reversed(node.built_children()))
+
+    def walk_parsed(self, is_parsed):
+        '''yields this node and the nodes below it in depth-first order, like
+        walk_built(), but builds the children of lazy nodes whose Section is
+        parsed. is_parsed(section) is False for a section whose children are
+        left out, see Search_index.is_parsed(). Nothing is parsed
+        '''
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node._source is not None and \
+                    not is_parsed(node._source[0]):
+                continue
+            node._build_children()
+            stack.extend(reversed(node._children))
+
+    def built_children(self):
+        '''the children of this node, none for a lazy node whose children
+        were not built yet. Nothing is parsed
+        '''
+        return self._children if self._children_built else []
+
+    def source(self):
+        '''(Section, chunk type) a lazy node makes its chunk and children
+        from, None for a node that is not lazy
+        '''
+        if self._source is None:
+            return None
+        return self._source[:2]
+
+    def get_heading_path(self):
+        '''titles from below the root down to this node'''
+        path = []
+        node = self
+        parent = node.get_parent()
+        while parent is not None:
+            path.append(node.get_content_for_display())
+            node = parent
+            parent = node.get_parent()
+        path.reverse()
+        return path
+
+    def get_content(self):
+        if self.content is None and self._source is not None:
+            self.content = self._make_chunk(*self._source)
+        return self.content
 
     def get_content_for_display(self):
+        if self.title is not None:
+            return self.title
         return self.get_content().get_title()
 
+    def has_children(self):
+        if not self._children_built:
+            node = self._source[0]
+            # an unparsed file may have headings, show it as expandable
+            return not node.is_loaded() or bool(node.get_children())
+        return super().has_children()
+
+    def get_children(self):
+        self._build_children()
+        return super().get_children()
+
+    def get_children_objects(self):
+        self._build_children()
+        return super().get_children_objects()
+
+    def _get_children_list(self):
+        self._build_children()
+        return super()._get_children_list()
+
+    def _set_source(self, node, chunk_type, cache, pool=None):
+        self._source = (node, chunk_type, cache, pool)
+        self._children_built = False
+        self.title = node.get_title()
+        # nodes of a deck (see deck.Deck_section) know their card counts
+        # before their chunks are made
+        card_counts = getattr(node, 'card_counts', None)
+        if card_counts is not None:
+            self.cards, self.cards_below = card_counts()
+
+    def _build_children(self):
+        if self._children_built:
+            return
+        self._children_built = True
+        node, chunk_type, cache, pool = self._source
+        for child in node.get_children() or []:
+            tree_child = self.new_child(expanded=False)
+            tree_child._set_source(child, chunk_type, cache, pool)
+
+
+def valid_chunks(chunks):
+    '''the chunks that have content, with groups replaced by their chunks'''
+    valid = []
+    for chunk in chunks:
+        if isinstance(chunk, ch.Chunk_group):
+            valid.extend(c for c in chunk.get_content() if c.get_content())
+        elif chunk.get_content():
+            valid.append(chunk)
+    return valid
+
+
+class Tree_positions():
+    '''the nodes of a Chunk_tree at the positions of a Search_index of its
+    Section tree. The nodes below the files a lazy index added later (see
+    Search_index.appended) are added by update()
+    '''
+
+    def __init__(self, tree, index):
+        self.index = index
+        # the same depth-first order as the positions of the index, a lazy
+        # index leaves out the files that were not loaded
+        self.nodes = list(tree.walk_parsed(index.is_parsed))
+        self._appended = 0
+
+    def update(self):
+        '''adds the nodes the index added since the last call'''
+        appended = self.index.appended
+        for position in appended[self._appended:]:
+            below = self.nodes[position].walk_built(build=True)
+            self.nodes.extend(itertools.islice(below, 1, None))
+        self._appended = len(appended)
+
+    def __getitem__(self, position):
+        return self.nodes[position]
+
+
+class Counted_tree_line(nps.TreeLineSelectable):
+    '''tree line showing the number of cards below a node, if it is known'''
+
+    def _get_content_for_display(self, vl):
+        text = super()._get_content_for_display(vl)
+        count = getattr(vl, 'cards_below', None)
+        if count is None:
+            return text
+        return '{} ({})'.format(text, count)
+
+
+class Filtered_tree(nps.MLTreeMultiSelect):
+    '''only shows the tree nodes whose id() is in visible, unless visible is
+    None. Nodes without cards below them are not shown.
+    '''
+
+    _contained_widgets = Counted_tree_line
+
+    def __init__(self, *args, **kwargs):
+        self.visible = None
+        super().__init__(*args, **kwargs)
+
+    def _get_tree_as_list(self, vl):
+        # walk_tree() yields proxies, walk the real nodes to compare ids
+        nodes = []
+        stack = [vl]
+        while stack:
+            node = stack.pop()
+            if self.visible is not None and id(node) not in self.visible:
+                continue
+            if node.cards_below == 0 and node is not vl:
+                continue
+            if node is not vl or not vl.ignore_root:
+                nodes.append(weakref.proxy(node))
+            if node.expanded:
+                stack.extend(reversed(node._get_children_list()))
+        return nodes
+
 
 class Chunk_choice_form(nps.Form):
 
-    def __init__(self, tree_data, **kwargs):
+    def __init__(self, tree_data, search_index=None, progress=False,
+                 **kwargs):
+        '''search_index is a Search_index of the Section tree the tree_data
+        was made from. With progress, the form has a status line for
+        set_progress()
+        '''
         self.tree_data = tree_data
+        self.search_index = search_index
+        self.progress = progress
+        self._query = ''
+        self._tree_nodes = None
+        self._search_selected = []
         super().__init__(**kwargs)
 
     def create(self):
-        self.tree = self.add(nps.MLTreeMultiSelect,
-                             name='select topics',
-                             values=self.tree_data)
+        if self.progress:
+            self.status = self.add(nps.FixedText, value='', editable=False)
+        if self.search_index is not None:
+            self.search = self.add(nps.TitleText, name='search:',
+                                   begin_entry_at=10)
+        self.tree = self.add(Filtered_tree, name='select topics')
+        # npyscreen 5 copies values given to the constructor as a list
+        self.tree.values = self.tree_data
+
+    def refresh_tree(self, search_index=None):
+        '''call after the tree data changed, with the new index if the tree
+        has one
+        '''
+        if search_index is not None:
+            self.search_index = search_index
+            self._tree_nodes = None
+            self._search_selected = []
+            if self._query:
+                self.apply_search(self._query)
+        self.tree.clearDisplayCache()
+        if self.editing:
+            self.display()
+
+    def set_progress(self, text):
+        self.status.value = text
+        if self.editing:
+            self.status.display()
+
+    def adjust_widgets(self):
+        # called by npyscreen after every key press
+        if self.search_index is None or self.search.value == self._query:
+            return
+        self._query = self.search.value
+        self.apply_search(self._query)
+        self.tree.display()
+
+    def apply_search(self, query):
+        '''shows only the nodes matching query and their parents, and selects
+        the matches. Matches of the previous query are unselected again. An
+        empty query shows the whole tree.
+        '''
+        for node in self._search_selected:
+            node.selected = False
+        self._search_selected = []
+        self.tree.cursor_line = 0
+        self.tree.clearDisplayCache()
+        if not query.strip():
+            self.tree.visible = None
+            return
+
+        positions = self.search_index.search(query)
+        if self._tree_nodes is None:
+            self._tree_nodes = Tree_positions(self.tree_data,
+                                              self.search_index)
+        self._tree_nodes.update()
+        visible = set()
+        for position in positions:
+            node = self._tree_nodes[position]
+            node.selected = True
+            self._search_selected.append(node)
+            visible.add(id(node))
+            for parent in self.search_index.ancestors(position):
+                parent = self._tree_nodes[parent]
+                parent.expanded = True
+                if id(parent) in visible:
+                    break
+                visible.add(id(parent))
+        self.tree.visible = visible
 
     def get_values(self):
-        selected = self.tree.get_selected_objects(return_node=False)
-        selected = list(selected)
-        valid = [ch for ch in selected if ch.get_content()]
-        return valid
+        # walk_built() does not parse files that were never expanded
+        return valid_chunks(node.get_content()
+                            for node in self.tree_data.walk_built()
+                            if node.selected)
@@ -0,0 +1,75 @@
+import json
+import time
+import unittest
+try:
+    import curses
+except ImportError:
+    curses = None
+from test import helpers
+
+
+def drive_cards(result_path, nr_cards):
+    '''shows the prompt and the answer of nr_cards cards like the app does
+    and writes the forms that showed them to result_path. Needs a terminal
+    '''
+    import memit.markdown_parser.Chunk as ch
+    from memit import app as memit_app
+    from memit import scheduler as sched
+
+    curses.initscr()
+    try:
+        app = memit_app.App(nr_chunks=nr_cards,
+                            scheduler=sched.Scheduler(':memory:'))
+        chunks = [ch.Code_chunk('q{0}\n```python\nx = {0}\n```'.format(idx),
+                                'copy {}'.format(idx))
+                  for idx in range(nr_cards)]
+        # the chunks have the titles of other copies
+        app.start_session([(['notes', 'title {}'.format(idx)], chunk)
+                           for idx, chunk in enumerate(reversed(chunks))])
+        forms = set()
+        titles = []
+        while app.NEXT_ACTIVE_FORM is not None:
+            titles.append([app.prompt_form.name,
+                           app.prompt_form.pager.values[0]])
+            for name in ('show_prompt', 'show_answer'):
+                form = app.getForm(name)
+                forms.add(id(form))
+                # what next_form() and switching to the form do
+                app._transition_start = time.perf_counter()
+                form.display()
+                if name == 'show_prompt':
+                    app.show_answer()
+            app.session.answer(app.state, app.next_chunk, sched.GOOD)
+            app.show_prompt()
+        result = {
+            'forms': len(forms),
+            'titles': titles,
+            'transitions': len(app.transition_times),
+            'answer_lines': app.answer_form.pager.values
+        }
+    finally:
+        curses.endwin()
+    with open(result_path, 'w') as file:
+        json.dump(result, file)
+
+
+@unittest.skipIf(helpers.pty is None, 'needs a pseudo terminal')
+class Card_forms_test(unittest.TestCase):
+
+    def test_forms_are_reused(self):
+        result = helpers.run_in_terminal(self, 'test.app_test',
+                                         'drive_cards', 30)
+        # every card is shown by the same two forms
+        self.assertEqual(result['forms'], 2)
+        # with the title of their own heading
+        self.assertEqual(sorted(result['titles']),
+                         sorted(['title {}'.format(idx),
+                                 'q{}'.format(29 - idx)]
+                                for idx in range(30)))
+        self.assertEqual(result['transitions'], 60)
+        self.assertEqual(len(result['answer_lines']), 1)
+        self.assertTrue(result['answer_lines'][0].startswith('x = '))
+
+
+if __name__ == '__main__':
+    unittest.main()
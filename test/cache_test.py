@@ -0,0 +1,59 @@
+import os
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.topic_choice import Chunk_tree
+from test import helpers
+
+
+class Parse_cache_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.notes = os.path.join(self.path, 'notes')
+        self.cache_dir = os.path.join(self.path, 'cache')
+        self.write('notes/a.md', '# a\nprompt\n```python\nx = 1\n```\n')
+        self.write('notes/b.md', '# b\n## b1\ntext\n')
+
+    def load(self, **kwargs):
+        cache = Parse_cache(self.cache_dir, **kwargs)
+        section = Section.from_dir(self.notes, cache=cache)
+        tree = Chunk_tree.from_node(section, 'code', cache)
+        cache.save()
+        return cache, section, tree
+
+    def test_warm_start(self):
+        cold, section, _ = self.load()
+        self.assertEqual(cold.stats['misses'], 2)
+        self.assertEqual(cold.stats['writes'], 2)
+
+        warm, cached, tree = self.load()
+        self.assertEqual(warm.stats['hits'], 2)
+        self.assertEqual(warm.stats['writes'], 0)
+        self.assertEqual(section.to_dict_recursive(),
+                         cached.to_dict_recursive())
+        file_a = cached.get_children()[0]
+        self.assertIsNotNone(warm.get_chunk(file_a.get_children()[0], 'code'))
+        file_node = list(tree.get_children())[0]
+        code = list(file_node.get_children())[0].get_content()
+        self.assertEqual(code.get_content(), 'x = 1')
+
+    def test_changed_file(self):
+        self.load()
+        self.write('notes/b.md', '# b changed, and longer\n')
+        cache, section, _ = self.load()
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['stale'], 1)
+        title = section.get_children()[1].get_children()[0].get_title()
+        self.assertEqual(title, 'b changed, and longer')
+
+    def test_hash(self):
+        self.load(use_hash=True)
+        os.utime(os.path.join(self.notes, 'a.md'), (0, 0))
+        cache, _, _ = self.load(use_hash=True)
+        self.assertEqual(cache.stats['hits'], 2)
+
+    def test_invalidate(self):
+        cache, _, _ = self.load()
+        cache.invalidate()
+        cache, _, _ = self.load()
+        self.assertEqual(cache.stats['misses'], 2)
@@ -1,5 +1,6 @@
 import unittest
 import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser import metrics
 
 single_row = '''This is the prompt
 ```r
@@ -44,3 +45,172 @@ class Code_chunk_test(unittest.TestCase):
                          ('This is the prompt\n'
                           'That has two rows'))
         self.assertEqual(chunk.get_syntax(), None)
+
+    def test_to_JSON_syntax(self):
+        self.assertEqual(ch.Code_chunk(single_row, 'test').to_JSON(),
+                         {'code': 'table = data.frame()', 'syntax': 'r'})
+
+
+several_blocks = '''First prompt
+```r
+select(df)
+```
+Second prompt
+
+```python
+x = 1
+y = 2
+```
+```
+no prompt, no syntax
+```
+trailing text'''
+
+
+class Code_block_chunk_test(unittest.TestCase):
+
+    def test_several_blocks(self):
+        chunks = ch.chunk_factory(several_blocks, 'test', 'code_blocks')
+        self.assertEqual([c.get_content() for c in chunks],
+                         ['select(df)', 'x = 1\ny = 2',
+                          'no prompt, no syntax'])
+        self.assertEqual([c.prompt for c in chunks],
+                         ['First prompt', 'Second prompt', None])
+        self.assertEqual([c.get_syntax() for c in chunks],
+                         ['r', 'python', None])
+        self.assertEqual(chunks[1].get_title(), 'test')
+
+    def test_no_blocks(self):
+        self.assertEqual(ch.chunk_factory('just text', 't', 'code_blocks'), [])
+
+    def test_same_as_code_chunk_for_one_block(self):
+        for string in [single_row, two_rows, no_syntax]:
+            block, = ch.Code_block_chunk.from_section(string, 'test')
+            chunk = ch.Code_chunk(string, 'test')
+            self.assertEqual(block.get_content(), chunk.get_content())
+            self.assertEqual(block.get_prompt(), chunk.get_prompt())
+            self.assertEqual(block.get_syntax(), chunk.get_syntax())
+
+
+class Chunk_batch_test(unittest.TestCase):
+
+    def test_fence_mask(self):
+        strings = ['no code', single_row, '', 'a ``', '` b', two_rows,
+                   'text', no_syntax]
+        self.assertEqual(ch.fence_mask(strings),
+                         [False, True, False, False, False, True, False,
+                          True])
+        self.assertEqual(ch.fence_mask([]), [])
+
+    def test_same_as_chunk_factory(self):
+        strings = ['no code', single_row, 'text\n``` not closed', two_rows,
+                   no_syntax + '\n' + single_row]
+        titles = ['t%d' % idx for idx in range(len(strings))]
+        for chunk_type in ch.CHUNK_TYPES:
+            batch = ch.chunk_batch(strings, titles, chunk_type)
+            for chunk, string, title in zip(batch, strings, titles):
+                single = ch.chunk_factory(string, title, chunk_type)
+                if chunk_type == 'code':
+                    chunk, single = [chunk], [single]
+                self.assertEqual(
+                    [(c.get_title(), c.get_prompt(), c.get_content(),
+                      c.get_syntax()) for c in chunk],
+                    [(c.get_title(), c.get_prompt(), c.get_content(),
+                      c.get_syntax()) for c in single])
+        with self.assertRaises(ValueError):
+            ch.chunk_batch(strings, titles, 'no such type')
+
+
+mixed = '''Fill in
+```python
+x = {{c1::len}}(y) + {{z}}
+```
+term
+: first line
+: second line
+
+> Q: what
+> is it?
+> A: an
+> answer
+
+```r
+select(df)
+a
+: not a definition
+```
+'''
+
+
+class Extractor_test(unittest.TestCase):
+
+    def summary(self, chunks):
+        return [(type(c).__name__, c.get_prompt(), c.get_content())
+                for c in chunks]
+
+    def test_single_scan(self):
+        chunks = ch.chunk_factory(mixed, 't',
+                                  'code_blocks,cloze,definitions,qa')
+        self.assertEqual(self.summary(chunks), [
+            ('Cloze_chunk', 'Fill in\n\nx = [...](y) + [...]',
+             'x = len(y) + z'),
+            ('Definition_chunk', 'term', 'first line\nsecond line'),
+            ('Qa_chunk', 'what\nis it?', 'an\nanswer'),
+            ('Code_block_chunk', '--no prompt for this chunk--',
+             'select(df)\na\n: not a definition')])
+        self.assertEqual(chunks[0].to_JSON()['syntax'], 'python')
+        self.assertTrue(all(c.get_title() == 't' for c in chunks))
+
+    def test_same_as_separate_types(self):
+        combined = ch.chunk_factory(mixed, 't', 'qa,definitions,code_blocks')
+        separate = [c for chunk_type in ('code_blocks', 'definitions', 'qa')
+                    for c in ch.chunk_factory(mixed, 't', chunk_type)]
+        # prompts differ, they end at the previous card of any type
+        self.assertEqual(sorted(c.get_content() for c in combined),
+                         sorted(c.get_content() for c in separate))
+        # without cloze, the block with deletions is a plain code block
+        self.assertIn('{{z}}', combined[0].get_content())
+
+    def test_not_inside_code(self):
+        self.assertEqual(ch.chunk_factory('```\na\n: b\n```', 't',
+                                          'definitions'), [])
+
+    def test_unknown_types(self):
+        for chunk_type in ('code,qa', 'qa,nope', ''):
+            with self.assertRaises(ValueError):
+                ch.chunk_factory(mixed, 't', chunk_type)
+        self.assertEqual(ch.markers('code_blocks,cloze'), (ch.FENCE,))
+
+    def test_batch(self):
+        strings = ['> Q: a\n> A: b', 'no cards', 'x\n: y', mixed]
+        batch = ch.chunk_batch(strings, 'abcd', 'definitions,qa')
+        self.assertEqual([len(chunks) for chunks in batch], [1, 0, 1, 2])
+        self.assertEqual(ch.marker_mask(strings, ch.markers('qa')),
+                         [True, False, False, True])
+
+    def test_register(self):
+        class Todo_extractor(ch.Extractor):
+            name = 'todo'
+            pattern = '^TODO: ([^\\n]*)'
+            markers = ('TODO:',)
+
+            def build(self, groups, prompt, title):
+                return ch.Qa_chunk('todo', groups[0], title)
+
+        ch.register(Todo_extractor())
+        self.addCleanup(ch._scanners.clear)
+        self.addCleanup(ch.EXTRACTORS.pop, 'todo')
+        chunks = ch.chunk_factory('> Q: a\n> A: b\nTODO: c\n', 't',
+                                  'qa,todo')
+        self.assertEqual([c.get_content() for c in chunks], ['b', 'c'])
+
+    def test_timing(self):
+        metrics.reset()
+        metrics.enable()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.disable)
+        ch.chunk_factory(mixed, 't', 'code_blocks,cloze,qa')
+        timers = metrics.snapshot()['timers']
+        self.assertEqual(timers['extract qa']['calls'], 1)
+        self.assertEqual(timers['extract cloze']['calls'], 2)
+        self.assertEqual(timers['extract code_blocks']['calls'], 1)
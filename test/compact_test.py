@@ -0,0 +1,131 @@
+import os
+import pickle
+import random
+import unittest
+try:
+    import resource
+except ImportError:
+    resource = None
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.compact import Compact_section, Mapped_buffer
+from test import helpers
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+lines = ['# a', '## b', '### c', 'text', '', '```', '```r', 'x <- 1',
+         '```python', 'print(1)', 'inline ```x``` text']
+
+
+class Compact_section_test(unittest.TestCase):
+
+    def check_same(self, md_string, compact=None):
+        section = Section.from_string(md_string, 'test')
+        if compact is None:
+            compact = Compact_section.from_string(md_string, 'test')
+        self.assertEqual(section.to_dict_recursive(),
+                         compact.to_dict_recursive(), md_string)
+        for node, compact_node in zip(section.get_all_nodes(),
+                                      compact.get_all_nodes()):
+            chunk = ch.Code_chunk(node.get_content(), node.get_title())
+            compact_chunk = compact_node.make_chunk('code')
+            self.assertEqual(chunk.get_content(), compact_chunk.get_content())
+            self.assertEqual(chunk.get_prompt(), compact_chunk.get_prompt())
+            self.assertEqual(chunk.get_title(), compact_chunk.get_title())
+            if chunk.get_content():
+                self.assertEqual(chunk.get_syntax(),
+                                 compact_chunk.get_syntax())
+
+    def test_same_as_section(self):
+        with open(os.path.join(DATA, 'test.md'), 'r') as file:
+            self.check_same(file.read())
+        rand = random.Random(0)
+        for _ in range(300):
+            self.check_same('\n'.join(rand.choice(lines) for _ in range(15)))
+
+    def test_compact(self):
+        section = Section.from_file(os.path.join(DATA, 'test.md'),
+                                    node_type='compact')
+        self.assertFalse(hasattr(section, '__dict__'))
+        node = section.get_children()[0].get_children()[0]
+        chunk = node.make_chunk('code')
+        self.assertFalse(hasattr(chunk, '__dict__'))
+        self.assertIs(chunk.get_title(), node.get_title())
+        self.assertIs(node.buffer, section.buffer)
+
+
+class Mapped_section_test(Compact_section_test, helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.md_path = os.path.join(self.path, 'test.md')
+
+    def map_string(self, md_string):
+        with open(self.md_path, 'w', encoding='utf-8') as file:
+            file.write(md_string)
+        return Compact_section.from_file(self.md_path, mapped=True)
+
+    def test_same_as_section(self):
+        with open(os.path.join(DATA, 'test.md'), 'r') as file:
+            md_string = file.read()
+        self.check_same(md_string, self.map_string(md_string))
+        rand = random.Random(0)
+        for _ in range(300):
+            md_string = '\n'.join(rand.choice(lines + ['## \u00e9t\u00e9',
+                                                        '\u00fcber'])
+                                   for _ in range(15))
+            section = self.map_string(md_string)
+            if isinstance(section.buffer, Mapped_buffer):
+                self.check_same(md_string, section)
+
+    def test_compact(self):
+        section = Section.from_file(os.path.join(DATA, 'test.md'),
+                                    node_type='mapped')
+        self.assertIsInstance(section.buffer, Mapped_buffer)
+        self.assertIsInstance(section.get_content(), str)
+
+    def test_not_markdown(self):
+        with open(self.md_path, 'w') as file:
+            file.write('no headings here')
+        self.assertIsNone(Section._load_file(self.md_path, 1, 'mapped'))
+
+    def test_fallback(self):
+        with open(self.md_path, 'w', newline='') as file:
+            file.write('# a\r\ntext\r\n## b\r\nmore')
+        section = Compact_section.from_file(self.md_path, mapped=True)
+        self.assertNotIsInstance(section.buffer, Mapped_buffer)
+        self.assertEqual(Section.from_file(self.md_path).to_dict_recursive(),
+                         section.to_dict_recursive())
+
+        open(self.md_path, 'w').close()
+        section = Compact_section.from_file(self.md_path, mapped=True)
+        self.assertEqual(section.get_content(), '')
+
+    def test_pickle(self):
+        section = self.map_string('# a\ntext\n## b\n```\ncode\n```')
+        copy = pickle.loads(pickle.dumps(section))
+        self.assertEqual(section.to_dict_recursive(),
+                         copy.to_dict_recursive())
+        node = copy.get_children()[0].get_children()[0]
+        self.assertEqual(node.make_chunk('code').get_content(), 'code')
+        # the file is mapped again, its content is not in the pickle
+        self.assertNotIn(b'text', pickle.dumps(section))
+
+    @unittest.skipIf(resource is None, 'needs file descriptor limits')
+    def test_more_files_than_descriptors(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = 128
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        self.addCleanup(resource.setrlimit, resource.RLIMIT_NOFILE,
+                        (soft, hard))
+        for idx in range(limit * 2):
+            with open(os.path.join(self.path, 'f%03d.md' % idx),
+                      'w') as file:
+                file.write('# a\ntext %d\n```\ncode\n```\n' % idx)
+        section = Section.from_dir(self.path, node_type='mapped')
+        files = section.get_children()
+        self.assertEqual(len(files), limit * 2)
+        self.assertEqual(files[-1].get_children()[0].get_content(),
+                         'text %d\n```\ncode\n```' % (limit * 2 - 1))
+        self.assertEqual([f.get_children()[0].make_chunk('code').get_content()
+                          for f in files], ['code'] * limit * 2)
@@ -0,0 +1,93 @@
+import os
+import unittest
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser import deck
+from memit.topic_choice import Chunk_tree, valid_chunks
+from test import helpers
+
+
+FILES = {
+    'python/pandas.md': '# read\nhow to read\n```python\npd.read_csv(f)\n```\n'
+                        '## write\n```python\ndf.to_csv(f)\n```\n'
+                        '```python\ndf.to_json(f)\n```\n',
+    'r/dplyr.md': '# select\n```r\nselect(df)\n```\n# empty\nno code ü\n',
+    'top.md': '# top\ntext\n'
+}
+
+
+def tree_cards(tree):
+    return [(node.get_heading_path(), chunk.get_title(), chunk.get_prompt(),
+             chunk.get_content(), chunk.get_syntax(), chunk.to_JSON())
+            for node in tree.walk_built(build=True)
+            for chunk in valid_chunks([node.get_content()])]
+
+
+class Deck_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write_files(FILES, 'notes')
+        self.section = Section.from_dir(os.path.join(self.path, 'notes'))
+        self.deck_path = os.path.join(self.path, 'notes.deck')
+
+    def open_deck(self, chunk_type):
+        deck.build_deck(self.section, self.deck_path, chunk_type)
+        deck_file = deck.Deck_file(self.deck_path)
+        self.addCleanup(deck_file.close)
+        return deck_file
+
+    def test_same_tree(self):
+        deck_file = self.open_deck('code')
+        self.assertEqual(len(deck_file), 11)
+
+        def walk(node):
+            return (node.get_title(), node.get_content(), node.get_level(),
+                    node.get_path(),
+                    [walk(child) for child in node.get_children() or []])
+
+        self.assertEqual(walk(deck_file.root()), walk(self.section))
+
+    def test_same_chunks(self):
+        for chunk_type in ('code', 'code_blocks'):
+            deck_file = self.open_deck(chunk_type)
+            self.assertEqual(deck_file.chunk_type, chunk_type)
+            expected = tree_cards(Chunk_tree.from_node(self.section,
+                                                       chunk_type))
+            tree = Chunk_tree.from_node(deck_file.root(), chunk_type,
+                                        lazy=True)
+            self.assertEqual(tree_cards(tree), expected)
+
+    def test_card_counts_without_chunks(self):
+        deck_file = self.open_deck('code_blocks')
+        tree = Chunk_tree.from_node(deck_file.root(), 'code_blocks',
+                                    lazy=True)
+        self.assertEqual((tree.cards, tree.cards_below), (0, 4))
+        self.assertIsNone(tree.content)
+        python = list(tree.get_children())[0]
+        self.assertEqual(python.title, 'python')
+        self.assertEqual(python.cards_below, 3)
+        self.assertIsNone(python.content)
+
+    def test_chunk_type_mismatch(self):
+        deck_file = self.open_deck('code')
+        with self.assertRaises(ValueError):
+            deck_file.root().make_chunk('code_blocks')
+
+    def test_not_a_deck(self):
+        with open(self.deck_path, 'wb') as file:
+            file.write(b'# just markdown\n')
+        with self.assertRaises(ValueError):
+            deck.Deck_file(self.deck_path)
+
+    def test_rebuild_while_open(self):
+        old = self.open_deck('code')
+        deck.build_deck(Section.from_string('# new\n```\nx\n```\n', 'new'),
+                        self.deck_path, 'code')
+        self.assertEqual(old.root().get_title(), 'notes')
+        new = deck.Deck_file(self.deck_path)
+        self.addCleanup(new.close)
+        self.assertEqual(new.root().get_title(), 'new')
+
+
+if __name__ == '__main__':
+    unittest.main()
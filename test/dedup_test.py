@@ -0,0 +1,120 @@
+import io
+import unittest
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser import dedup, export
+import memit.markdown_parser.Chunk as ch
+from memit.topic_choice import Chunk_tree, valid_chunks
+from test import helpers
+
+
+SNIPPET = 'prompt\n```python\nx = 1\n```\n'
+FILES = {
+    'a.md': '# one\n' + SNIPPET + '# other\n```r\ny\n```\n',
+    'b.md': '# copy\n' + SNIPPET.replace('\n', '\r\n'),
+    'c.md': '# same\n' + SNIPPET + '# none\nno code\n'
+}
+
+
+def records(chunks):
+    return [[c.to_JSON() for c in chunk] if isinstance(chunk, list)
+            else chunk.to_JSON() for chunk in chunks]
+
+
+class Chunk_key_test(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(dedup.normalize('\n a  \r\nb\t\n\n'), ' a\nb')
+        self.assertEqual(dedup.normalize(None), '')
+
+    def test_title_and_syntax_are_ignored(self):
+        first = ch.Code_block_chunk('x = 1', 'python', 'prompt', 'one')
+        second = ch.Code_block_chunk('x = 1  \n', None, 'prompt\n', 'two')
+        self.assertEqual(dedup.chunk_key(first), dedup.chunk_key(second))
+
+    def test_prompt_and_code_are_separate(self):
+        first = ch.Code_block_chunk('b', None, 'a', 't')
+        second = ch.Code_block_chunk('', None, 'a\0b', 't')
+        self.assertNotEqual(dedup.chunk_key(first), dedup.chunk_key(second))
+
+
+class Chunk_pool_test(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = dedup.Chunk_pool()
+
+    def test_canonical(self):
+        first = ch.Code_chunk(SNIPPET, 'one')
+        second = ch.Code_chunk(SNIPPET, 'two')
+        self.assertIs(self.pool.canonical(first), first)
+        self.assertIs(self.pool.canonical(second), first)
+        self.assertEqual(len(self.pool), 1)
+        self.assertEqual(self.pool.stats['duplicates'], 1)
+
+    def test_empty_chunks_are_not_shared(self):
+        empty = ch.Code_chunk('no code', 'one')
+        self.assertIs(self.pool.canonical(empty), empty)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_chunk_batch_reuses_contents(self):
+        strings = [SNIPPET, 'no code', SNIPPET]
+        for chunk_type in ('code', 'code_blocks'):
+            expected = ch.chunk_batch(strings, ['a', 'b', 'c'], chunk_type)
+            chunks = self.pool.chunk_batch(strings, ['a', 'b', 'c'],
+                                           chunk_type)
+            again = self.pool.chunk_batch(strings, ['d', 'e', 'f'],
+                                          chunk_type)
+            self.assertEqual(records(chunks), records(expected))
+            first, copy = chunks[0], again[2]
+            if isinstance(first, list):
+                first, copy = first[0], copy[0]
+            self.assertIs(copy, first)
+        self.assertEqual(self.pool.stats['reused'], 4)
+        # the contents are kept as digests, not as strings
+        self.assertNotIn(SNIPPET, self.pool._contents)
+        self.assertTrue(all(isinstance(key, bytes)
+                            for key in self.pool._contents))
+
+
+class Dedup_tree_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write_files(FILES, newline='')
+
+    def cards(self, tree):
+        return [(node.get_heading_path(), chunk) for node in tree.walk_built()
+                for chunk in valid_chunks([node.get_content()])]
+
+    def test_copies_share_one_chunk(self):
+        for lazy in (False, True):
+            pool = dedup.Chunk_pool()
+            tree = Chunk_tree.from_node(Section.from_dir(self.path), 'code',
+                                        lazy=lazy, pool=pool)
+            cards = self.cards(tree) if not lazy else [
+                (node.get_heading_path(), chunk)
+                for node in tree.walk_built(build=True)
+                for chunk in valid_chunks([node.get_content()])]
+            snippets = [chunk for _, chunk in cards
+                        if chunk.get_content() == 'x = 1']
+            self.assertEqual(len(snippets), 3)
+            self.assertTrue(all(chunk is snippets[0] for chunk in snippets))
+            # the tree still shows the title of every copy
+            paths = [path for path, chunk in cards if chunk is snippets[0]]
+            self.assertEqual([path[-1] for path in paths],
+                             ['one', 'copy', 'same'])
+
+    def test_unique_cards(self):
+        tree = Chunk_tree.from_node(Section.from_dir(self.path), 'code')
+        cards = list(dedup.unique_cards(self.cards(tree)))
+        self.assertEqual([path for path, _ in cards],
+                         [['a', 'one'], ['a', 'other']])
+
+    def test_export_unique(self):
+        file = io.StringIO()
+        self.assertEqual(export.export(self.path, file), 4)
+        file = io.StringIO()
+        self.assertEqual(export.export(self.path, file, unique=True), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
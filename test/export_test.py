@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import os
+import shutil
+from memit.markdown_parser.Section import Section
+import memit.markdown_parser.Chunk as ch
+from memit.markdown_parser import export
+from memit.topic_choice import Chunk_tree, valid_chunks
+from test import helpers
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class Export_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.path, 'r', 'tidyverse'))
+        shutil.copy(os.path.join(DATA, 'test.md'),
+                    os.path.join(self.path, 'r', 'tidyverse', 'test.md'))
+        self.write('r/dplyr.md', '# select\nprompt\n```r\nselect(df)\n```\n'
+                   '## two blocks\n```r\na\n```\n```r\nb\n```\n')
+        self.write('a.md', '# a\n```python\nx = 1\n```\n')
+        self.write('notes.txt', 'not markdown\n')
+
+    def tree_cards(self, path, chunk_type):
+        if os.path.isdir(path):
+            section = Section.from_dir(path)
+        else:
+            section = Section.from_file(path)
+        tree = Chunk_tree.from_node(section, chunk_type)
+        return [(node.get_heading_path(), chunk.to_JSON())
+                for node in tree.walk_built()
+                for chunk in valid_chunks([node.get_content()])]
+
+    def test_same_as_tree(self):
+        for chunk_type in ['code', 'code_blocks']:
+            for path in [self.path, os.path.join(DATA, 'test.md')]:
+                chunks = export.iter_chunks(export.iter_sections(path),
+                                            chunk_type)
+                self.assertEqual([(heading_path, chunk.to_JSON())
+                                  for heading_path, chunk in chunks],
+                                 self.tree_cards(path, chunk_type))
+
+    def test_files(self):
+        files = [(os.path.relpath(filepath, self.path), level, titles)
+                 for filepath, level, titles in export.iter_files(self.path)]
+        self.assertEqual(files, [
+            ('a.md', 2, []),
+            ('notes.txt', 2, []),
+            (os.path.join('r', 'dplyr.md'), 3, ['r']),
+            (os.path.join('r', 'tidyverse', 'test.md'), 4,
+             ['r', 'tidyverse'])
+        ])
+
+    def test_jsonl(self):
+        output = io.StringIO()
+        count = export.export(self.path, output, 'jsonl', 'code_blocks')
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(records), count)
+        self.assertEqual(records[0], {
+            'path': ['a', 'a'],
+            'title': 'a',
+            'prompt': None,
+            'content': 'x = 1',
+            'syntax': 'python'
+        })
+        self.assertEqual([r['content'] for r in records[1:4]],
+                         ['select(df)', 'a', 'b'])
+
+    def test_no_prompt(self):
+        for node_type in ['section', 'compact']:
+            chunks = export.iter_chunks(export.iter_sections(
+                os.path.join(self.path, 'a.md'), node_type=node_type))
+            chunk = next(chunks)[1]
+            self.assertEqual(chunk.get_prompt(), ch.NO_PROMPT)
+            self.assertIsNone(export.to_record([], chunk)['prompt'])
+            self.assertEqual(export.anki_fields(chunk)[0], '<b>a</b>')
+
+    def test_anki(self):
+        output = io.StringIO(newline='')
+        count = export.export(self.path, output, 'anki')
+        rows = list(csv.reader(io.StringIO(output.getvalue(), newline='')))
+        self.assertEqual(len(rows), count)
+        # a.md has no prompt
+        self.assertEqual(rows[0][0], '<b>a</b>')
+        self.assertEqual(rows[1], ['<b>select</b><br>prompt',
+                                   '<pre><code>select(df)</code></pre>',
+                                   'r::dplyr::select'])
+        self.assertEqual(export.anki_tags(['r', 'two blocks']),
+                         'r::two_blocks')
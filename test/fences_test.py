@@ -0,0 +1,131 @@
+import os
+import random
+import re
+import unittest
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.markdown_parser.compact import Compact_section
+from memit.markdown_parser import fences, tokenizer
+import memit.markdown_parser.Chunk as ch
+from test import helpers
+
+
+# pieces of random documents
+TOKENS = ['```', '`', '\n', 'a', 'py', '```py\n', '\n```', '#', '# h\n',
+          ' ', '\n> Q: q', '\n: d', '{{', '}}']
+
+FENCED = '''# top
+text
+```python
+# comment
+x = 1
+```
+## child
+```bash
+# another comment
+```
+'''
+
+
+def random_documents(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(TOKENS)
+                      for _ in range(rng.randint(0, 30)))
+
+
+class Fences_test(unittest.TestCase):
+
+    def test_same_as_regexes(self):
+        code = re.compile(ch.Code_chunk._regexp, re.DOTALL)
+        code_bytes = re.compile(ch.Code_chunk._regexp.encode(), re.DOTALL)
+        for string in random_documents(5000):
+            match = code.search(string)
+            block = fences.find_code(string)
+            self.assertEqual(match and (match.span(), match.group(1)),
+                             block and ((block.start, block.end),
+                                        fences.syntax(string, block)))
+
+            self.assertEqual(
+                [(block.start, block.end, fences.syntax(string, block),
+                  string[block.code_start:block.code_end])
+                 for block in fences.iter_blocks(string)],
+                [(match.start(), match.end(), match.group(1), match.group(2))
+                 for match in ch.Code_block_chunk._fence.finditer(string)])
+
+            self.assertEqual(fences.strip_fences(string),
+                             re.sub('```', '', re.sub('```([A-z]+)?\\n', '',
+                                                      string)))
+
+            data = string.encode()
+            match = code_bytes.search(data, 1, len(data) - 1)
+            block = fences.find_code(data, 1, len(data) - 1)
+            self.assertEqual(match and match.span(),
+                             block and (block.start, block.end))
+
+
+class Fenced_tokenize_test(helpers.Temp_dir_test):
+
+    def test_comments_in_code_are_not_headings(self):
+        section = Section.from_string(FENCED, 'doc', fences=True)
+        top = section.get_children()[0]
+        self.assertEqual([child.get_title() for child in top.get_children()],
+                         ['child'])
+        self.assertIn('# comment', top.get_content())
+        self.assertIn('# another comment',
+                      top.get_children()[0].get_content())
+        # without fences the comments split the sections
+        plain = Section.from_string(FENCED, 'doc')
+        self.assertEqual(len(plain.get_children()), 3)
+
+    def test_info_string_does_not_close(self):
+        headings = tokenizer.tokenize('```\n```python\n# x\n```\n# y\n',
+                                      fences=True)
+        self.assertEqual([h.level for h in headings], [1])
+        self.assertEqual(headings[0].start, 22)
+
+    def test_unclosed_fence_keeps_headings(self):
+        md_string = '# a\n```\n# b\n```\n```\n# c\n'
+        headings = tokenizer.tokenize(md_string, fences=True)
+        self.assertEqual([md_string[h.start:h.end] for h in headings],
+                         ['# a', '# c'])
+
+    def test_without_fences_nothing_changes(self):
+        for string in random_documents(2000, seed=1):
+            headings = tokenizer.tokenize(string, fences=True)
+            if '```' not in string:
+                self.assertEqual(headings, tokenizer.tokenize(string))
+            self.assertTrue(set(headings) <= set(tokenizer.tokenize(string)))
+            self.assertEqual(headings, tokenizer.tokenize(string.encode(),
+                                                          fences=True))
+
+    def test_compact_and_mapped(self):
+        expected = Section.from_string(FENCED, 'doc',
+                                       fences=True).to_dict_recursive()
+        compact = Compact_section.from_string(FENCED, 'doc', fences=True)
+        self.assertEqual(compact.to_dict_recursive(), expected)
+
+        self.write('doc.md', FENCED)
+        filepath = os.path.join(self.path, 'doc.md')
+        for node_type in ('section', 'compact', 'mapped'):
+            section = Section.from_file(filepath, node_type=node_type,
+                                        fences=True)
+            self.assertEqual(section.to_dict_recursive(), expected)
+
+    def test_cache_keeps_modes_apart(self):
+        self.write('notes/doc.md', FENCED)
+        notes = os.path.join(self.path, 'notes')
+        stats = []
+        for fences in (False, False, True):
+            cache = Parse_cache(os.path.join(self.path, 'cache'))
+            section = Section.from_dir(notes, cache=cache, fences=fences)
+            cache.save()
+            top = section.get_children()[0]
+            self.assertEqual(len(top.get_children()), 1 if fences else 3)
+            stats.append((cache.stats['hits'], cache.stats['stale']))
+        # an entry of the other mode is stale
+        self.assertEqual(stats, [(0, 0), (1, 0), (0, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
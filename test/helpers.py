@@ -0,0 +1,90 @@
+'''Helpers shared by the tests.'''
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+try:
+    import fcntl
+    import pty
+    import struct
+    import termios
+except ImportError:
+    pty = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Temp_dir_test(unittest.TestCase):
+    '''test case with a temporary directory self.path, removed after every
+    test. Subclasses call super().setUp() first
+    '''
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def write(self, name, content, newline=None):
+        '''writes a file at the relative path name below self.path, its
+        directories are made
+        '''
+        filepath = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w', newline=newline) as file:
+            file.write(content)
+
+    def write_files(self, files, directory='', newline=None):
+        '''writes the files of a dict relative path -> content below
+        directory
+        '''
+        for name, content in files.items():
+            self.write(os.path.join(directory, name), content, newline)
+
+
+def run_in_terminal(test, module, function, *args):
+    '''runs function(result_path, *args) of module in a process on a pseudo
+    terminal (curses needs one) and returns the JSON the function wrote to
+    result_path. Fails test if the process fails
+    '''
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ,
+                struct.pack('hhhh', 40, 120, 0, 0))
+    path = tempfile.mkdtemp()
+    result_path = os.path.join(path, 'result.json')
+    test.addCleanup(os.rmdir, path)
+    env = dict(os.environ, TERM='xterm', PYTHONPATH=ROOT)
+    call = ', '.join(repr(arg) for arg in (result_path,) + args)
+    process = subprocess.Popen(
+        [sys.executable, '-c',
+         'from {} import {}; {}({})'.format(module, function, function,
+                                           call)],
+        stdin=slave, stdout=slave, stderr=slave, env=env, cwd=ROOT)
+    os.close(slave)
+    output = []
+
+    def drain():
+        # the process blocks if nobody reads the terminal
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                return
+            if not data:
+                return
+            output.append(data)
+
+    reader = threading.Thread(target=drain)
+    reader.start()
+    returncode = process.wait(timeout=60)
+    reader.join()
+    os.close(master)
+    test.assertEqual(returncode, 0,
+                     b''.join(output)[-2000:].decode(errors='replace'))
+    with open(result_path) as file:
+        result = json.load(file)
+    os.remove(result_path)
+    return result
@@ -0,0 +1,54 @@
+import unittest
+import memit.markdown_parser.Chunk as ch
+from memit import highlighting
+
+
+CODE = 'def f(x):\n    # comment\n\n    return "a" + str(x)'
+
+
+class Highlighting_test(unittest.TestCase):
+
+    def setUp(self):
+        if highlighting.pygments is None:
+            self.skipTest('pygments is not installed')
+
+    def test_tokenize(self):
+        lines = highlighting.tokenize(CODE, 'python')
+        self.assertEqual(len(lines), 4)
+        for runs, line in zip(lines, CODE.split('\n')):
+            self.assertEqual(sum(length for _, length in runs), len(line))
+        self.assertEqual(lines[0][0], ('WARNING', 3))
+        self.assertIn(('LABEL', len('# comment')), lines[1])
+        self.assertEqual(lines[2], ())
+        self.assertIn(('SAFE', 3), lines[3])
+
+    def test_no_highlighting(self):
+        self.assertIsNone(highlighting.tokenize(CODE, None))
+        self.assertIsNone(highlighting.tokenize(CODE, 'no such language'))
+
+    def test_cache(self):
+        styles = []
+
+        def attribute(style):
+            styles.append(style)
+            return len(style)
+
+        cache = highlighting.Highlight_cache(maxsize=2)
+        chunk = ch.Code_chunk('prompt\n```python\n' + CODE + '\n```', 'f')
+        runs = cache.get(chunk, 'color', attribute)
+        self.assertEqual(runs[0][0], (len('WARNING'), 3))
+        calls = len(styles)
+        same = ch.Code_chunk('other prompt\n```python\n' + CODE + '\n```',
+                             'g')
+        self.assertIs(cache.get(same, 'color', attribute), runs)
+        self.assertEqual(len(styles), calls)
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 1})
+
+        self.assertIsNot(cache.get(chunk, 'mono', attribute), runs)
+        cache.get(ch.Code_chunk('```r\nx <- 1\n```', 'r'), 'color',
+                  attribute)
+        # the oldest entry was dropped
+        cache.get(chunk, 'color', attribute)
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 4})
+        self.assertIsNone(cache.get(ch.Chunk_group([], 'g'), 'color',
+                                    attribute))
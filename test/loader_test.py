@@ -0,0 +1,85 @@
+import os
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.markdown_parser.dedup import Chunk_pool
+from memit.topic_choice import Chunk_tree
+from memit.loader import Background_loader
+from test import helpers
+
+
+class Background_loader_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write('r/dplyr.md', '# select\nprompt\n```r\nselect(df)\n```\n'
+                   '# filter\n```r\nfilter(df)\n```\n## empty\n')
+        self.write('other.md', '# other\ntext\n')
+
+    def chunks(self, tree):
+        return [(node.get_content_for_display(),
+                 node.get_content().to_JSON())
+                for node in tree.walk_built()]
+
+    def load(self, tree):
+        loader = Background_loader(tree, 'code')
+        sections = [node.source()[0] for node in loader.file_nodes]
+        self.assertFalse(any(section.is_loaded() for section in sections))
+        loader.start()
+        loader.join()
+        self.assertFalse(loader.finished())
+        self.assertEqual(loader.apply_results(), 2)
+        self.assertTrue(loader.finished())
+        return loader
+
+    def test_same_as_eager(self):
+        eager = Chunk_tree.from_node(Section.from_dir(self.path), 'code')
+        lazy = Chunk_tree.from_node(Section.from_dir(self.path, lazy=True),
+                                    'code', lazy=True)
+        loader = self.load(lazy)
+        self.assertEqual(loader.total, 2)
+        self.assertEqual(self.chunks(lazy), self.chunks(eager))
+        self.assertEqual([node.cards_below for node in lazy.walk_built()],
+                         [node.cards_below for node in eager.walk_built()])
+        self.assertEqual(lazy.cards_below, 2)
+
+    def test_expanded_before_loading(self):
+        lazy = Chunk_tree.from_node(Section.from_dir(self.path, lazy=True),
+                                    'code', lazy=True)
+        lang = lazy.file_nodes()[1].get_parent()
+        self.assertEqual(lang.get_content_for_display(), 'r')
+        dplyr = list(lang.get_children())[0]
+        # expanding parses the file in this thread
+        self.assertEqual(len(list(dplyr.get_children())), 2)
+        loader = Background_loader(lazy, 'code')
+        self.assertEqual(loader.total, 1)
+        loader.start()
+        loader.stop()
+        loader.apply_results()
+        self.assertTrue(loader.finished())
+
+    def test_shared_cache_and_pool(self):
+        for idx in range(200):
+            self.write('many/%03d.md' % idx, '# same\n```r\nsame()\n```\n'
+                       '# own\n```r\nown%d()\n```\n' % idx)
+        notes = os.path.join(self.path, 'many')
+        cache = Parse_cache(os.path.join(self.path, 'cache'))
+        pool = Chunk_pool()
+        lazy = Chunk_tree.from_node(Section.from_dir(notes, lazy=True,
+                                                     cache=cache),
+                                    'code', cache, lazy=True, pool=pool)
+        loader = Background_loader(lazy, 'code', cache, pool)
+        files = list(reversed(loader.file_nodes))
+        loader.start()
+        # the UI thread expands files and saves the cache meanwhile
+        for node in files:
+            list(node.get_children())
+            cache.save()
+        loader.join()
+        loader.apply_results()
+        cache.save()
+        same = {id(node.get_content()) for node in lazy.walk_built()
+                if node.get_content().get_content() == 'same()'}
+        self.assertEqual(len(same), 1)
+        self.assertEqual(len(pool), 201)
+        self.assertEqual(len(os.listdir(cache.directory)), 200)
+
@@ -1,5 +1,14 @@
+import json
+import os
+import random
+import tempfile
 import unittest
 import memit.markdown_parser.markdown_parsing as parser
+from memit.markdown_parser.Section import Section
+from benchmarks import corpus, regex_parser
+from test.section_test import quirks
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
 
 section_1 = \
 '''## heading 1
@@ -17,30 +26,98 @@ Text
 '''
 
 
-class Split_sections_test(unittest.TestCase):
+def without_levels(section_dict):
+    '''the to_dict_recursive() of a Section in the format of parse_markdown
+    '''
+    children = section_dict['children']
+    return {
+        'title': section_dict['title'],
+        'content': section_dict['content'],
+        'children': [without_levels(child) for child in children]
+        if children else None
+    }
 
-    def test_1(self):
 
-        result = parser._split_sections(section_1)
-        truth = [
-            '## heading 1\nHeading 1 content. One row.\n\n### subheading\nSome'
-            ' text.\n\nOther text one row apart.\n',
-            '## heading 2\n\n### subheading 1\nText\n'
-        ]
-        self.assertEqual(result, truth)
+def reference(md_string):
+    '''the structure parsed by the recursive regex splitting'''
+    root = regex_parser.from_string_recursive(md_string,
+                                              'root').to_dict_recursive()
+    return without_levels(root)['children'] or []
 
 
-test1 = ('## heading 1\nHeading 1 content. One row.\n\n### subheading\nSome'
-         ' text.\n\nOther text one row apart.\n')
+def normalized(structure):
+    # the tokenizer may leave an empty children list where Section has None
+    return [without_levels(section) for section in structure]
 
 
-class Split_content_test(unittest.TestCase):
+class Parse_markdown_test(unittest.TestCase):
 
-    def test_split(self):
-        result = parser._split_content(test1)
-        truth = {
+    def test_structure(self):
+        result = parser._get_markdown_structure(section_1)
+        truth = [{
             'title': 'heading 1',
             'content': 'Heading 1 content. One row.',
-            'rest': '### subheading\nSome text.\n\nOther text one row apart.\n'
-        }
+            'children': [{
+                'title': 'subheading',
+                'content': 'Some text.\n\nOther text one row apart.',
+                'children': None
+            }]
+        }, {
+            'title': 'heading 2',
+            'content': '',
+            'children': [{
+                'title': 'subheading 1',
+                'content': 'Text',
+                'children': None
+            }]
+        }]
         self.assertEqual(result, truth)
+
+    def test_no_headings(self):
+        self.assertEqual(parser._get_markdown_structure('just text\n'), [])
+
+    def test_parse_markdown(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.md') as file:
+            file.write(section_1)
+            file.flush()
+            result = json.loads(parser.parse_markdown(file.name))
+        self.assertEqual(result, parser._get_markdown_structure(section_1))
+
+
+class Differential_test(unittest.TestCase):
+    '''parse_markdown() and Section have to give the same structure'''
+
+    def assert_same(self, md_string):
+        self.assertEqual(
+            normalized(parser._get_markdown_structure(md_string)),
+            reference(md_string), md_string)
+
+    def test_file(self):
+        with open(os.path.join(DATA, 'test.md'), 'r') as file:
+            self.assert_same(file.read())
+
+    def test_quirks(self):
+        for md_string in quirks:
+            self.assert_same(md_string)
+
+    def test_corpus(self):
+        rand = random.Random(0)
+        for depth, fanout in [(1, 5), (3, 3), (6, 2)]:
+            config = corpus.Corpus_config(depth=depth, fanout=fanout,
+                                          file_size=5000)
+            self.assert_same(corpus.generate_document(rand, config))
+
+    def test_random(self):
+        lines = ['# a', '## b', '### c', '## C# d', '#', 'text', '', '```',
+                 '#### e', '## f ##']
+        rand = random.Random(1)
+        for _ in range(300):
+            self.assert_same('\n'.join(rand.choice(lines)
+                                       for _ in range(20)))
+
+    def test_same_as_section(self):
+        md_string = section_1 * 3
+        section = Section.from_string(md_string, 'root')
+        self.assertEqual(
+            normalized(parser._get_markdown_structure(md_string)),
+            without_levels(section.to_dict_recursive())['children'])
@@ -0,0 +1,79 @@
+import os
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.markdown_parser import metrics
+from memit.topic_choice import Chunk_tree
+from test import helpers
+
+
+FILES = {
+    'a.md': '# a\ntext\n```python\nx = 1\n```\n## b\n```r\ny\n```\n',
+    'sub/c.md': '# c\nno code\n',
+    'notes.txt': 'not markdown\n'
+}
+
+
+class Metrics_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write_files(FILES)
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled(self):
+        self.assertIs(metrics.timer('parse'), metrics.timer('read'))
+        Section.from_dir(self.path)
+        self.assertEqual(metrics.snapshot(), {
+            'timers': {},
+            'counters': {},
+            'hit_rates': {}
+        })
+
+    def test_phases_and_counts(self):
+        metrics.enable()
+        section = Section.from_dir(self.path)
+        Chunk_tree.from_node(section, 'code_blocks')
+        stats = metrics.snapshot()
+        self.assertEqual(set(stats['timers']),
+                         {'scan', 'load', 'detect', 'read', 'parse', 'chunk'})
+        self.assertEqual(stats['timers']['detect']['calls'], 3)
+        self.assertEqual(stats['timers']['parse']['calls'], 2)
+        markdown_bytes = len(FILES['a.md']) + len(FILES['sub/c.md'])
+        self.assertEqual(stats['counters']['files'], 2)
+        self.assertEqual(stats['counters']['sections'], 5)
+        self.assertEqual(stats['counters']['bytes'], markdown_bytes)
+        self.assertEqual(stats['counters']['chunks'], 2)
+        self.assertIn('parse', metrics.format_stats())
+
+    def test_mapped(self):
+        metrics.enable()
+        Section.from_dir(self.path, node_type='mapped')
+        stats = metrics.snapshot()
+        self.assertEqual(stats['timers']['parse']['calls'], 3)
+        self.assertEqual(stats['counters']['files'], 2)
+        self.assertEqual(stats['counters']['sections'], 5)
+        self.assertEqual(stats['counters']['bytes'],
+                         len(FILES['a.md']) + len(FILES['sub/c.md']))
+
+    def test_workers_are_counted(self):
+        metrics.enable()
+        Section.from_dir(self.path, workers=2)
+        self.assertEqual(metrics.snapshot()['counters']['files'], 2)
+
+    def test_cache_hit_rate(self):
+        cache_dir = os.path.join(self.path, '.cache')
+        cache = Parse_cache(cache_dir)
+        Section.from_dir(self.path, cache=cache)
+        cache.save()
+
+        metrics.enable()
+        Section.from_dir(self.path, cache=Parse_cache(cache_dir))
+        with open(os.path.join(self.path, 'a.md'), 'a') as file:
+            file.write('more\n')
+        Section.from_dir(self.path, cache=Parse_cache(cache_dir))
+        rates = metrics.hit_rates()
+        self.assertAlmostEqual(rates['cache'], 5 / 6)
@@ -0,0 +1,164 @@
+import collections
+import unittest
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser import dedup
+from memit.topic_choice import Chunk_tree
+from memit import sampling
+from memit import scheduler as sched
+from test import helpers
+
+
+def notes(name, sections):
+    '''a file with sections with a code block each, and one without'''
+    return ''.join('# {0} {1}\n```r\n{0}{1}\n```\n'.format(name, idx)
+                   for idx in range(sections)) + '# no code\ntext\n'
+
+
+class Sampler_test(unittest.TestCase):
+
+    def test_uniform(self):
+        sampler = sampling.Sampler(5, seed=1)
+        for item in range(1000):
+            sampler.add(item)
+        items = sampler.items()
+        self.assertEqual(len(items), 5)
+        self.assertEqual(len(set(items)), 5)
+        self.assertEqual(sampler.seen, 1000)
+
+    def test_seed(self):
+        samples = []
+        for _ in range(2):
+            sampler = sampling.Sampler(3, seed=7)
+            for item in range(100):
+                sampler.add(item)
+            samples.append(sampler.items())
+        self.assertEqual(samples[0], samples[1])
+
+    def test_weights(self):
+        counts = collections.Counter()
+        for seed in range(300):
+            sampler = sampling.Sampler(1, seed=seed)
+            sampler.add('heavy', 9.0)
+            sampler.add('light', 1.0)
+            sampler.add('never', 0.0)
+            counts.update(sampler.items())
+        self.assertNotIn('never', counts)
+        self.assertGreater(counts['heavy'], 220)
+
+    def test_parse_weights(self):
+        weights = sampling.parse_weights(['python=2', 'python/pandas/=0.5'])
+        self.assertEqual(weights, {('python',): 2.0,
+                                   ('python', 'pandas'): 0.5})
+        self.assertEqual(sampling.path_weight(weights, ['python', 'numpy']),
+                         2.0)
+        self.assertEqual(sampling.path_weight(
+            weights, ['python', 'pandas', 'groupby']), 0.5)
+        self.assertEqual(sampling.path_weight(weights, ['r']), 1.0)
+        with self.assertRaises(ValueError):
+            sampling.parse_weights(['python'])
+
+
+class Sample_tree_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.md', notes('a.md', 30))
+        self.write('b.md', notes('b.md', 30))
+
+    def select_all(self, tree):
+        for node in tree.walk_built(build=True):
+            node.selected = True
+
+    def test_sample(self):
+        tree = Chunk_tree.from_node(Section.from_dir(self.path), 'code')
+        self.select_all(tree)
+        cards = sampling.sample_tree(tree, 10, seed=3)
+        self.assertEqual(len(cards), 10)
+        self.assertEqual(len({chunk.get_content() for _, chunk in cards}),
+                         10)
+        self.assertTrue(all(chunk.get_content() for _, chunk in cards))
+        self.assertEqual(
+            [chunk.get_content() for _, chunk in cards],
+            [chunk.get_content()
+             for _, chunk in sampling.sample_tree(tree, 10, seed=3)])
+
+    def test_weights(self):
+        tree = Chunk_tree.from_node(Section.from_dir(self.path), 'code')
+        self.select_all(tree)
+        cards = sampling.sample_tree(tree, 20, {('a',): 0.0}, seed=0)
+        self.assertEqual({path[0] for path, _ in cards}, {'b'})
+
+    def test_lazy_only_picked_are_made(self):
+        section = Section.from_dir(self.path, lazy=True)
+        tree = Chunk_tree.from_node(section, 'code', lazy=True)
+        self.select_all(tree)
+        cards = sampling.sample_tree(tree, 5, seed=0)
+        self.assertEqual(len(cards), 5)
+        made = [node for node in tree.walk_built()
+                if node.content is not None]
+        self.assertEqual(len(made), 5)
+
+    def test_lazy_nodes_are_weighted_by_cards(self):
+        # one section with 30 blocks against 30 sections with one
+        self.write('b.md', '# many\n' +
+                   ''.join('```r\nmany{}\n```\n'.format(idx)
+                           for idx in range(30)))
+        counts = collections.Counter()
+        for seed in range(50):
+            section = Section.from_dir(self.path, lazy=True)
+            tree = Chunk_tree.from_node(section, 'code_blocks', lazy=True)
+            self.select_all(tree)
+            cards = sampling.sample_tree(tree, 10, seed=seed)
+            self.assertEqual(len(cards), 10)
+            counts.update(path[0] for path, _ in cards)
+        self.assertGreater(counts['b'], 150)
+        self.assertGreater(counts['a'], 150)
+
+    def test_k_cards_without_empty_and_copies(self):
+        # fences without code and copies of the cards of a.md
+        self.write('b.md', ''.join('# empty {}\n```\n```\n'.format(idx)
+                                   for idx in range(30)) +
+                   ''.join('# copy {0}\n```r\na.md{0}\n```\n'.format(idx)
+                           for idx in range(30)))
+        for lazy in (False, True):
+            section = Section.from_dir(self.path, lazy=lazy)
+            tree = Chunk_tree.from_node(section, 'code', lazy=lazy,
+                                        pool=dedup.Chunk_pool())
+            self.select_all(tree)
+            cards = sampling.sample_tree(tree, 25, seed=0)
+            contents = [chunk.get_content() for _, chunk in cards]
+            self.assertEqual(len(contents), 25)
+            self.assertEqual(len(set(contents)), 25)
+            cards = sampling.sample_tree(tree, 100, seed=0)
+            self.assertEqual(len(cards), 30)
+
+    def test_scheduled(self):
+        now = [0.0]
+        scheduler = sched.Scheduler(':memory:', clock=lambda: now[0])
+        self.addCleanup(scheduler.close)
+        section = Section.from_dir(self.path, lazy=True)
+        tree = Chunk_tree.from_node(section, 'code', lazy=True)
+        self.select_all(tree)
+        # 2 forgotten cards that will be due and 20 learned ones
+        session = scheduler.session(sampling.sample_tree(tree, 22, seed=0))
+        contents = {}
+        for idx in range(22):
+            state, chunk = session.pop()
+            contents[chunk.get_content()] = idx < 2
+            session.answer(state, chunk, sched.AGAIN if idx < 2
+                           else sched.GOOD)
+        now[0] += sched.AGAIN_DELAY
+
+        section = Section.from_dir(self.path, lazy=True)
+        tree = Chunk_tree.from_node(section, 'code', lazy=True)
+        self.select_all(tree)
+        cards = sampling.scheduled_cards(tree, scheduler, 10, seed=1)
+        self.assertEqual(len(cards), 10)
+        shown = [chunk.get_content() for _, chunk in cards]
+        due = sorted(content for content, forgotten in contents.items()
+                     if forgotten)
+        self.assertEqual(sorted(shown[:2]), due)
+        self.assertFalse(set(shown[2:]) & set(contents))
+        made = [node for node in tree.walk_built()
+                if node.content is not None]
+        self.assertLessEqual(len(made), 2 + 8 * sampling.NEW_BATCH)
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import memit.markdown_parser.Chunk as ch
+from memit import scheduler as sched
+from test import helpers
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Scheduler_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.db = os.path.join(self.path, 'reviews.sqlite')
+        self.clock = Clock()
+        self.chunks = [ch.Code_chunk('q%d\n```\ncode%d\n```' % (idx, idx),
+                                     'title')
+                       for idx in range(5)]
+        self.path_titles = ['notes', 'title']
+        self.cards = [(self.path_titles, chunk) for chunk in self.chunks]
+        self.ids = [sched.card_id(self.path_titles, chunk)
+                    for chunk in self.chunks]
+
+    def learn(self, scheduler, grades, limit=None):
+        session = scheduler.session(self.cards, limit, seed=0)
+        shown = []
+        for grade in grades:
+            state, chunk = session.pop()
+            shown.append(chunk.get_content())
+            session.answer(state, chunk, grade)
+        return session, shown
+
+    def test_card_id(self):
+        chunk = ch.Code_chunk('q\n```\ncode\n```', 'title')
+        same = ch.Code_chunk('q\n```\ncode\n```', 'other title')
+        changed = ch.Code_chunk('q\n```\ncode2\n```', 'title')
+        key = sched.card_id(['r', 'dplyr', 'select'], chunk)
+        self.assertEqual(key, sched.card_id(['r', 'dplyr', 'select'], same))
+        self.assertNotEqual(key,
+                            sched.card_id(['r', 'dplyr', 'select'], changed))
+        self.assertNotEqual(key, sched.card_id(['r', 'dplyr'], chunk))
+
+    def test_sm2(self):
+        state = sched.Card_state('x', 0.0)
+        state.review(sched.GOOD, 0.0)
+        self.assertEqual((state.reps, state.interval), (1, 1.0))
+        state.review(sched.GOOD, 0.0)
+        self.assertEqual(state.interval, 6.0)
+        state.review(sched.EASY, 0.0)
+        self.assertEqual(state.interval, 15.0)
+        self.assertAlmostEqual(state.ease, 2.6)
+        state.review(sched.AGAIN, 0.0)
+        self.assertEqual((state.reps, state.lapses), (0, 1))
+        self.assertEqual(state.due, sched.AGAIN_DELAY)
+        self.assertAlmostEqual(state.ease, 2.06)
+        for _ in range(10):
+            state.review(sched.AGAIN, 0.0)
+        self.assertEqual(state.ease, sched.MIN_EASE)
+
+    def test_session(self):
+        scheduler = sched.Scheduler(self.db, clock=self.clock)
+        session, shown = self.learn(scheduler,
+                                    [sched.AGAIN] + [sched.GOOD] * 4)
+        self.assertEqual(sorted(shown), ['code0', 'code1', 'code2', 'code3',
+                                         'code4'])
+        # the forgotten card comes back at the end
+        self.assertEqual(len(session), 1)
+        forgotten = shown[0]
+        self.assertEqual(session.pop()[1].get_content(), forgotten)
+        forgotten_id = self.ids[int(forgotten[-1])]
+        scheduler.close()
+
+        # the forgotten card is due again, the learned ones are not
+        self.clock.now += sched.AGAIN_DELAY
+        scheduler = sched.Scheduler(self.db, clock=self.clock)
+        self.assertEqual(list(scheduler.due()),
+                         [(forgotten_id, self.path_titles)])
+        self.assertEqual(scheduler.due_ids(), [forgotten_id])
+        session, shown = self.learn(scheduler, [sched.GOOD])
+        self.assertEqual(shown, [forgotten])
+        self.assertEqual(len(session), 0)
+
+        self.clock.now += sched.DAY
+        due = scheduler.due_ids()
+        self.assertEqual(due[-1], forgotten_id)
+        self.assertEqual(sorted(due), sorted(self.ids))
+        self.assertEqual(len(scheduler.due_ids(limit=2)), 2)
+        # rows are read while iterating
+        due = scheduler.due()
+        self.assertEqual(next(due)[0], scheduler.due_ids(limit=1)[0])
+        due.close()
+        rows = scheduler._db.execute('SELECT COUNT(*) FROM reviews')
+        self.assertEqual(rows.fetchone()[0], 6)
+
+    def test_limit(self):
+        scheduler = sched.Scheduler(':memory:', clock=self.clock)
+        _, shown = self.learn(scheduler, [sched.GOOD] * 2, limit=2)
+        self.assertEqual(len(shown), 2)
+        session = scheduler.session(self.cards, limit=2)
+        first = session.peek()
+        self.assertIs(session.pop()[1], first)
+        rest = [first.get_content(), session.pop()[1].get_content()]
+        self.assertFalse(set(shown) & set(rest))
+        self.assertEqual(len(session), 0)
+
+    def test_new_cards_are_shuffled(self):
+        scheduler = sched.Scheduler(':memory:', clock=self.clock)
+        orders = set()
+        for seed in range(10):
+            session = scheduler.session(self.cards, seed=seed)
+            order = [session.pop()[1] for _ in range(len(self.cards))]
+            session = scheduler.session(self.cards, seed=seed)
+            self.assertEqual([session.pop()[1] for _ in self.cards], order)
+            orders.add(tuple(chunk.get_content() for chunk in order))
+        self.assertGreater(len(orders), 1)
+
+    def test_old_log(self):
+        db = sqlite3.connect(self.db)
+        db.execute('CREATE TABLE cards (id TEXT PRIMARY KEY, due REAL NOT '
+                   'NULL, interval REAL NOT NULL, ease REAL NOT NULL, reps '
+                   'INTEGER NOT NULL, lapses INTEGER NOT NULL)')
+        db.execute('INSERT INTO cards VALUES (?, 0, 1, 2.5, 1, 0)',
+                   (self.ids[0],))
+        db.commit()
+        db.close()
+        scheduler = sched.Scheduler(self.db, clock=self.clock)
+        self.assertEqual(list(scheduler.due()), [(self.ids[0], None)])
+        state = scheduler.get_states([self.ids[0]])[self.ids[0]]
+        state.path = self.path_titles
+        scheduler.review(state, sched.AGAIN)
+        self.clock.now += sched.AGAIN_DELAY
+        self.assertEqual(list(scheduler.due()),
+                         [(self.ids[0], self.path_titles)])
+        # a review without a path keeps the one in the log
+        state.path = None
+        scheduler.review(state, sched.AGAIN)
+        self.clock.now += sched.AGAIN_DELAY
+        self.assertEqual(list(scheduler.due()),
+                         [(self.ids[0], self.path_titles)])
+        scheduler.close()
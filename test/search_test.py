@@ -0,0 +1,130 @@
+import os
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.markdown_parser.search import Search_index, split_words
+from memit.topic_choice import Chunk_tree, Tree_positions
+from test import helpers
+
+
+class Search_index_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.notes = os.path.join(self.path, 'notes')
+        self.write('notes/python/pandas.md',
+                   '# groupby\nHow do you group a DataFrame?\n'
+                   '```python\ndf.groupby("key").sum()\n```\n'
+                   '# merge\n```python\npd.merge(a, b)\n```\n')
+        self.write('notes/python/itertools.md',
+                   '# groupby\n```python\nitertools.groupby(xs)\n```\n')
+
+    def titles(self, index, query):
+        return [node.get_title() for node in index.find(query)]
+
+    def test_split_words(self):
+        self.assertEqual(split_words('df.groupby("Key")'),
+                         ['df', 'groupby', 'key'])
+
+    def test_search(self):
+        index = Search_index.from_node(Section.from_dir(self.notes))
+        self.assertEqual(len(index), 7)
+        self.assertEqual(self.titles(index, 'groupby'),
+                         ['groupby', 'groupby'])
+        self.assertEqual(self.titles(index, 'DataFrame groupby'),
+                         ['groupby'])
+        self.assertEqual(self.titles(index, 'merg'), ['merge'])
+        self.assertEqual(self.titles(index, 'merg '), [])
+        self.assertEqual(self.titles(index, 'pandas nothing'), [])
+        self.assertEqual(index.search(''), [])
+
+    def test_positions_match_tree(self):
+        section = Section.from_dir(self.notes)
+        index = Search_index.from_node(section)
+        self.assertEqual(index.nodes, section.get_all_nodes())
+        tree = Chunk_tree.from_node(section, 'code')
+        tree_nodes = list(tree.walk_tree(only_expanded=False,
+                                         ignore_root=False))
+        position = index.search('merge')[-1]
+        self.assertEqual(tree_nodes[position].get_content().get_content(),
+                         'pd.merge(a, b)')
+        self.assertEqual([index.nodes[p].get_title()
+                          for p in index.ancestors(position)],
+                         ['pandas', 'python', 'notes'])
+        self.assertEqual(index.heading_path(position),
+                         ['python', 'pandas', 'merge'])
+        self.assertEqual(tree_nodes[position].get_heading_path(),
+                         ['python', 'pandas', 'merge'])
+
+    def test_lazy(self):
+        section = Section.from_dir(self.notes, lazy=True)
+        index = Search_index.from_node(section, lazy=True)
+        files = section.get_children()[0].get_children()
+        self.assertFalse(any(f.is_loaded() for f in files))
+        # files that are not loaded are found by their title only
+        self.assertEqual(self.titles(index, 'itertools'), ['itertools'])
+        self.assertEqual(self.titles(index, 'groupby'), [])
+        self.assertFalse(any(f.is_loaded() for f in files))
+        self.assertFalse(index.is_parsed(files[0]))
+
+        files[0].get_children()
+        self.assertEqual(self.titles(index, 'itertools'),
+                         ['itertools', 'groupby'])
+        self.assertEqual(self.titles(index, 'groupby'), ['groupby'])
+        self.assertFalse(files[1].is_loaded())
+        # the nodes of the file come after the others
+        self.assertEqual(index.appended, [index.search('itertools')[0]])
+        self.assertEqual(index.heading_path(len(index) - 1),
+                         ['python', 'itertools', 'groupby'])
+
+    def test_lazy_adds_loaded_files(self):
+        section = Section.from_dir(self.notes, lazy=True)
+        index = Search_index.from_node(section, lazy=True)
+        files = section.get_children()[0].get_children()
+        files[1].get_children()
+        self.assertEqual(len(index), 6)
+        nodes = list(index.nodes)
+        postings = {word: list(positions)
+                    for word, positions in index.postings.items()}
+        files[0].get_children()
+        self.assertEqual(len(index), 7)
+        # the index is not made again, the new node is added
+        self.assertTrue(all(index.nodes[p] is node
+                            for p, node in enumerate(nodes)))
+        self.assertEqual(list(index.postings['merge']), postings['merge'])
+        self.assertEqual(list(index.postings['groupby']),
+                         postings['groupby'] + [6])
+
+    def test_lazy_positions_match_tree(self):
+        section = Section.from_dir(self.notes, lazy=True)
+        index = Search_index.from_node(section, lazy=True)
+        tree = Chunk_tree.from_node(section, 'code', lazy=True)
+        files = section.get_children()[0].get_children()
+        files[1].get_children()
+        self.assertEqual(len(index), 6)
+        positions = Tree_positions(tree, index)
+        self.assertEqual(positions[5].get_heading_path(),
+                         ['python', 'pandas', 'merge'])
+        # the other file is loaded after the index was made
+        files[0].get_children()
+        self.assertEqual(len(index), 7)
+        positions.update()
+        self.assertEqual([node.get_content_for_display()
+                          for node in positions.nodes],
+                         [node.get_title() for node in index.nodes])
+        self.assertEqual(positions[index.search('itertools groupby')[0]]
+                         .get_heading_path(),
+                         ['python', 'itertools', 'groupby'])
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.path, 'cache')
+        cache = Parse_cache(cache_dir)
+        section = Section.from_dir(self.notes, cache=cache)
+        expected = Search_index.from_node(section, cache).postings
+        cache.save()
+
+        warm = Parse_cache(cache_dir)
+        section = Section.from_dir(self.notes, cache=warm)
+        node = section.get_children()[0].get_children()[1].get_children()[1]
+        self.assertIn('merge', warm.get_words(node))
+        self.assertEqual(Search_index.from_node(section, warm).postings,
+                         expected)
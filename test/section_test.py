@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import random
+import unittest
+from benchmarks import regex_parser
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser import tokenizer
+from test import helpers
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+# inputs where the regex splitting has some odd behaviour
+quirks = [
+    '',
+    'no headings at all\n',
+    '# a\n## b\n### c\n',
+    '## a\ntext\n## b\n',
+    '### deeper first\ntext\n## b\ncontent\n',
+    '## C# tips\nsome text\n## other\n',
+    '# a\n```c\n#include <stdio.h>\n```\n',
+    '# no newline at the end',
+    '\n\n# a\r\n## b\r\n',
+]
+
+
+class Tokenizer_test(unittest.TestCase):
+
+    def test_tokenize(self):
+        result = tokenizer.tokenize('text\n# a\n## b # c\n')
+        self.assertEqual(result, [
+            tokenizer.Heading(5, 8, 1, True),
+            tokenizer.Heading(9, 17, 2, False)
+        ])
+
+    def test_same_as_recursive_on_file(self):
+        path = os.path.join(DATA, 'test.md')
+        with open(path, 'r') as file:
+            md_string = file.read()
+        new = Section.from_string(md_string, 'test')
+        old = regex_parser.from_string_recursive(md_string, 'test')
+        self.assertEqual(new.to_dict_recursive(), old.to_dict_recursive())
+
+    def test_same_as_recursive_on_quirks(self):
+        for md_string in quirks:
+            new = Section.from_string(md_string, 'test')
+            old = regex_parser.from_string_recursive(md_string, 'test')
+            self.assertEqual(new.to_dict_recursive(),
+                             old.to_dict_recursive(), md_string)
+
+    def test_same_as_recursive_on_random(self):
+        lines = ['# a', '## b', '### c', '## C# d', '#', 'text', '', '```']
+        rand = random.Random(0)
+        for _ in range(500):
+            md_string = '\n'.join(rand.choice(lines) for _ in range(12))
+            new = Section.from_string(md_string, 'test')
+            old = regex_parser.from_string_recursive(md_string, 'test')
+            self.assertEqual(new.to_dict_recursive(),
+                             old.to_dict_recursive(), md_string)
+
+    def test_deep_document(self):
+        md_string = ''.join('#' * (i % 6 + 1) + ' h\ntext\n'
+                            for i in range(5000))
+        section = Section.from_string(md_string, 'deep')
+        self.assertEqual(len(section.get_all_nodes()), 5001)
+
+
+class Graph_test(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA, 'test.md'), 'r') as file:
+            self.section = Section.from_string(file.read(), 'test')
+
+    def test_graph(self):
+        graph = self.section.get_graph_repr()
+        nodes = self.section.get_all_nodes()
+        self.assertEqual([node['id'] for node in graph['nodes']],
+                         list(range(len(nodes))))
+        self.assertEqual([node['title'] for node in graph['nodes']],
+                         [node.get_title() for node in nodes])
+        expected = []
+        for idx, node in enumerate(nodes):
+            for child in node.get_children() or []:
+                target = next(i for i, n in enumerate(nodes) if n is child)
+                expected.append((idx, target, node.get_level(),
+                                 child.get_level()))
+        links = [(link['source'], link['target'], link['source_level'],
+                  link['target_level']) for link in graph['links']]
+        self.assertEqual(sorted(links), sorted(expected))
+
+    def test_write_graph(self):
+        output = io.StringIO()
+        self.section.write_graph(output)
+        self.assertEqual(json.loads(output.getvalue()),
+                         self.section.get_graph_repr())
+
+    def test_deep_tree(self):
+        node = Section('leaf', 'text', None, 3001)
+        for level in range(3000, 0, -1):
+            node = Section('h', '', [node], level)
+        graph = node.get_graph_repr()
+        self.assertEqual(len(graph['nodes']), 3001)
+        self.assertEqual(graph['links'][-1]['target'], 3000)
+        self.assertEqual(len(node.get_all_nodes()), 3001)
+
+
+class From_dir_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write_files({
+            'b_notes/z.md': '# z\ntext\n',
+            'b_notes/y.md': '# y\n## y1\ntext\n',
+            'a_notes/x.md': '# x\n',
+            'a_notes/plain.txt': 'no headings\n',
+            'a_notes/.hidden.md': '# hidden\n',
+            'c_notes/sub/w.md': '# w\n',
+        })
+
+    def test_sorted(self):
+        section = Section.from_dir(self.path)
+        titles = [child.get_title() for child in section.get_children()]
+        self.assertEqual(titles, ['a_notes', 'b_notes', 'c_notes'])
+        titles = [child.get_title()
+                  for child in section.get_children()[1].get_children()]
+        self.assertEqual(titles, ['y', 'z'])
+
+    def test_parallel_same_as_serial(self):
+        serial = Section.from_dir(self.path)
+        parallel = Section.from_dir(self.path, workers=2)
+        self.assertEqual(serial.to_dict_recursive(),
+                         parallel.to_dict_recursive())
+
+    def test_lazy_same_as_eager(self):
+        lazy = Section.from_dir(self.path, lazy=True)
+        files = lazy.get_children()[1].get_children()
+        self.assertEqual([f.get_title() for f in files], ['y', 'z'])
+        self.assertFalse(any(f.is_loaded() for f in files))
+        self.assertEqual(lazy.to_dict_recursive(),
+                         Section.from_dir(self.path).to_dict_recursive())
+        self.assertTrue(all(f.is_loaded() for f in files))
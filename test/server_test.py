@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import unittest
+try:
+    import curses
+except ImportError:
+    curses = None
+from memit.markdown_parser.Section import Section
+from memit.topic_choice import Chunk_tree, valid_chunks
+from memit import sampling, server
+from memit import scheduler as sched
+from test import helpers
+
+
+FILES = {
+    'python/pandas.md': '# read\nhow to read\n```python\npd.read_csv(f)\n```\n'
+                        '## write\n```python\ndf.to_csv(f)\n```\n',
+    'r/dplyr.md': '# select\n```r\nselect(df)\n```\n# empty\nno code\n',
+}
+
+
+def drive_search(result_path, socket, query):
+    '''searches a deck server in the topic choice form like the app does
+    and writes the heading paths of the selected nodes to result_path. Needs
+    a terminal
+    '''
+    from memit.topic_choice import Chunk_choice_form
+
+    curses.initscr()
+    try:
+        client = server.Deck_client(socket)
+        tree = client.tree()
+        form = Chunk_choice_form(tree, search_index=client)
+        form.apply_search(query)
+        result = {
+            'selected': [node.get_heading_path()
+                         for node in tree.walk_built() if node.selected],
+            'visible': len(form.tree.visible)
+        }
+        client.close()
+    finally:
+        curses.endwin()
+    with open(result_path, 'w') as file:
+        json.dump(result, file)
+
+
+class Server_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write_files(FILES, 'notes')
+        self.section = Section.from_dir(os.path.join(self.path, 'notes'))
+        self.socket = os.path.join(self.path, 'deck.sock')
+        self.server = server.Deck_server(self.socket,
+                                         server.Deck(self.section, 'code'))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+        self.client = server.Deck_client(self.socket)
+        self.tree = self.client.tree()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.server_close()
+
+    def test_tree(self):
+        local = Chunk_tree.from_node(self.section, 'code')
+        self.assertEqual(
+            [(node.get_heading_path(), node.cards, node.cards_below)
+             for node in self.tree.walk_built()],
+            [(node.get_heading_path(), node.cards, node.cards_below)
+             for node in local.walk_built()])
+        self.assertEqual(self.client.chunk_type, 'code')
+
+    def test_search(self):
+        nodes = list(self.tree.walk_built())
+        positions = self.client.search('read')
+        self.assertEqual([nodes[p].get_heading_path() for p in positions],
+                         [['python', 'pandas', 'read']])
+        self.assertEqual([nodes[p].title
+                          for p in self.client.ancestors(positions[0])],
+                         ['pandas', 'python', 'notes'])
+
+    @unittest.skipIf(helpers.pty is None, 'needs a pseudo terminal')
+    def test_search_form(self):
+        result = helpers.run_in_terminal(self, 'test.server_test',
+                                         'drive_search', self.socket,
+                                         'read')
+        self.assertEqual(result['selected'], [['python', 'pandas', 'read']])
+        # the match, pandas, python and the root
+        self.assertEqual(result['visible'], 4)
+
+    def test_cards(self):
+        local = list(Chunk_tree.from_node(self.section, 'code').walk_built())
+        positions = range(len(local))
+        expected = [(node.get_heading_path(), chunk.get_prompt(),
+                     chunk.get_content(), chunk.get_syntax())
+                    for node in local
+                    for chunk in valid_chunks([node.get_content()])]
+        cards = self.client.cards(positions)
+        self.assertEqual([(path, chunk.get_prompt(), chunk.get_content(),
+                           chunk.get_syntax()) for path, chunk in cards],
+                         expected)
+
+        sample = self.client.sample(positions, 2, seed=1)
+        self.assertEqual(len(sample), 2)
+        self.assertEqual([chunk.get_content() for _, chunk in sample],
+                         [chunk.get_content() for _, chunk in
+                          self.client.sample(positions, 2, seed=1)])
+        weighted = self.client.sample(positions, 3,
+                                      {('python',): 0.0}, seed=1)
+        self.assertEqual([path[0] for path, _ in weighted], ['r'])
+
+    def test_scheduled_cards(self):
+        now = [0.0]
+        scheduler = sched.Scheduler(':memory:', clock=lambda: now[0])
+        self.addCleanup(scheduler.close)
+        positions = range(len(list(self.tree.walk_built())))
+        path, chunk = self.client.cards(positions)[-1]
+        state = scheduler.get_states([sched.card_id(path, chunk)])
+        state = list(state.values())[0]
+        state.path = path
+        scheduler.review(state, sched.AGAIN)
+        now[0] += sched.AGAIN_DELAY
+
+        responses = []
+        request = self.client.request
+
+        def counted(op, **arguments):
+            response = request(op, **arguments)
+            responses.append((op, len(response['cards'])))
+            return response
+
+        self.client.request = counted
+        cards = sampling.schedule(
+            scheduler, 2, lambda due: self.client.due(positions, due),
+            lambda count: self.client.sample(positions, count, seed=1))
+        # the due card first, then a new one
+        self.assertEqual(len(cards), 2)
+        self.assertEqual(cards[0][0], path)
+        self.assertEqual(cards[0][1].get_content(), chunk.get_content())
+        self.assertNotEqual(cards[1][1].get_content(), chunk.get_content())
+        # only the due card and a sample of the deck's 3 cards were sent
+        self.assertEqual(responses, [('due', 1), ('sample', 3)])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.client.cards([1000])
+        with self.assertRaises(ValueError):
+            self.client.request('nothing')
+        # the connection is still usable
+        self.assertEqual(len(self.client.cards([0])), 0)
+
+    def test_concurrent_clients(self):
+        results = []
+        positions = range(len(list(self.tree.walk_built())))
+
+        def session():
+            client = server.Deck_client(self.socket)
+            try:
+                client.tree()
+                for seed in range(20):
+                    results.append(len(client.sample(positions, 2,
+                                                     seed=seed)))
+            finally:
+                client.close()
+
+        threads = [threading.Thread(target=session) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [2] * 160)
+
+    def test_stale_socket(self):
+        with self.assertRaises(OSError):
+            server.remove_stale_socket(self.socket)
+        stale = os.path.join(self.path, 'stale.sock')
+        gone = server.Deck_server(stale, self.server.deck)
+        gone.socket.close()
+        server.remove_stale_socket(stale)
+        self.assertFalse(os.path.exists(stale))
+
+
+if __name__ == '__main__':
+    unittest.main()
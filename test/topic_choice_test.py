@@ -0,0 +1,79 @@
+import os
+from memit.markdown_parser.Section import Section
+from memit.topic_choice import Chunk_tree
+from test import helpers
+
+
+class Lazy_chunk_tree_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write('r/dplyr.md', '# select\nprompt\n```r\nselect(df)\n```\n'
+                   '# filter\n```r\nfilter(df)\n```\n')
+        self.write('r/other.md', '# other\n')
+
+    def test_expand_and_select(self):
+        section = Section.from_dir(self.path, lazy=True)
+        tree = Chunk_tree.from_node(section, 'code', lazy=True)
+        self.assertEqual(tree.get_content_for_display(),
+                         os.path.basename(self.path))
+
+        lang = list(tree.get_children())[0]
+        dplyr, other = list(lang.get_children())
+        self.assertEqual(dplyr.get_content_for_display(), 'dplyr')
+        self.assertEqual(dplyr.built_children(), [])
+        self.assertEqual(dplyr.source(),
+                         (section.get_children()[0].get_children()[0],
+                          'code'))
+        self.assertTrue(dplyr.has_children())
+        self.assertEqual(len(list(tree.walk_built())), 4)
+        file_sections = section.get_children()[0].get_children()
+        self.assertFalse(any(f.is_loaded() for f in file_sections))
+
+        chunks = [node.get_content() for node in dplyr.get_children()]
+        self.assertEqual([c.get_content() for c in chunks],
+                         ['select(df)', 'filter(df)'])
+        self.assertTrue(file_sections[0].is_loaded())
+        self.assertFalse(file_sections[1].is_loaded())
+        self.assertEqual(len(dplyr.built_children()), 2)
+
+    def test_same_chunks_as_eager(self):
+        eager = Chunk_tree.from_node(Section.from_dir(self.path), 'code')
+        lazy = Chunk_tree.from_node(Section.from_dir(self.path, lazy=True),
+                                    'code', lazy=True)
+        self.assertEqual(
+            [node.get_content().to_JSON() for node in eager.walk_tree(
+                only_expanded=False, ignore_root=False)],
+            [node.get_content().to_JSON() for node in lazy.walk_tree(
+                only_expanded=False, ignore_root=False)])
+
+
+class Card_count_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.md', '# one\n```r\nx\n```\n```r\ny\n```\n'
+                   '# empty\ntext\n## below\n```r\nz\n```\n'
+                   '# nothing\ntext\n')
+        self.write('b.md', '# no code\ntext\n')
+
+    def counts(self, tree):
+        return [(node.get_content_for_display(), node.cards,
+                 node.cards_below) for node in tree.walk_built()]
+
+    def test_counts(self):
+        for node_type in ['section', 'compact']:
+            section = Section.from_dir(self.path, node_type=node_type)
+            tree = Chunk_tree.from_node(section, 'code_blocks')
+            self.assertEqual(self.counts(tree)[1:], [
+                ('a', 0, 3), ('one', 2, 2), ('empty', 0, 1),
+                ('below', 1, 1), ('nothing', 0, 0), ('b', 0, 0),
+                ('no code', 0, 0)
+            ])
+
+    def test_lazy_counts_are_unknown(self):
+        section = Section.from_dir(self.path, lazy=True)
+        tree = Chunk_tree.from_node(section, 'code', lazy=True)
+        tree.update_card_counts()
+        self.assertEqual(self.counts(tree),
+                         [(os.path.basename(self.path), None, None)])
@@ -0,0 +1,84 @@
+import os
+from memit.markdown_parser.Section import Section
+from memit.markdown_parser.cache import Parse_cache
+from memit.markdown_parser import watcher
+from memit.topic_choice import Chunk_tree
+from test import helpers
+
+
+def chunk_titles(tree):
+    return [tree.get_content().get_title(),
+            [chunk_titles(child) for child in tree.get_children()]]
+
+
+class Update_tree_test(helpers.Temp_dir_test):
+
+    def setUp(self):
+        super().setUp()
+        self.write('lang/b.md', '# b\ntext\n')
+        self.write('lang/d.md', '# d\n## d1\n```r\nx\n```\n')
+        self.write('top.md', '# top\n')
+
+    def check_in_sync(self, section, tree):
+        fresh = Section.from_dir(self.path)
+        self.assertEqual(section.to_dict_recursive(),
+                         fresh.to_dict_recursive())
+        self.assertEqual(chunk_titles(tree),
+                         chunk_titles(Chunk_tree.from_node(fresh, 'code')))
+
+    def test_changes(self):
+        section = Section.from_dir(self.path)
+        tree = Chunk_tree.from_node(section, 'code')
+        unchanged = section.get_children()[0].get_children()[0]
+
+        self.write('lang/d.md', '# d changed\n')
+        self.write('lang/c.md', '# c\n')
+        os.makedirs(os.path.join(self.path, 'new', 'sub'))
+        self.write('new/sub/e.md', '# e\n')
+        os.remove(os.path.join(self.path, 'top.md'))
+        changed = ['lang/d.md', 'lang/c.md', 'new', 'new/sub/e.md', 'top.md']
+
+        edits = watcher.update_tree(
+            section, [os.path.join(self.path, p) for p in changed])
+        self.assertEqual([edit[0] for edit in edits],
+                         ['insert', 'replace', 'insert', 'remove'])
+        tree.apply_edits(edits, 'code')
+        self.check_in_sync(section, tree)
+        self.assertIs(section.get_children()[0].get_children()[0], unchanged)
+
+    def test_cache_drops_replaced_trees(self):
+        cache = Parse_cache(os.path.join(self.path, 'cache'))
+        section = Section.from_dir(self.path, cache=cache)
+        tree = Chunk_tree.from_node(section, 'code', cache)
+        before = len(cache._nodes)
+        for idx in range(50):
+            self.write('lang/d.md', '# d\n## d{}\n```r\nx\n```\n'.format(idx))
+            edits = watcher.update_tree(
+                section, [os.path.join(self.path, 'lang/d.md')], cache)
+            tree.apply_edits(edits, 'code', cache)
+        # only the nodes of the current trees are kept
+        self.assertEqual(len(cache._nodes), before)
+        self.check_in_sync(section, tree)
+
+    def test_polling_watcher(self):
+        now = [0]
+        poller = watcher.Polling_watcher(self.path, interval=1,
+                                         clock=lambda: now[0])
+        self.write('lang/b.md', '# b but longer\n')
+        self.assertEqual(poller.poll(), [])
+        now[0] = 2
+        self.assertEqual(poller.poll(),
+                         [os.path.join(self.path, 'lang', 'b.md')])
+
+    def test_inotify_watcher(self):
+        try:
+            inotify = watcher.Inotify_watcher(self.path)
+        except OSError:
+            self.skipTest('inotify not available')
+        self.write('lang/b.md', '# b2\n')
+        os.makedirs(os.path.join(self.path, 'new'))
+        self.write('new/e.md', '# e\n')
+        changed = inotify.poll()
+        inotify.close()
+        self.assertIn(os.path.join(self.path, 'lang', 'b.md'), changed)
+        self.assertIn(os.path.join(self.path, 'new'), changed)